@@ -0,0 +1,153 @@
+"""
+FAISS index types for serving, chosen by corpus size.
+
+The index builder keeps an exact flat index of every chunk vector as the
+source of truth, because it needs exact vectors to add, delete and rebuild.
+The index that is served is built from it in one pass. Vectors are added
+in position order, so position i is still row i of `chunks.sqlite` whatever
+the type.
+
+Index types (POLIBOT_ANN_INDEX or `index_builder.py --index-type`):
+
+    flat        exact, 4 bytes/dim               (IndexFlatL2)
+    flat-fp16   exact scan, half the memory      (SQfp16)
+    hnsw        graph, ~log(n) search            (HNSW32)
+    hnsw-fp16   graph over fp16 vectors          (HNSW32_SQfp16)
+    ivf         inverted lists, probes a few     (IVF{nlist},Flat)
+    ivf-fp16    as ivf, fp16 vectors             (IVF{nlist},SQfp16)
+    ivf-pq      as ivf, 48-byte PQ codes/vector  (IVF{nlist},PQ48x8)
+    auto        flat below 20k chunks, hnsw below 200k, ivf-pq above
+
+Search-time knobs are applied whenever an index is opened:
+POLIBOT_NPROBE (IVF lists probed, default 16) and POLIBOT_EF_SEARCH (HNSW
+candidate list, default 64). Both trade recall for latency.
+"""
+import os
+import math
+import logging
+from typing import Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANN_INDEX = os.getenv("POLIBOT_ANN_INDEX", "auto")
+NPROBE = int(os.getenv("POLIBOT_NPROBE", "16"))
+EF_SEARCH = int(os.getenv("POLIBOT_EF_SEARCH", "64"))
+
+INDEX_TYPES = ("auto", "flat", "flat-fp16", "hnsw", "hnsw-fp16", "ivf", "ivf-fp16", "ivf-pq")
+AUTO_FLAT_MAX = 20_000
+AUTO_HNSW_MAX = 200_000
+# k-means wants ~39 training points per centroid; PQ8 needs 256 per sub-quantizer
+MIN_POINTS_PER_LIST = 39
+MIN_PQ_POINTS = 256 * MIN_POINTS_PER_LIST
+MAX_TRAINING_POINTS = 256 * 1024
+PQ_BYTES = 48
+
+
+def choose_index_type(n_vectors: int, requested: str = ANN_INDEX) -> str:
+    """Resolves "auto" by corpus size; other types are returned unchanged."""
+    if requested not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{requested}', expected one of {INDEX_TYPES}")
+    if requested != "auto":
+        return requested
+    if n_vectors <= AUTO_FLAT_MAX:
+        return "flat"
+    if n_vectors <= AUTO_HNSW_MAX:
+        return "hnsw"
+    return "ivf-pq"
+
+
+def factory_string(index_type: str, n_vectors: int, dim: int) -> str:
+    """
+    Returns the `faiss.index_factory` description for `index_type`.
+
+    IVF variants fall back to the flat equivalent when there are too few
+    vectors to train the coarse quantizer (or PQ codebooks).
+    """
+    if index_type.startswith("ivf"):
+        nlist = int(min(4 * math.sqrt(max(n_vectors, 1)), n_vectors // MIN_POINTS_PER_LIST))
+        too_small = nlist < 2 or (index_type == "ivf-pq" and (n_vectors < MIN_PQ_POINTS or dim % PQ_BYTES))
+        if too_small:
+            fallback = "flat-fp16" if index_type == "ivf-fp16" else "flat"
+            logger.warning("%d vectors are too few to train %s, using %s", n_vectors, index_type, fallback)
+            return factory_string(fallback, n_vectors, dim)
+        codec = {"ivf": "Flat", "ivf-fp16": "SQfp16", "ivf-pq": f"PQ{PQ_BYTES}x8"}[index_type]
+        return f"IVF{nlist},{codec}"
+    return {
+        "flat": "Flat",
+        "flat-fp16": "SQfp16",
+        "hnsw": "HNSW32",
+        "hnsw-fp16": "HNSW32_SQfp16",
+    }[index_type]
+
+
+def build_ann_index(vectors: np.ndarray, index_type: str) -> Tuple[faiss.Index, str]:
+    """
+    Builds (and trains, if needed) an index over `vectors` in position order.
+
+    Args:
+        vectors (np.ndarray): float32 array of shape (n, dim).
+        index_type (str): One of `INDEX_TYPES` ("auto" is resolved here).
+
+    Returns:
+        Tuple[faiss.Index, str]: The index and its factory string.
+    """
+    n, dim = vectors.shape
+    description = factory_string(choose_index_type(n, index_type), n, dim)
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = vectors
+        if n > MAX_TRAINING_POINTS:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, MAX_TRAINING_POINTS, replace=False)]
+        index.train(sample)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efConstruction = 80
+    index.add(vectors)
+    apply_search_params(index)
+    return index, description
+
+
+def apply_search_params(index: faiss.Index, nprobe: int = NPROBE, ef_search: int = EF_SEARCH) -> faiss.Index:
+    """Sets nprobe (IVF) / efSearch (HNSW) on `index`; no-op for other types."""
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+    return index
+
+
+def masked_search_params(index: faiss.Index, positions: np.ndarray) -> faiss.SearchParameters:
+    """
+    Search parameters that restrict `index` to `positions` (an ID-selector mask).
+
+    The index's own nprobe / efSearch are kept. HNSW recall drops when the
+    mask is very selective, so per-set sub-indexes are preferred (see
+    `chunk_store.write_partitions`).
+    """
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(positions, dtype=np.int64))
+    try:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    except RuntimeError:
+        pass
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def flat_vectors(index: faiss.Index) -> np.ndarray:
+    """All vectors of an exact flat index, in position order."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def describe_index(index: faiss.Index) -> str:
+    return type(faiss.downcast_index(index)).__name__
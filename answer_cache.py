@@ -0,0 +1,245 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+
+def corpus_fingerprint(paths: List[str]) -> tuple:
+    """
+    Builds a cheap fingerprint of the files an answer depends on.
+
+    Directories are walked recursively, so PDFs of a policy set in
+    `data/<set>/` count too. Only `stat()` data (size and modification
+    time) is used, so checking the fingerprint does not read the FAISS
+    index or the PDFs.
+
+    Args:
+        paths (List[str]): Files or directories, e.g. the index dir and `data/`.
+
+    Returns:
+        tuple: A hashable value that changes whenever any of the files change.
+    """
+    entries = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = []
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            files = [path]
+        for file_path in files:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            entries.append((file_path, st.st_size, st.st_mtime_ns))
+    return tuple(entries)
+
+
+def normalize_question(text: str) -> str:
+    """Lower-cases and collapses whitespace/trailing punctuation of a question."""
+    return " ".join(text.lower().split()).rstrip(" ?.!")
+
+
+class _CacheEntry:
+    __slots__ = ("vector", "answer", "source_documents", "created_at", "latency", "scope")
+
+    def __init__(self, vector, answer, source_documents, latency, scope=None):
+        self.vector = vector
+        self.answer = answer
+        self.source_documents = source_documents
+        self.created_at = time.monotonic()
+        self.latency = latency
+        self.scope = scope
+
+
+class SemanticAnswerCache:
+    """
+    Thread-safe answer cache keyed on the embedding of the standalone question.
+
+    A lookup first tries an exact match on the normalized question text and
+    then falls back to the most similar cached question (cosine similarity on
+    the embedding). Entries are evicted least-recently-used once `max_entries`
+    is reached and expire after `ttl_seconds`. The whole cache is dropped
+    whenever `fingerprint_fn` returns a new value, i.e. when the FAISS index
+    or a policy PDF changes. Answers are only shared within one `scope`
+    (e.g. the policy sets a user may search).
+
+    Args:
+        embeddings: Any LangChain `Embeddings` object (only `embed_query` is used).
+        threshold (float): Minimum cosine similarity for a semantic hit.
+        max_entries (int): LRU capacity.
+        ttl_seconds (float): Lifetime of an entry; `0` disables expiry.
+        fingerprint_fn (Callable): Returns the current corpus fingerprint.
+        fingerprint_interval (float): Seconds between fingerprint checks.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        threshold: float = 0.92,
+        max_entries: int = 512,
+        ttl_seconds: float = 24 * 3600,
+        fingerprint_fn: Optional[Callable[[], tuple]] = None,
+        fingerprint_interval: float = 5.0,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.fingerprint_fn = fingerprint_fn
+        self.fingerprint_interval = fingerprint_interval
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._fingerprint = fingerprint_fn() if fingerprint_fn else None
+        self._fingerprint_checked_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    # ---------- Public API ----------
+    def embed(self, question: str) -> np.ndarray:
+        """Embeds and L2-normalizes a question for lookup/insert."""
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question: str, vector: Optional[np.ndarray] = None, scope: Hashable = None) -> Optional[Dict]:
+        """
+        Returns the cached answer for `question`, or None on a miss.
+
+        Args:
+            question (str): The standalone question.
+            vector (np.ndarray, optional): Pre-computed normalized embedding.
+            scope (Hashable, optional): Only answers stored with the same scope match.
+
+        Returns:
+            Optional[Dict]: `{"result", "source_documents", "similarity"}` on a hit.
+        """
+        self._check_fingerprint()
+        key = self._key(question, scope)
+
+        with self._lock:
+            self._expire_locked()
+            entry = self._entries.get(key)
+            has_entries = bool(self._entries)
+
+        similarity = 1.0
+        if entry is None and has_entries and vector is None:
+            vector = self.embed(question)
+
+        with self._lock:
+            if entry is None and vector is not None:
+                key, entry, similarity = self._nearest_locked(vector, scope)
+            if entry is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry.latency
+
+        return {
+            "result": entry.answer,
+            "source_documents": list(entry.source_documents),
+            "similarity": similarity,
+        }
+
+    def put(
+        self,
+        question: str,
+        answer: str,
+        source_documents: List[Document],
+        latency: float = 0.0,
+        vector: Optional[np.ndarray] = None,
+        scope: Hashable = None,
+    ) -> None:
+        """
+        Stores an answer produced by the full retrieval + LLM path.
+
+        Args:
+            question (str): The standalone question.
+            answer (str): Final answer text.
+            source_documents (List[Document]): Documents the answer was built from.
+            latency (float): Seconds the uncached path took (used for savings stats).
+            vector (np.ndarray, optional): Pre-computed normalized embedding.
+            scope (Hashable, optional): Scope the answer is valid in.
+        """
+        if vector is None:
+            vector = self.embed(question)
+        key = self._key(question, scope)
+        entry = _CacheEntry(vector, answer, list(source_documents), latency, scope)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drops every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        """
+        Returns hit/miss counters and estimated savings.
+
+        `llm_calls_saved` counts answer calls only; each hit also skips the
+        FAISS search. `seconds_saved` sums the original latency of every
+        entry that was served from the cache.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "llm_calls_saved": self.hits,
+                "seconds_saved": round(self.saved_seconds, 3),
+                "invalidations": self.invalidations,
+            }
+
+    # ---------- Internals ----------
+    def _check_fingerprint(self) -> None:
+        if self.fingerprint_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._fingerprint_checked_at < self.fingerprint_interval:
+            return
+        self._fingerprint_checked_at = now
+        fingerprint = self.fingerprint_fn()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self.clear()
+
+    def _expire_locked(self) -> None:
+        if not self.ttl_seconds:
+            return
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry.created_at < deadline]
+        for key in expired:
+            del self._entries[key]
+
+    @staticmethod
+    def _key(question: str, scope: Hashable) -> str:
+        normalized = normalize_question(question)
+        return normalized if scope is None else f"{scope!r}\0{normalized}"
+
+    def _nearest_locked(self, vector: np.ndarray, scope: Hashable = None):
+        keys = [key for key, entry in self._entries.items() if entry.scope == scope]
+        if not keys:
+            return None, None, 0.0
+        matrix = np.stack([self._entries[key].vector for key in keys])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return keys[best], self._entries[keys[best]], float(scores[best])
@@ -0,0 +1,139 @@
+"""
+Thin client for `api_server.py`, usable as a drop-in for the local chain.
+
+`RemoteQAChain` exposes the two calls the Streamlit apps make on the chain
+(`invoke({"question": ...})` and `stream_answer(question)`), so an app can
+run against a shared API server instead of loading the engine itself.
+
+If the server has dropped the session (restart or idle expiry), it answers
+`404`. The client then logs a warning, starts a new session and sends the
+question again; `session_reset` tells the app the history was lost.
+"""
+import os
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+API_URL_ENV = "POLIBOT_API_URL"
+
+
+class RemoteStreamingAnswer:
+    """Iterates SSE tokens from `/v1/chat/stream`; `response` is set when done."""
+
+    def __init__(self, client: "RemoteQAChain", question: str):
+        self._client = client
+        self._question = question
+        self.response: Optional[Dict[str, Any]] = None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._client._post("/v1/chat/stream", self._question, stream=True) as resp:
+            event = None
+            for line in resp.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "token":
+                        yield data
+                    elif event == "session":
+                        self._client.session_id = data["session_id"]
+                    elif event == "done":
+                        self.response = self._client._to_chain_output(data)
+                    elif event == "error":
+                        raise RuntimeError(data.get("error", "stream failed"))
+
+    @property
+    def text(self) -> str:
+        return (self.response or {}).get("result", "")
+
+
+class RemoteQAChain:
+    """
+    Chat session backed by the HTTP API.
+
+    Args:
+        base_url (str): API root, e.g. "http://polibot-api:8080".
+        timeout (float): Request timeout in seconds.
+        policy_sets (List[str], optional): Policy sets the session may search
+            (the server default when None).
+    """
+
+    def __init__(self, base_url: str, timeout: float = 120.0, policy_sets: Optional[List[str]] = None):
+        import requests  # only thin-client deployments need it
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.http = requests.Session()  # keep-alive connection reuse
+        self.session_id: Optional[str] = None
+        self.session_reset = False  # True after the server dropped our session
+        self.policy_sets = policy_sets
+
+    def _turn_body(self, question: str) -> Dict[str, Any]:
+        body = {"question": question, "session_id": self.session_id}
+        if self.policy_sets is not None:
+            body["policy_sets"] = self.policy_sets
+        return body
+
+    def _post(self, path: str, question: str, stream: bool = False):
+        resp = self.http.post(
+            f"{self.base_url}{path}", json=self._turn_body(question), stream=stream, timeout=self.timeout
+        )
+        if resp.status_code == 404 and self.session_id is not None:
+            # The server no longer knows the session: start a new one
+            logger.warning("API session %s expired, starting a new session", self.session_id)
+            resp.close()
+            self.session_id = None
+            self.session_reset = True
+            resp = self.http.post(
+                f"{self.base_url}{path}", json=self._turn_body(question), stream=stream, timeout=self.timeout
+            )
+        resp.raise_for_status()
+        return resp
+
+    @staticmethod
+    def _to_chain_output(data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "result": data.get("answer", ""),
+            "sources": data.get("sources", []),
+            "cache_hit": data.get("cache_hit", False),
+            "fact_hit": data.get("fact_hit", False),
+            "condense_path": data.get("condense_path"),
+            "index_version": data.get("index_version"),
+        }
+
+    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        data = self._post("/v1/chat", inputs["question"]).json()
+        self.session_id = data["session_id"]
+        return self._to_chain_output(data)
+
+    def stream_answer(self, question: str) -> RemoteStreamingAnswer:
+        return RemoteStreamingAnswer(self, question)
+
+
+def get_chat_backend():
+    """
+    Returns the per-session chat backend for the Streamlit apps.
+
+    With `POLIBOT_API_URL` set, the app is a thin client of the API server.
+    Otherwise the engine is loaded in-process.
+    """
+    api_url = os.getenv(API_URL_ENV)
+    if api_url:
+        return RemoteQAChain(api_url)
+    from qa_chain import get_or_create_qa_chain
+    return get_or_create_qa_chain()
+
+
+def warm_up_backend() -> None:
+    """
+    Starts building the local engine in the background (no-op for a remote API).
+
+    Called once per process at app start, so the login screen renders
+    immediately while the models and index load.
+    """
+    if os.getenv(API_URL_ENV):
+        return
+    from qa_chain import start_background_warmup
+    start_background_warmup()
@@ -0,0 +1,402 @@
+"""
+Headless asyncio HTTP API around the QA engine.
+
+One process serves many concurrent chat sessions. The embeddings, index and
+LLM clients are the process-wide `QAEngine`, and each session only owns its
+conversation memory. Chain calls are blocking, so they run on a thread pool.
+A semaphore caps how many turns talk to the LLM at once, and once
+`max_pending` turns are waiting for a slot new requests get
+`503 + Retry-After` instead of queueing without bound.
+
+Endpoints:
+    POST   /v1/sessions              {"policy_sets"?} -> {"session_id"}
+    DELETE /v1/sessions/{session_id}
+    POST   /v1/chat                  {"question", "session_id"?, "policy_sets"?} -> answer JSON
+    POST   /v1/chat/stream           same body, answer as server-sent events
+    GET    /healthz                  liveness (the process is up)
+    GET    /readyz                   200 once the engine is built and warmed up (with the index version)
+    GET    /metrics                  Prometheus text format (see `telemetry`)
+
+Without `session_id`, a chat request starts a new session once it gets an
+LLM slot, and the response carries its id (a `503` creates none). An
+unknown or expired `session_id` gets `404`, so the client knows its
+history is gone and can start over. `policy_sets` (a list of `data/`
+subfolder names) limits a new session to those policy sets; it is ignored
+for an existing session.
+
+The stream sends `session`, then `token` events, then `done`. A turn that
+fails after the stream has started ends with an `error` event instead.
+
+Usage:
+    python api_server.py [--host 0.0.0.0] [--port 8080] [--max-concurrency 8]
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from qa_chain import get_or_create_qa_chain, get_shared_engine, is_ready
+from telemetry import METRICS
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = float(os.getenv("POLIBOT_SESSION_TTL", str(2 * 3600)))
+MAX_SESSIONS = int(os.getenv("POLIBOT_MAX_SESSIONS", "5000"))
+
+
+def serialize_sources(docs) -> List[Dict[str, Any]]:
+    """Turns source Documents into small JSON objects for API responses."""
+    return [
+        {
+            "source": os.path.basename(str(doc.metadata.get("source", ""))),
+            "page": doc.metadata.get("page"),
+            "snippet": doc.page_content[:200],
+        }
+        for doc in docs or []
+    ]
+
+
+def serialize_response(session_id: str, response: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "session_id": session_id,
+        "answer": response.get("result", ""),
+        "sources": serialize_sources(response.get("source_documents")),
+        "cache_hit": response.get("cache_hit", False),
+        "fact_hit": response.get("fact_hit", False),
+        "condense_path": response.get("condense_path"),
+        "index_version": response.get("index_version"),
+        "trace": response.get("trace"),
+    }
+
+
+class _Session:
+    __slots__ = ("chain", "lock", "last_used")
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.lock = asyncio.Lock()  # turns of one session run one at a time
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """
+    Per-session chains (memory) with idle expiry and a size cap.
+
+    Args:
+        ttl (float): Idle seconds after which a session is dropped.
+        max_sessions (int): Oldest-idle sessions are dropped beyond this.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, _Session] = {}
+
+    def create(self, policy_sets: Optional[List[str]] = None) -> str:
+        self._evict()
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = _Session(get_or_create_qa_chain(policy_sets))
+        return session_id
+
+    def get(self, session_id: Optional[str]) -> Optional[_Session]:
+        session = self._sessions.get(session_id) if session_id else None
+        if session is not None:
+            session.last_used = time.monotonic()
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_used > self.ttl]:
+            del self._sessions[session_id]
+        while len(self._sessions) >= self.max_sessions:
+            oldest = min(self._sessions, key=lambda sid: self._sessions[sid].last_used)
+            del self._sessions[oldest]
+
+
+class Backpressure(Exception):
+    """Raised when too many turns are already waiting for an LLM slot."""
+
+
+class LLMSlots:
+    """
+    Concurrency limit for outbound LLM turns with bounded waiting.
+
+    Args:
+        max_concurrency (int): Turns allowed to run at once.
+        max_pending (int): Turns allowed to wait for a slot.
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.pending = 0
+        self.active = 0
+
+    async def __aenter__(self):
+        if self.pending >= self.max_pending:
+            raise Backpressure()
+        self.pending += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.pending -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.active -= 1
+        self._semaphore.release()
+
+
+async def _iterate_in_thread(iterable, executor) -> Any:
+    """Consumes a blocking iterator on `executor`, yielding items to asyncio."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def pump():
+        try:
+            for item in iterable:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except BaseException as exc:
+            loop.call_soon_threadsafe(queue.put_nowait, exc)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    loop.run_in_executor(executor, pump)
+    while True:
+        item = await queue.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+# ---------- Handlers ----------
+def _overloaded() -> web.Response:
+    METRICS.inc("polibot_api_rejected_total")
+    return web.json_response({"error": "server busy, retry later"}, status=503, headers={"Retry-After": "2"})
+
+
+def _not_ready() -> web.Response:
+    return web.json_response({"error": "warming up, retry later"}, status=503, headers={"Retry-After": "5"})
+
+
+def _read_policy_sets(body: Dict) -> Optional[List[str]]:
+    policy_sets = body.get("policy_sets")
+    if policy_sets is None:
+        return None
+    if not isinstance(policy_sets, list) or not all(isinstance(name, str) and name for name in policy_sets):
+        raise web.HTTPBadRequest(text="'policy_sets' must be a list of policy set names")
+    return policy_sets
+
+
+async def _read_body(request: web.Request) -> Dict:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="invalid JSON body")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="JSON body must be an object")
+    return body
+
+
+async def _read_turn(request: web.Request):
+    body = await _read_body(request)
+    question = str(body.get("question", "")).strip()
+    if not question:
+        raise web.HTTPBadRequest(text="'question' is required")
+
+    session_id = body.get("session_id")
+    if session_id is None:
+        # Created once the turn has an LLM slot, so a 503 leaves no orphan session behind
+        return question, None, _read_policy_sets(body)
+    if request.app["sessions"].get(session_id) is None:
+        raise web.HTTPNotFound(text="unknown or expired session_id; omit it to start a new session")
+    return question, session_id, None
+
+
+@contextlib.asynccontextmanager
+async def _turn(request: web.Request, session_id: Optional[str], policy_sets: Optional[List[str]]):
+    """Holds the session's lock and an LLM slot; yields `(session_id, session)`."""
+    sessions: SessionManager = request.app["sessions"]
+    slots: LLMSlots = request.app["llm_slots"]
+    if session_id is None:
+        async with slots:
+            session_id = sessions.create(policy_sets)
+            session = sessions.get(session_id)
+            async with session.lock:
+                yield session_id, session
+        return
+    session = sessions.get(session_id)
+    if session is None:  # expired while the request was read
+        raise web.HTTPNotFound(text="unknown or expired session_id; omit it to start a new session")
+    # Wait for the session's previous turn before taking a slot
+    async with session.lock, slots:
+        yield session_id, session
+
+
+async def create_session(request: web.Request) -> web.Response:
+    if not is_ready():
+        return _not_ready()
+    body = await _read_body(request) if request.can_read_body else {}
+    policy_sets = _read_policy_sets(body)
+    return web.json_response({"session_id": request.app["sessions"].create(policy_sets)}, status=201)
+
+
+async def delete_session(request: web.Request) -> web.Response:
+    if not request.app["sessions"].delete(request.match_info["session_id"]):
+        raise web.HTTPNotFound()
+    return web.Response(status=204)
+
+
+async def chat(request: web.Request) -> web.Response:
+    if not is_ready():
+        return _not_ready()
+    question, session_id, policy_sets = await _read_turn(request)
+    loop = asyncio.get_running_loop()
+    try:
+        async with _turn(request, session_id, policy_sets) as (session_id, session):
+            response = await loop.run_in_executor(
+                request.app["executor"], session.chain.invoke, {"question": question}
+            )
+    except Backpressure:
+        return _overloaded()
+    return web.json_response(serialize_response(session_id, response))
+
+
+async def chat_stream(request: web.Request) -> web.StreamResponse:
+    if not is_ready():
+        return _not_ready()
+    question, session_id, policy_sets = await _read_turn(request)
+    slots: LLMSlots = request.app["llm_slots"]
+    if slots.pending >= slots.max_pending:
+        return _overloaded()
+
+    stream = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await stream.prepare(request)
+
+    async def send(event: str, data: Any) -> None:
+        await stream.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    try:
+        async with _turn(request, session_id, policy_sets) as (session_id, session):
+            await send("session", {"session_id": session_id})
+            answer = session.chain.stream_answer(question)
+            async for token in _iterate_in_thread(answer, request.app["executor"]):
+                await send("token", token)
+        await send("done", serialize_response(session_id, answer.response or {}))
+    except Backpressure:
+        METRICS.inc("polibot_api_rejected_total")
+        await send("error", {"error": "server busy, retry later"})
+    except web.HTTPNotFound as exc:
+        await send("error", {"error": exc.text})
+    except ConnectionResetError:
+        pass  # client went away
+    except Exception:
+        # The status line is already sent; report the failure in the stream
+        logger.exception("streamed turn failed")
+        METRICS.inc("polibot_api_errors_total")
+        try:
+            await send("error", {"error": "the answer could not be generated"})
+        except ConnectionResetError:
+            pass
+    await stream.write_eof()
+    return stream
+
+
+async def healthz(request: web.Request) -> web.Response:
+    slots: LLMSlots = request.app["llm_slots"]
+    return web.json_response({
+        "status": "ok",
+        "sessions": len(request.app["sessions"]),
+        "llm_active": slots.active,
+        "llm_pending": slots.pending,
+    })
+
+
+async def readyz(request: web.Request) -> web.Response:
+    if not is_ready():
+        return web.json_response({"status": "warming_up"}, status=503)
+    engine = get_shared_engine()
+    return web.json_response({"status": "ready", "startup": engine.startup, "index_version": engine.retriever.version})
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(text=METRICS.render_prometheus(), content_type="text/plain", headers={"X-Metrics-Format": "0.0.4"})
+
+
+def _log_warmup_failure(future: "asyncio.Future") -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("engine warm-up failed", exc_info=future.exception())
+
+
+def create_app(max_concurrency: int = 8, max_pending: int = 64) -> web.Application:
+    """
+    Builds the aiohttp application.
+
+    Args:
+        max_concurrency (int): Concurrent turns allowed to call the LLM.
+        max_pending (int): Turns allowed to wait for a slot before 503s.
+
+    Returns:
+        web.Application: Ready to pass to `web.run_app`.
+    """
+    app = web.Application()
+    # Streaming turns hold a worker for the pump thread plus the chain thread
+    app["executor"] = ThreadPoolExecutor(max_workers=2 * max_concurrency + 2, thread_name_prefix="qa")
+    app["llm_slots"] = LLMSlots(max_concurrency, max_pending)
+    app["sessions"] = SessionManager()
+
+    async def on_startup(app):
+        # Build and warm the shared engine in the background; /readyz flips once it is done
+        warmup = asyncio.get_running_loop().run_in_executor(app["executor"], get_shared_engine)
+        warmup.add_done_callback(_log_warmup_failure)
+        app["warmup"] = warmup
+
+    async def on_cleanup(app):
+        app["executor"].shutdown(wait=False)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/v1/sessions", create_session)
+    app.router.add_delete("/v1/sessions/{session_id}", delete_session)
+    app.router.add_post("/v1/chat", chat)
+    app.router.add_post("/v1/chat/stream", chat_stream)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="PSSPL Polibot HTTP API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrency", type=int, default=int(os.getenv("POLIBOT_MAX_CONCURRENCY", "8")))
+    parser.add_argument("--max-pending", type=int, default=int(os.getenv("POLIBOT_MAX_PENDING", "64")))
+    args = parser.parse_args()
+    web.run_app(create_app(args.max_concurrency, args.max_pending), host=args.host, port=args.port)
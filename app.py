@@ -3,33 +3,65 @@ Main Streamlit app to run PSSPL Polibot with login and Firebase logging
 """
 import os
 import json
-import requests
 from datetime import datetime
 
 import streamlit as st
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
 
-from qa_chain import get_or_create_qa_chain
+from chat_log_sink import create_sink
+from api_client import get_chat_backend, warm_up_backend
+from telemetry import stage, start_metrics_server, write_metrics_file
 
 # ---------- Load Environment ----------
 load_dotenv()
+STREAM_ANSWERS = os.getenv("POLIBOT_STREAMING", "1") == "1"
 
-# ---------- Firebase Initialization ----------
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.getenv("FIREBASE_CREDENTIAL_JSON")))
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
-
-# ---------- Helper: Save Chat to Firebase ----------
-def save_chat_to_firestore(user_id, session_id, messages):
-    db.collection("chat_logs").document(f"{user_id}_{session_id}").set({
-        "user_id": user_id,
-        "session_id": session_id,
-        "messages": messages,
-        "timestamp": firestore.SERVER_TIMESTAMP
-    })
+# ---------- Startup ----------
+@st.cache_resource
+def start_backend():
+    # Once per process: load the models and index in the background
+    warm_up_backend()
+    return True
+
+
+start_backend()
+
+# ---------- Firebase Initialization (lazy, only for the Firestore sink) ----------
+@st.cache_resource
+def get_firestore_db():
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(json.loads(os.getenv("FIREBASE_CREDENTIAL_JSON")))
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+# ---------- Helper: Save Chat Log ----------
+@st.cache_resource
+def get_chat_sink():
+    # One sink per process, shared by all sessions (POLIBOT_LOG_SINK=firestore|jsonl)
+    kind = os.getenv("POLIBOT_LOG_SINK", "firestore")
+    return create_sink(kind, get_firestore_db() if kind == "firestore" else None)
+
+
+def save_chat_log(user_id, session_id, messages):
+    # Only the messages added since the last save are queued
+    start = st.session_state.get("saved_message_count", 0)
+    with stage("log_write"):
+        get_chat_sink().append(user_id, session_id, messages[start:], start_index=start)
+    st.session_state.saved_message_count = len(messages)
+
+
+# ---------- Helper: Metrics ----------
+@st.cache_resource
+def start_metrics():
+    # Prometheus /metrics for this process when POLIBOT_METRICS_PORT is set
+    port = os.getenv("POLIBOT_METRICS_PORT")
+    return start_metrics_server(int(port)) if port else None
+
+
+start_metrics()
 
 # ---------- Helper: Login Authentication ----------
 # def check_login():
@@ -141,7 +173,8 @@ st.markdown("""
 
 # ---------- Session Initialization ----------
 if "qa_chain" not in st.session_state:
-    st.session_state.qa_chain = get_or_create_qa_chain()
+    with st.spinner("Loading HR policies..."):
+        st.session_state.qa_chain = get_chat_backend()
 
 if "session_id" not in st.session_state:
     st.session_state.session_id = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -163,16 +196,27 @@ if user_input:
         st.markdown(user_input)
     st.session_state.messages.append({"role": "user", "content": user_input})
 
-    with st.spinner("Thinking..."):
-        response = st.session_state.qa_chain.invoke({"question": user_input})
-        answer = response["result"]
-
-    with st.chat_message("assistant", avatar="🤖"):
-        st.markdown(answer)
-    st.session_state.messages.append({"role": "assistant", "content": answer})
+    if STREAM_ANSWERS:
+        # Render tokens as the model produces them
+        with st.chat_message("assistant", avatar="🤖"):
+            stream = st.session_state.qa_chain.stream_answer(user_input)
+            st.write_stream(stream)
+        response = stream.response
+        answer = stream.text
+    else:
+        with st.spinner("Thinking..."):
+            response = st.session_state.qa_chain.invoke({"question": user_input})
+            answer = response["result"]
+
+        with st.chat_message("assistant", avatar="🤖"):
+            st.markdown(answer)
+    st.session_state.messages.append(
+        {"role": "assistant", "content": answer, "index_version": (response or {}).get("index_version")}
+    )
 
-    save_chat_to_firestore(
+    save_chat_log(
         st.session_state.user_id,
         st.session_state.session_id,
         st.session_state.messages
     )
+    write_metrics_file()
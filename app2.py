@@ -1,13 +1,13 @@
 """
 This is the main app/streamlit file to run
 """
-import os
-import json
 from datetime import datetime
 
 import streamlit as st
 from dotenv import load_dotenv
-from qa_chain import get_or_create_qa_chain
+from chat_log_sink import create_sink
+from api_client import get_chat_backend
+from telemetry import stage, write_metrics_file
 
 # ---------- Load Environment ----------
 load_dotenv()
@@ -90,14 +90,20 @@ st.markdown("""
 
 
 
+# ---------- Chat Log Sink (shared by all sessions in this process) ----------
+@st.cache_resource
+def get_chat_sink():
+    return create_sink("jsonl")
+
+
 # ---------- Session State Initialization ----------
 if "qa_chain" not in st.session_state:
-    st.session_state.qa_chain = get_or_create_qa_chain()
+    st.session_state.qa_chain = get_chat_backend()
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
     st.session_state.session_id = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    os.makedirs("chat_logs", exist_ok=True)
+    st.session_state.saved_message_count = 0
 
 # ---------- Display Chat History ----------
 for msg in st.session_state.messages:
@@ -116,7 +122,7 @@ if user_input:
 
     # Get bot response
     with st.spinner("Thinking..."):
-        response = st.session_state.qa_chain.invoke({"query": user_input})
+        response = st.session_state.qa_chain.invoke({"question": user_input})
         answer = response["result"]
 
     # Display assistant message
@@ -124,6 +130,11 @@ if user_input:
         st.markdown(answer)
     st.session_state.messages.append({"role": "assistant", "content": answer})
 
-    # Save chat to local JSON
-    with open(f"chat_logs/{st.session_state.session_id}.json", "w", encoding="utf-8") as f:
-        json.dump(st.session_state.messages, f, ensure_ascii=False, indent=2)
+    # Append the new messages of this turn to the local JSONL log
+    start = st.session_state.saved_message_count
+    with stage("log_write"):
+        get_chat_sink().append(
+            None, st.session_state.session_id, st.session_state.messages[start:], start_index=start
+        )
+    st.session_state.saved_message_count = len(st.session_state.messages)
+    write_metrics_file()
@@ -0,0 +1,198 @@
+"""
+Compares the embedding backends (torch, onnx, onnx-int8) on this host.
+
+Each backend runs in its own subprocess so that memory is measured cleanly.
+Reported per backend:
+
+- model load time and RSS after load / peak RSS
+- single-query latency (p50/p95/p99), i.e. the per-request cost
+- batch throughput on chunk texts (`embed_documents`)
+- agreement with torch: cosine similarity of the query vectors (checked
+  against `AGREEMENT_TOLERANCE`) and top-k overlap of FAISS results on the
+  existing index
+
+Usage:
+    python bench_embeddings.py [--backends torch,onnx,onnx-int8] [--k 6] [--output embeddings_bench.json]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import subprocess
+from typing import Dict, List
+
+import numpy as np
+
+from chat_log_sink import LOG_DIR
+
+FALLBACK_QUESTIONS = [
+    "How many casual leaves do employees get?",
+    "What is the sandwich rule?",
+    "What are the working hours?",
+    "Can I carry forward unused leaves?",
+    "What is the dress code?",
+]
+
+
+def rss_mb() -> Dict[str, float]:
+    """Current and peak resident set size of this process, in MB."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {
+            "rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1),
+            "peak_rss_mb": round(int(fields["VmHWM"].split()[0]) / 1024, 1),
+        }
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+        return {"rss_mb": None, "peak_rss_mb": round(peak, 1)}
+
+
+def run_worker(backend: str, questions: List[str], passages: List[str], vectors_path: str, repeats: int) -> Dict:
+    """Measures one backend in this process and saves its query vectors."""
+    from benchmark import percentiles
+    from qa_chain import load_embeddings
+
+    baseline = rss_mb()
+    started = time.perf_counter()
+    embeddings = load_embeddings(backend=backend)
+    embeddings.embed_query("warm up")  # first pass initializes kernels/threads
+    load_s = time.perf_counter() - started
+    after_load = rss_mb()
+
+    latencies, vectors = [], []
+    for _ in range(repeats):
+        for question in questions:
+            started = time.perf_counter()
+            vector = embeddings.embed_query(question)
+            latencies.append(time.perf_counter() - started)
+            if len(vectors) < len(questions):
+                vectors.append(vector)
+    np.save(vectors_path, np.asarray(vectors, dtype=np.float32))
+
+    started = time.perf_counter()
+    embeddings.embed_documents(passages)
+    batch_s = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "rss_before_mb": baseline["rss_mb"],
+        "rss_after_load_mb": after_load["rss_mb"],
+        "query_latency": percentiles(latencies),
+        "batch_passages_per_s": round(len(passages) / batch_s, 1) if batch_s > 0 else None,
+        "peak_rss_mb": rss_mb()["peak_rss_mb"],
+    }
+
+
+def load_inputs(log_dir: str, index_dir: str, n_passages: int):
+    from benchmark import load_sessions
+    from chunk_store import CHUNK_STORE_NAME, ChunkStore
+    from index_versions import resolve_index_dir
+
+    questions = [q for session in load_sessions(log_dir) for q in session] or FALLBACK_QUESTIONS
+    passages: List[str] = []
+    store_path = os.path.join(resolve_index_dir(index_dir)[1], CHUNK_STORE_NAME)
+    if os.path.exists(store_path):
+        store = ChunkStore(store_path)
+        for _, text in store.iter_texts():
+            passages.append(text)
+            if len(passages) >= n_passages:
+                break
+        store.close()
+    return questions, passages or questions
+
+
+def agreement(reference: np.ndarray, candidate: np.ndarray, index, k: int) -> Dict:
+    """Cosine similarity of paired vectors and top-k overlap of their FAISS results."""
+    cosine = np.sum(reference * candidate, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+    result = {
+        "cosine_min": round(float(cosine.min()), 5),
+        "cosine_mean": round(float(cosine.mean()), 5),
+    }
+    if index is not None:
+        _, ref_hits = index.search(reference, k)
+        _, cand_hits = index.search(candidate, k)
+        overlaps = [len(set(a) & set(b)) / k for a, b in zip(ref_hits.tolist(), cand_hits.tolist())]
+        result[f"overlap@{k}"] = round(float(np.mean(overlaps)), 4)
+        result["top1_agreement"] = round(float(np.mean(ref_hits[:, 0] == cand_hits[:, 0])), 4)
+    return result
+
+
+def main() -> Dict:
+    from onnx_embeddings import AGREEMENT_TOLERANCE, BACKENDS
+    from qa_chain import INDEX_DIR
+
+    parser = argparse.ArgumentParser(description="Compare embedding backends: latency, RSS, agreement")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--log-dir", default=LOG_DIR)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--passages", type=int, default=256, help="Chunk texts for the batch test")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--output", default="embeddings_bench.json")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--inputs", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.inputs, "r", encoding="utf-8") as f:
+            inputs = json.load(f)
+        print(json.dumps(run_worker(args.worker, inputs["questions"], inputs["passages"], args.vectors, args.repeats)))
+        return {}
+
+    questions, passages = load_inputs(args.log_dir, args.index_dir, args.passages)
+    backends = [b for b in args.backends.split(",") if b]
+    workdir = tempfile.mkdtemp(prefix="polibot-emb-")
+    inputs_path = os.path.join(workdir, "inputs.json")
+    with open(inputs_path, "w", encoding="utf-8") as f:
+        json.dump({"questions": questions, "passages": passages}, f)
+
+    results, vectors = {}, {}
+    for backend in backends:
+        vectors_path = os.path.join(workdir, f"{backend}.npy")
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", backend, "--inputs", inputs_path,
+             "--vectors", vectors_path, "--repeats", str(args.repeats)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            results[backend] = {"backend": backend, "error": proc.stderr.strip().splitlines()[-1:]}
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+        vectors[backend] = np.load(vectors_path)
+
+    index = None
+    try:
+        from chunk_store import read_faiss_index
+        from index_versions import resolve_index_dir
+        index = read_faiss_index(resolve_index_dir(args.index_dir)[1])
+    except Exception:  # no index yet: report cosine agreement only
+        pass
+
+    if "torch" in vectors:
+        for backend, candidate in vectors.items():
+            if backend == "torch":
+                continue
+            stats = agreement(vectors["torch"], candidate, index, args.k)
+            tolerance = AGREEMENT_TOLERANCE.get(backend)
+            stats["tolerance"] = tolerance
+            stats["within_tolerance"] = tolerance is None or stats["cosine_min"] >= tolerance
+            results[backend]["agreement_vs_torch"] = stats
+
+    report = {"questions": len(questions), "passages": len(passages), "results": list(results.values())}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for row in report["results"]:
+        print(json.dumps(row))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Offline benchmark and load test.
+
+Replays the user questions found in `chat_logs/` through
+`get_or_create_qa_chain`. The Groq models are replaced by `MockChatModel`,
+so the run needs no network and its LLM latency is fixed. Reports:
+
+- cold start (embeddings load, index update, engine build)
+- query embedding time and retrieval latency (p50/p95/p99)
+- prompt tokens sent to the answer and condense models
+- end-to-end turn latency, time to first token and throughput at each
+  concurrency level (one chat session per replayed log session)
+- per-stage latency histograms from `telemetry` for the load phase,
+  including LLM queue wait vs model time and coalesced calls
+- per-model first-token latency and circuit-breaker state; with
+  `--slow-every N` every n-th answer call is slow, to measure hedging
+
+Results are written as JSON, tagged with the git commit, so runs can be
+compared across commits (`--baseline old.json` prints the deltas).
+
+Usage:
+    python benchmark.py [--concurrency 1,4,16] [--latency 0.3] [--tokens-per-sec 200] [--llm-tpm 12000]
+                        [--slow-every 10 --slow-latency 5 --hedge-after 1]
+                        [--output benchmark.json] [--baseline previous.json]
+
+`--fake-embeddings` also swaps MiniLM for random-but-deterministic vectors
+and builds a throwaway index, for machines without the model weights.
+Retrieval quality is meaningless in that mode; only timings are useful.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import qa_chain
+from chat_log_sink import LOG_DIR, iter_chat_sessions
+from hedging import health_stats
+from llm_dispatch import scheduler_stats, set_rate_limit
+from mock_llm import MockChatModel
+from telemetry import METRICS
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    """Summarizes latencies (seconds) as count/mean/p50/p95/p99/max in milliseconds."""
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values, dtype=float) * 1000.0
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 2),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+        "max_ms": round(float(arr.max()), 2),
+    }
+
+
+def token_summary(counts: List[int]) -> Dict[str, Any]:
+    if not counts:
+        return {"count": 0}
+    arr = np.asarray(counts)
+    return {
+        "count": int(arr.size),
+        "mean": round(float(arr.mean()), 1),
+        "p50": int(np.percentile(arr, 50)),
+        "p95": int(np.percentile(arr, 95)),
+        "max": int(arr.max()),
+        "total": int(arr.sum()),
+    }
+
+
+def load_sessions(log_dir: str, limit: Optional[int] = None) -> List[List[str]]:
+    """Returns the user questions of each logged session, in turn order."""
+    sessions = []
+    for session in iter_chat_sessions(log_dir):
+        questions = [
+            m["content"].strip() for m in session["messages"]
+            if m.get("role") == "user" and str(m.get("content", "")).strip()
+        ]
+        if questions:
+            sessions.append(questions)
+    return sessions[:limit] if limit else sessions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------- Phases ----------
+def measure_cold_start(args, llm: MockChatModel, condense_llm: MockChatModel, fallback_llm: MockChatModel):
+    started = time.perf_counter()
+    if args.fake_embeddings:
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=384)
+    else:
+        embeddings = qa_chain.load_embeddings()
+    embeddings_s = time.perf_counter() - started
+
+    engine = qa_chain.QAEngine(
+        index_dir=args.index_dir, data_dir=args.data_dir,
+        embeddings=embeddings, llm=llm, condense_llm=condense_llm,
+        fallback_llm=fallback_llm, hedge_after=args.hedge_after,
+    )
+    engine.warm_up()
+    total_s = time.perf_counter() - started
+    report = {
+        "embeddings_load_s": round(embeddings_s, 3),
+        "engine_build_s": round(total_s - embeddings_s, 3),
+        "total_s": round(total_s, 3),
+        "breakdown": engine.startup,
+        "index_update": engine.index_report,
+    }
+    return engine, report
+
+
+def measure_retrieval(engine, questions: List[str]) -> Dict[str, Any]:
+    embed_times, retrieve_times, doc_counts = [], [], []
+    encoder = getattr(engine.embeddings, "base", engine.embeddings)  # bypass the query-embedding cache
+    for question in questions:
+        started = time.perf_counter()
+        encoder.embed_query(question)
+        embed_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        docs = engine.retriever.invoke(question)
+        retrieve_times.append(time.perf_counter() - started)
+        doc_counts.append(len(docs))
+    return {
+        "embedding": percentiles(embed_times),
+        "retrieval": percentiles(retrieve_times),
+        "docs_per_query": token_summary(doc_counts),
+        "query_embedding_cache": engine.embeddings.stats() if hasattr(engine.embeddings, "stats") else None,
+    }
+
+
+def run_load(sessions: List[List[str]], concurrency: int, streaming: bool) -> Dict[str, Any]:
+    """Replays every session with `concurrency` sessions in flight at once."""
+    pending: "queue.Queue" = queue.Queue()
+    for questions in sessions:
+        pending.put(questions)
+
+    lock = threading.Lock()
+    latencies, first_tokens, errors = [], [], []
+    cache_hits = fact_hits = 0
+    condense_paths: Dict[str, int] = {}
+
+    def worker():
+        nonlocal cache_hits, fact_hits
+        while True:
+            try:
+                questions = pending.get_nowait()
+            except queue.Empty:
+                return
+            chain = qa_chain.get_or_create_qa_chain()
+            for question in questions:
+                started = time.perf_counter()
+                first = None
+                try:
+                    if streaming:
+                        answer = chain.stream_answer(question)
+                        for _ in answer:
+                            if first is None:
+                                first = time.perf_counter() - started
+                        response = answer.response or {}
+                    else:
+                        response = chain.invoke({"question": question})
+                except Exception as exc:
+                    with lock:
+                        errors.append(repr(exc))
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if first is not None:
+                        first_tokens.append(first)
+                    cache_hits += bool(response.get("cache_hit"))
+                    fact_hits += bool(response.get("fact_hit"))
+                    path = response.get("condense_path") or "unknown"
+                    condense_paths[path] = condense_paths.get(path, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f"bench-{i}") for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "turns": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_s": round(wall, 3),
+        "throughput_turns_per_s": round(len(latencies) / wall, 3) if wall > 0 else None,
+        "latency": percentiles(latencies),
+        "first_token": percentiles(first_tokens),
+        "cache_hits": cache_hits,
+        "fact_hits": fact_hits,
+        "fact_hit_rate": round(fact_hits / len(latencies), 3) if latencies else None,
+        "condense_paths": condense_paths,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Human-readable deltas of the headline metrics against a previous run."""
+    def pick(data, *path):
+        for key in path:
+            if isinstance(data, list):
+                data = next((item for item in data if item.get("concurrency") == key), None)
+            elif isinstance(data, dict):
+                data = data.get(key)
+            if data is None:
+                return None
+        return data
+
+    metrics = [("cold_start", "total_s"), ("retrieval", "retrieval", "p95_ms"), ("retrieval", "embedding", "p95_ms"),
+               ("prompt_tokens", "answer", "mean")]
+    for level in result["load"]:
+        metrics.append(("load", level["concurrency"], "latency", "p95_ms"))
+        metrics.append(("load", level["concurrency"], "throughput_turns_per_s"))
+
+    lines = []
+    for path in metrics:
+        new, old = pick(result, *path), pick(baseline, *path)
+        if isinstance(new, (int, float)) and isinstance(old, (int, float)) and old:
+            lines.append(f"{'.'.join(map(str, path))}: {old} -> {new} ({(new - old) / old:+.1%})")
+    return lines
+
+
+def main(argv=None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Offline PSSPL Polibot benchmark with a mock LLM")
+    parser.add_argument("--log-dir", default=LOG_DIR)
+    parser.add_argument("--data-dir", default=qa_chain.DATA_DIR)
+    parser.add_argument("--index-dir", default=None, help="Defaults to faiss_index (a temp dir with --fake-embeddings)")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated session counts")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the logged sessions this many times")
+    parser.add_argument("--max-sessions", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock first-token latency (s)")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="Mock token rate")
+    parser.add_argument("--answer-tokens", type=int, default=80)
+    parser.add_argument("--no-streaming", action="store_true", help="Use invoke() instead of stream_answer()")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache enabled")
+    parser.add_argument("--slow-every", type=int, default=0, help="Every n-th answer call is slow (0 = never)")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="First-token latency of a slow call (s)")
+    parser.add_argument("--hedge-after", type=float, default=qa_chain.HEDGE_AFTER,
+                        help="Race the fallback model after this many seconds (0 = no hedging)")
+    parser.add_argument("--llm-tpm", type=int, default=0, help="Simulated Groq tokens/minute per model (0 = unlimited)")
+    parser.add_argument("--fake-embeddings", action="store_true")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None, help="Previous JSON result to compare against")
+    args = parser.parse_args(argv)
+
+    sessions = load_sessions(args.log_dir, args.max_sessions)
+    if not sessions:
+        sys.exit(f"No user questions found in {args.log_dir}")
+    sessions = sessions * max(1, args.repeat)
+    questions = [q for session in sessions for q in session]
+
+    temp_index = None
+    if args.index_dir is None:
+        if args.fake_embeddings:
+            # Never overwrite the real MiniLM index with fake vectors
+            temp_index = args.index_dir = tempfile.mkdtemp(prefix="polibot-bench-")
+        else:
+            args.index_dir = qa_chain.INDEX_DIR
+
+    llm = MockChatModel(
+        model_name=qa_chain.LLM_MODEL, first_token_latency=args.latency,
+        tokens_per_second=args.tokens_per_sec, answer_tokens=args.answer_tokens,
+        slow_every=args.slow_every, slow_latency=args.slow_latency,
+    )
+    fallback_llm = MockChatModel(
+        model_name=qa_chain.FALLBACK_MODEL or "fallback", first_token_latency=args.latency,
+        tokens_per_second=args.tokens_per_sec, answer_tokens=args.answer_tokens,
+    )
+    condense_llm = MockChatModel(
+        model_name=qa_chain.CONDENSE_MODEL, first_token_latency=args.latency / 3,
+        tokens_per_second=args.tokens_per_sec * 3, answer_tokens=args.answer_tokens // 2,
+    )
+
+    for model in (qa_chain.LLM_MODEL, qa_chain.CONDENSE_MODEL, fallback_llm.model_name):
+        set_rate_limit(model, args.llm_tpm)
+
+    try:
+        engine, cold_start = measure_cold_start(args, llm, condense_llm, fallback_llm)
+        if not args.answer_cache:
+            engine.answer_cache = None  # replayed questions would otherwise be cache hits
+        qa_chain.set_shared_engine(engine)
+
+        retrieval = measure_retrieval(engine, questions)
+        llm.reset_calls()
+        condense_llm.reset_calls()
+        fallback_llm.reset_calls()
+        METRICS.reset()  # stage histograms below cover the load phase only
+
+        load = []
+        for level in [int(n) for n in args.concurrency.split(",") if n.strip()]:
+            if engine.answer_cache is not None:
+                engine.answer_cache.clear()
+            load.append(run_load(sessions, level, streaming=not args.no_streaming))
+            print(f"concurrency={level}: {load[-1]['throughput_turns_per_s']} turns/s, "
+                  f"p95={load[-1]['latency'].get('p95_ms')} ms", file=sys.stderr)
+    finally:
+        qa_chain.set_shared_engine(None)
+        if temp_index:
+            shutil.rmtree(temp_index, ignore_errors=True)
+
+    answer_calls, condense_calls = llm.calls, condense_llm.calls
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sessions": len(sessions),
+            "questions": len(questions),
+            "config": {
+                "mock_latency_s": args.latency,
+                "mock_tokens_per_sec": args.tokens_per_sec,
+                "answer_tokens": args.answer_tokens,
+                "streaming": not args.no_streaming,
+                "answer_cache": args.answer_cache,
+                "facts": engine.fact_table is not None,
+                "llm_tpm": args.llm_tpm,
+                "slow_every": args.slow_every,
+                "slow_latency_s": args.slow_latency,
+                "hedge_after_s": args.hedge_after,
+                "fake_embeddings": args.fake_embeddings,
+                "hybrid": qa_chain.HYBRID_ENABLED,
+                "rerank": qa_chain.RERANK_ENABLED,
+                "memory": qa_chain.MEMORY_MODE,
+                "retriever_k": qa_chain.RETRIEVER_K,
+            },
+        },
+        "cold_start": cold_start,
+        "retrieval": retrieval,
+        "prompt_tokens": {
+            "answer": token_summary([c["prompt_tokens"] for c in answer_calls]),
+            "condense": token_summary([c["prompt_tokens"] for c in condense_calls]),
+        },
+        "load": load,
+        "stages": METRICS.snapshot()["histograms"],
+        "fact_table": engine.fact_table.stats() if engine.fact_table is not None else None,
+        "llm_dispatch": {
+            "schedulers": scheduler_stats(),
+            "health": health_stats(),
+            "fallback_calls": len(fallback_llm.calls),
+            "counters": {k: v for k, v in METRICS.snapshot()["counters"].items() if k.startswith("polibot_llm_")},
+        },
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            for line in compare(result, json.load(f)):
+                print(line)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Pluggable chat-log sinks shared by the Streamlit apps.
+
+Every sink takes the same call after each turn:
+
+    sink.append(user_id, session_id, new_messages, start_index)
+
+Backends:
+- `JsonlFileSink`: appends one JSON line per turn to a segment file under
+  `chat_logs/`, fsyncs at most once per `fsync_interval`, and rotates
+  segments by size or age. A crash can tear at most the last line, which
+  readers skip.
+- `FirestoreSink`: hands the messages to the background `FirestoreChatWriter`.
+
+Compaction (also reads the legacy whole-session `chat_logs/*.json` files):
+
+    python chat_log_sink.py compact [--log-dir chat_logs] [--output chat_logs/compacted.jsonl]
+"""
+import os
+import json
+import glob
+import time
+import atexit
+import argparse
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+LOG_DIR = "chat_logs"
+
+
+class ChatLogSink:
+    """Interface for chat-log backends."""
+
+    def append(self, user_id: str, session_id: str, messages: List[Dict], start_index: int) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class JsonlFileSink(ChatLogSink):
+    """
+    Append-only JSONL sink with buffered fsync and segment rotation.
+
+    Args:
+        log_dir (str): Directory for segment files.
+        fsync_interval (float): Minimum seconds between fsyncs.
+        max_bytes (int): Rotate once a segment reaches this size.
+        max_age (float): Rotate once a segment is this many seconds old.
+    """
+
+    def __init__(self, log_dir: str = LOG_DIR, fsync_interval: float = 1.0, max_bytes: int = 10 * 1024 * 1024, max_age: float = 24 * 3600):
+        self.log_dir = log_dir
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+        self._last_fsync = 0.0
+        self._segment = 0
+        os.makedirs(log_dir, exist_ok=True)
+        atexit.register(self.close)
+
+    def _open_segment(self) -> None:
+        self._segment += 1
+        name = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{os.getpid()}_{self._segment:03d}.jsonl"
+        self._file = open(os.path.join(self.log_dir, name), "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+    def _rotate_if_needed(self) -> None:
+        if self._file is not None:
+            too_big = self._file.tell() >= self.max_bytes
+            too_old = time.monotonic() - self._opened_at >= self.max_age
+            if not (too_big or too_old):
+                return
+            self._sync()
+            self._file.close()
+        self._open_segment()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def append(self, user_id: str, session_id: str, messages: List[Dict], start_index: int) -> None:
+        if not messages:
+            return
+        record = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "user_id": user_id,
+            "session_id": session_id,
+            "start_index": start_index,
+            "messages": messages,
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._rotate_if_needed()
+            self._file.write(line)
+            self._file.flush()
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._sync()
+                self._file.close()
+
+
+class FirestoreSink(ChatLogSink):
+    """Sink backed by the asynchronous, batched `FirestoreChatWriter`."""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def append(self, user_id: str, session_id: str, messages: List[Dict], start_index: int) -> None:
+        self.writer.append(user_id, session_id, messages, start_index=start_index)
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def create_sink(kind: str, db=None) -> ChatLogSink:
+    """
+    Builds a sink by name.
+
+    Args:
+        kind (str): "jsonl" (local files) or "firestore".
+        db: Firestore client, required for "firestore".
+
+    Returns:
+        ChatLogSink: The configured sink.
+    """
+    if kind == "jsonl":
+        return JsonlFileSink(LOG_DIR)
+    if kind == "firestore":
+        from firestore_writer import FirestoreChatWriter
+        return FirestoreSink(FirestoreChatWriter(db))
+    raise ValueError(f"Unknown chat log sink '{kind}'")
+
+
+# ---------- Reading & compaction ----------
+def _legacy_messages(data: List[Dict]) -> List[Dict]:
+    messages = []
+    for item in data:
+        if "role" in item:
+            messages.append({"role": item["role"], "content": item["content"]})
+        else:  # oldest format: {"question", "answer"} pairs
+            messages.append({"role": "user", "content": item.get("question", "")})
+            messages.append({"role": "assistant", "content": item.get("answer", "")})
+    return messages
+
+
+def _is_session_record(record) -> bool:
+    return (
+        isinstance(record, dict)
+        and bool(record.get("session_id"))
+        and isinstance(record.get("messages"), list)
+        and isinstance(record.get("start_index", 0), int)
+    )
+
+
+def iter_chat_sessions(log_dir: str = LOG_DIR) -> Iterator[Dict]:
+    """
+    Yields every session found in `log_dir` as `{"session_id", "user_id", "messages"}`.
+
+    Reads legacy whole-session `*.json` files and JSONL segments (including
+    compacted ones). Torn or malformed JSONL lines, and records without a
+    `session_id` or `messages` list, are skipped.
+    """
+    sessions: Dict[tuple, Dict] = {}
+
+    for path in sorted(glob.glob(os.path.join(log_dir, "*.json"))):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        session_id = os.path.splitext(os.path.basename(path))[0]
+        sessions[(None, session_id)] = {"session_id": session_id, "user_id": None, "messages": _legacy_messages(data)}
+
+    for path in sorted(glob.glob(os.path.join(log_dir, "*.jsonl"))):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not _is_session_record(record):
+                    continue
+                key = (record.get("user_id"), record["session_id"])
+                session = sessions.setdefault(key, {"session_id": record["session_id"], "user_id": record.get("user_id"), "messages": []})
+                start = record.get("start_index", len(session["messages"]))
+                session["messages"][start:start + len(record["messages"])] = record["messages"]
+
+    yield from sessions.values()
+
+
+def compact_logs(log_dir: str = LOG_DIR, output: Optional[str] = None) -> str:
+    """
+    Rewrites all sessions in `log_dir` into a single JSONL file, one line per session.
+
+    The output is written to a temp file and renamed, and source files are
+    left untouched.
+
+    Returns:
+        str: Path of the compacted file.
+    """
+    output = output or os.path.join(log_dir, "compacted.jsonl")
+    tmp_path = output + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for session in iter_chat_sessions(log_dir):
+            record = dict(session, start_index=0)
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output)
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat log maintenance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact = sub.add_parser("compact", help="Merge legacy *.json and *.jsonl logs into one JSONL file")
+    compact.add_argument("--log-dir", default=LOG_DIR)
+    compact.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        print(compact_logs(args.log_dir, args.output))
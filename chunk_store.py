@@ -0,0 +1,406 @@
+"""
+Memory-mapped chunk store that replaces the pickled FAISS docstore.
+
+The chunk texts and metadata live in `chunks.sqlite` next to `index.faiss`,
+one row per FAISS vector position. Serving processes open it read-only and
+memory-mapped, so every Streamlit worker shares the same pages through the
+OS page cache. Retrieval reads only the k rows it returns. Nothing is ever
+unpickled.
+
+`index.faiss` is the index that is served, of the type chosen in
+`ann_index`. When that type is not exact flat, the exact vectors are kept
+in `vectors.faiss` so that the builder can keep updating them.
+
+When the chunks span more than one policy set, each set also gets its own
+sub-index in `partitions/`. A query limited to some sets searches only
+their sub-indexes, so its cost scales with the size of those sets.
+Sub-index row i is the i-th position of its set, in position order.
+"""
+import os
+import json
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import quote, unquote
+
+import faiss
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+from langchain.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from ann_index import (
+    apply_search_params, build_ann_index, choose_index_type, factory_string, flat_vectors, masked_search_params,
+)
+from policy_handler import DEFAULT_POLICY_SET
+from telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_NAME = "chunks.sqlite"
+FAISS_INDEX_NAME = "index.faiss"
+VECTORS_NAME = "vectors.faiss"
+PARTITIONS_DIR = "partitions"
+LEGACY_PICKLE_NAME = "index.pkl"
+MMAP_SIZE = 256 * 1024 * 1024
+# Chunks indexed before policy sets existed belong to the default set
+_POLICY_SET_SQL = "COALESCE(json_extract(metadata, '$.policy_set'), ?)"
+
+_SCHEMA = """
+CREATE TABLE chunks (
+    pos INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    source TEXT,
+    page INTEGER,
+    metadata TEXT NOT NULL
+)
+"""
+
+
+def write_chunk_store(vectorstore: FAISS, index_dir: str) -> str:
+    """
+    Exports the docstore of a LangChain FAISS store to `chunks.sqlite`.
+
+    Rows are keyed by FAISS vector position. The file is built under a
+    temporary name and renamed into place, so readers never see a partial
+    store.
+
+    Args:
+        vectorstore (FAISS): Store whose docstore is exported.
+        index_dir (str): Destination directory.
+
+    Returns:
+        str: Path of the written store.
+    """
+    path = os.path.join(index_dir, CHUNK_STORE_NAME)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(_SCHEMA)
+        rows = []
+        for pos, doc_id in sorted(vectorstore.index_to_docstore_id.items()):
+            doc = vectorstore.docstore.search(doc_id)
+            metadata = dict(doc.metadata)
+            rows.append((
+                pos,
+                doc_id,
+                doc.page_content,
+                metadata.get("source"),
+                metadata.get("page"),
+                json.dumps(metadata, ensure_ascii=False, default=str),
+            ))
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def _write_index(index, path: str) -> None:
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def write_serving_index(master, index_dir: str, index_type: str = "flat") -> str:
+    """
+    Writes `index.faiss` for `index_type`, built from the exact flat `master`.
+
+    For flat serving `index.faiss` is the master itself. Any other type
+    keeps the master in `vectors.faiss` as well. The master is written
+    first, so a crash never leaves a serving index without its source
+    vectors.
+
+    Returns:
+        str: The FAISS factory string of the serving index.
+    """
+    index_path = os.path.join(index_dir, FAISS_INDEX_NAME)
+    vectors_path = os.path.join(index_dir, VECTORS_NAME)
+    if factory_string(choose_index_type(master.ntotal, index_type), master.ntotal, master.d) == "Flat":
+        _write_index(master, index_path)
+        if os.path.exists(vectors_path):
+            os.remove(vectors_path)
+        return "Flat"
+
+    _write_index(master, vectors_path)
+    serving, description = build_ann_index(flat_vectors(master), index_type)
+    _write_index(serving, index_path)
+    return description
+
+
+def write_partitions(master, index_dir: str, index_type: str = "flat") -> Dict[str, int]:
+    """
+    Writes one sub-index per policy set to `partitions/`, built from the exact flat `master`.
+
+    Reads the sets from `chunks.sqlite` in `index_dir`, which must already be
+    written. Nothing is written for a single set, because `index.faiss`
+    already covers it.
+
+    Returns:
+        Dict[str, int]: Number of chunks per policy set.
+    """
+    store = ChunkStore(os.path.join(index_dir, CHUNK_STORE_NAME))
+    partitions = store.partition_positions()
+    store.close()
+    if len(partitions) > 1:
+        vectors = flat_vectors(master)
+        os.makedirs(os.path.join(index_dir, PARTITIONS_DIR), exist_ok=True)
+        for policy_set, positions in partitions.items():
+            index, _ = build_ann_index(vectors[positions], index_type)
+            _write_index(index, os.path.join(index_dir, PARTITIONS_DIR, quote(policy_set, safe="") + ".faiss"))
+    return {policy_set: len(positions) for policy_set, positions in partitions.items()}
+
+
+def read_partitions(index_dir: str) -> Dict[str, Any]:
+    """Reads the per-policy-set sub-indexes (memory-mapped where possible), keyed by set."""
+    root = os.path.join(index_dir, PARTITIONS_DIR)
+    if not os.path.isdir(root):
+        return {}
+    return {
+        unquote(name[: -len(".faiss")]): read_faiss_index(root, name)
+        for name in sorted(os.listdir(root))
+        if name.endswith(".faiss")
+    }
+
+
+def save_vectorstore(vectorstore: FAISS, index_dir: str, index_type: str = "flat") -> str:
+    """
+    Persists a FAISS store as `index.faiss` + `chunks.sqlite` (no pickle).
+
+    Per-policy-set sub-indexes are written when there is more than one set.
+    A leftover `index.pkl` from the old format is removed.
+
+    Args:
+        vectorstore (FAISS): Store with an exact flat index.
+        index_dir (str): Destination directory.
+        index_type (str): Serving index type (see `ann_index.INDEX_TYPES`).
+
+    Returns:
+        str: The FAISS factory string of the serving index.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    description = write_serving_index(vectorstore.index, index_dir, index_type)
+    write_chunk_store(vectorstore, index_dir)
+    write_partitions(vectorstore.index, index_dir, index_type)
+
+    legacy = os.path.join(index_dir, LEGACY_PICKLE_NAME)
+    if os.path.exists(legacy):
+        os.remove(legacy)
+    return description
+
+
+def read_faiss_index(index_dir: str, name: str = FAISS_INDEX_NAME):
+    """
+    Reads `index.faiss` (or `name`), memory-mapped where the index type supports it.
+
+    nprobe / efSearch are set from `ann_index` for IVF and HNSW indexes.
+    """
+    path = os.path.join(index_dir, name)
+    try:
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(path)
+    return apply_search_params(index)
+
+
+def read_master_index(index_dir: str):
+    """Reads the exact flat index: `vectors.faiss` if present, else `index.faiss`."""
+    vectors_path = os.path.join(index_dir, VECTORS_NAME)
+    if os.path.exists(vectors_path):
+        return faiss.read_index(vectors_path)
+    return faiss.read_index(os.path.join(index_dir, FAISS_INDEX_NAME))
+
+
+def load_vectorstore(index_dir: str, embeddings) -> FAISS:
+    """
+    Loads a mutable LangChain FAISS store from the exact vectors + `chunks.sqlite`.
+
+    Used by the index builder, which needs the full docstore to add and
+    delete chunks. Serving code should use `ChunkStore` instead.
+    """
+    index = read_master_index(index_dir)
+    store = ChunkStore(os.path.join(index_dir, CHUNK_STORE_NAME))
+    docs, mapping = {}, {}
+    for pos, chunk_id, doc in store.iter_all():
+        docs[chunk_id] = doc
+        mapping[pos] = chunk_id
+    store.close()
+    return FAISS(embeddings, index, InMemoryDocstore(docs), mapping)
+
+
+def has_chunk_store(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, FAISS_INDEX_NAME)) and os.path.exists(
+        os.path.join(index_dir, CHUNK_STORE_NAME)
+    )
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped access to `chunks.sqlite`.
+
+    Each thread gets its own SQLite connection, opened with `immutable=1`.
+    The store is only ever replaced by an atomic rename, never modified in
+    place, so no locking is needed.
+
+    Args:
+        path (str): Path to `chunks.sqlite`.
+    """
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def get(self, positions: Sequence[int]) -> List[Document]:
+        """
+        Fetches the chunks stored at the given FAISS positions, in that order.
+
+        Args:
+            positions (Sequence[int]): FAISS vector positions (-1 is skipped).
+
+        Returns:
+            List[Document]: The matching chunks.
+        """
+        wanted = [int(pos) for pos in positions if pos >= 0]
+        if not wanted:
+            return []
+        placeholders = ",".join("?" * len(wanted))
+        rows = self._conn().execute(
+            f"SELECT pos, text, metadata FROM chunks WHERE pos IN ({placeholders})", wanted
+        ).fetchall()
+        by_pos = {pos: Document(page_content=text, metadata=json.loads(metadata)) for pos, text, metadata in rows}
+        return [by_pos[pos] for pos in wanted if pos in by_pos]
+
+    def iter_texts(self, policy_set: Optional[str] = None):
+        """Yields `(pos, text)` for every chunk (or those of one policy set) without decoding metadata."""
+        if policy_set is None:
+            yield from self._conn().execute("SELECT pos, text FROM chunks ORDER BY pos")
+            return
+        yield from self._conn().execute(
+            f"SELECT pos, text FROM chunks WHERE {_POLICY_SET_SQL} = ? ORDER BY pos", (DEFAULT_POLICY_SET, policy_set)
+        )
+
+    def partition_positions(self) -> Dict[str, np.ndarray]:
+        """Positions of the chunks of each policy set, in position order."""
+        partitions: Dict[str, List[int]] = {}
+        rows = self._conn().execute(f"SELECT pos, {_POLICY_SET_SQL} FROM chunks ORDER BY pos", (DEFAULT_POLICY_SET,))
+        for pos, policy_set in rows:
+            partitions.setdefault(policy_set, []).append(pos)
+        return {policy_set: np.asarray(positions, dtype=np.int64) for policy_set, positions in partitions.items()}
+
+    def iter_all(self):
+        """Yields `(pos, chunk_id, Document)` for every chunk, in position order."""
+        cursor = self._conn().execute("SELECT pos, chunk_id, text, metadata FROM chunks ORDER BY pos")
+        for pos, chunk_id, text, metadata in cursor:
+            yield pos, chunk_id, Document(page_content=text, metadata=json.loads(metadata))
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+def open_partitions(index_dir: str, store: "ChunkStore") -> Dict[str, Any]:
+    """
+    Returns `{policy_set: (sub_index, positions)}` for `ChunkStoreRetriever.partitions`.
+
+    `sub_index` is None for a set without a sub-index on disk (always the
+    case for a single set). Such a set is searched by masking `index.faiss`.
+    """
+    indexes = read_partitions(index_dir)
+    return {
+        policy_set: (indexes.get(policy_set), positions)
+        for policy_set, positions in store.partition_positions().items()
+    }
+
+
+class ChunkStoreRetriever(BaseRetriever):
+    """
+    Retriever that searches a raw FAISS index and reads hits from a ChunkStore.
+
+    Behaves like `FAISS.as_retriever(search_kwargs={"k": k})` (same distance
+    and ordering), but only the k returned chunks are loaded into memory.
+    Passing `policy_sets` restricts the search to those sets (see
+    `open_partitions`).
+    """
+
+    index: Any
+    store: Any
+    embeddings: Any
+    k: int = 6
+    partitions: Dict[str, Any] = {}
+
+    def select_partitions(self, policy_sets: Optional[Sequence[str]]) -> Optional[List[str]]:
+        """
+        The known sets among `policy_sets`, or None when the whole index is wanted.
+
+        Unknown set names are logged and ignored. When none is known, the
+        whole index is searched rather than nothing.
+        """
+        if policy_sets is None:
+            return None
+        selected = [name for name in dict.fromkeys(policy_sets) if name in self.partitions]
+        unknown = [name for name in policy_sets if name not in self.partitions]
+        if unknown:
+            logger.warning("unknown policy sets %s (index has %s)", unknown, sorted(self.partitions))
+        if not selected:
+            return None
+        return None if len(selected) == len(self.partitions) else selected
+
+    def search_positions(self, vector: Sequence[float], k: int, policy_sets: Optional[Sequence[str]] = None) -> List[int]:
+        """Returns the FAISS positions of the k nearest chunks (of `policy_sets`), best first."""
+        query = np.asarray([vector], dtype=np.float32)
+        selected = self.select_partitions(policy_sets)
+        with stage("vector_search"):
+            if selected is None:
+                _, positions = self.index.search(query, k)
+                return [int(pos) for pos in positions[0] if pos >= 0]
+            hits = []
+            for name in selected:
+                sub_index, positions = self.partitions[name]
+                if sub_index is None:
+                    distances, ids = self.index.search(query, k, params=masked_search_params(self.index, positions))
+                    hits.extend((d, int(pos)) for d, pos in zip(distances[0], ids[0]) if pos >= 0)
+                else:
+                    distances, ids = sub_index.search(query, min(k, sub_index.ntotal))
+                    hits.extend((d, int(positions[i])) for d, i in zip(distances[0], ids[0]) if i >= 0)
+        hits.sort()
+        return [pos for _, pos in hits[:k]]
+
+    def search_by_vector(self, vector: Sequence[float], k: int, policy_sets: Optional[Sequence[str]] = None) -> List[Document]:
+        positions = self.search_positions(vector, k, policy_sets)
+        with stage("chunk_fetch"):
+            return self.store.get(positions)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, policy_sets: Optional[Sequence[str]] = None
+    ) -> List[Document]:
+        with stage("embed_query"):
+            vector = self.embeddings.embed_query(query)
+        return self.search_by_vector(vector, self.k, policy_sets)
@@ -0,0 +1,113 @@
+"""
+Cheap local check for whether a follow-up question needs LLM rephrasing.
+
+Most employee messages ("how many sick leaves do trainees get?") are
+already standalone. Only messages that point back into the conversation
+("what about trainees?", "is it paid?") have to go through the condense
+prompt, which then runs on a small, fast model.
+
+Personal pronouns ("they", "them") and "same" always refer back. "this",
+"that", "these", "those" and "such" refer back as pronouns ("what does
+that mean?") and as determiners ("that leave", "such requests"), unless the
+noun names itself ("this company", "this year"), "that" opens a clause
+("is it true that ...") or "such" introduces examples ("such as"). "it"
+refers back unless that occurrence is a dummy subject ("is it mandatory to
+...", "how long does it take ..."); every "it" is checked on its own.
+"""
+import re
+from typing import Optional, Tuple
+
+FIRST_TURN = "first_turn"
+SELF_CONTAINED = "self_contained"
+REPHRASED = "rephrased"
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Words that only make sense with the previous turns in view
+REFERRING_WORDS = frozenset(
+    "its they them their theirs he she him her same above former latter".split()
+)
+# Demonstratives: refer back as pronouns and as determiners of an ordinary noun
+DEMONSTRATIVES = ("this", "that", "these", "those", "such")
+# Pronoun "it" (the word regex keeps "it's" as one token)
+IT_WORDS = ("it", "it's")
+# Nouns that name themselves after "this" ("this company", "this year"); "that year" still refers back
+_SELF_NAMING = frozenset(
+    "company organisation organization firm employer office workplace policy policies handbook document "
+    "year month week quarter time".split()
+)
+# "that" after these words opens a clause ("is it true that ...", "does the policy say that ...")
+_THAT_CLAUSE_HEADS = frozenset(
+    "true possible sure mean means meant say says said state states stated mention mentions mentioned "
+    "confirm ensure know given provided assuming fact note so such".split()
+)
+# "that" before a subject opens a clause ("the leave that I took")
+_CLAUSE_SUBJECTS = frozenset("i we you everyone employees".split())
+# "is it mandatory to ...", "it's possible that ...", "how long does it take to ..."
+_DUMMY_IT_RE = re.compile(
+    r"\b(?:(?:is|was|isn't|wasn't) it|it(?:'s| is| was)|(?:will|would|could) it be) "
+    r"(?:(?:really|still|also|even|always) )?(?:mandatory|necessary|compulsory|required|possible|okay|ok|"
+    r"allowed|permitted|fine|true|important|needed|advisable|acceptable|legal)\b"
+    r"|\bhow (?:long|much time|many days) (?:does|will|would) it take\b"
+)
+FOLLOW_UP_OPENERS = (
+    "and ", "also ", "but ", "so ", "then ", "what about", "how about", "what if",
+    "and?", "more", "explain more", "tell me more", "elaborate", "why not", "same for",
+)
+MIN_STANDALONE_WORDS = 4
+
+
+def classify_question(question: str) -> Tuple[bool, str]:
+    """
+    Decides whether a follow-up must be rewritten into a standalone question.
+
+    Args:
+        question (str): The user's latest message.
+
+    Returns:
+        Tuple[bool, str]: `(needs_rephrasing, reason)`.
+    """
+    text = question.strip().lower()
+    words = _WORD_RE.findall(text)
+
+    if text.startswith(FOLLOW_UP_OPENERS):
+        return True, "follow_up_opener"
+    if len(words) < MIN_STANDALONE_WORDS:
+        return True, "too_short"
+    referring = REFERRING_WORDS.intersection(words)
+    if referring:
+        return True, "refers_to_" + sorted(referring)[0]
+    pronoun = _context_pronoun(text)
+    if pronoun:
+        return True, "refers_to_" + pronoun
+    return False, "standalone"
+
+
+def _context_pronoun(text: str) -> Optional[str]:
+    """Returns the first "it" or demonstrative that refers back, if any."""
+    dummy_spans = [m.span() for m in _DUMMY_IT_RE.finditer(text)]
+    tokens = [(m.group(), m.start()) for m in _WORD_RE.finditer(text)]
+    for i, (word, start) in enumerate(tokens):
+        if word in IT_WORDS:
+            # Each "it" on its own: "is it mandatory to apply for it?" still refers back
+            if not any(lo <= start < hi for lo, hi in dummy_spans):
+                return "it"
+            continue
+        if word not in DEMONSTRATIVES:
+            continue
+        previous = tokens[i - 1][0] if i > 0 else None
+        following = tokens[i + 1][0] if i + 1 < len(tokens) else None
+        if _refers_back(word, previous, following):
+            return word
+    return None
+
+
+def _refers_back(word: str, previous: Optional[str], following: Optional[str]) -> bool:
+    if word == "such":
+        return following not in ("as", "that")  # "leaves such as ..." is not a reference
+    if word == "that" and (previous in _THAT_CLAUSE_HEADS or following in _CLAUSE_SUBJECTS):
+        return False
+    if word == "this" and following in _SELF_NAMING:
+        return False
+    # Pronoun use ("is that paid?") or a determiner of an ordinary noun ("that leave")
+    return True
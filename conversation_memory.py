@@ -0,0 +1,162 @@
+"""
+Conversation memory with a hard token ceiling.
+
+Recent turns are kept verbatim in a rolling window. Turns that fall out of
+the window are folded into a running summary with one call to a small LLM
+(progressive summarization: old summary + evicted lines -> new summary).
+Both parts are capped, so the chat history sent to the condense prompt
+stays the same size however long the session runs.
+
+The summary call runs on a background executor, never on the turn's
+response path. Evicted turns stay in the history verbatim until the summary
+that covers them is ready. They are capped too: when the summarizer falls
+behind (it runs at background priority and may wait for TPM budget), the
+oldest of them are folded into the summary as plain text, keeping its
+newest part.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+from telemetry import stage
+from token_utils import CHARS_PER_TOKEN, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Shared by all sessions; summaries are background work
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[: max_chars - 3].rstrip() + "..."
+
+
+def _truncate_start(text: str, max_tokens: int) -> str:
+    """Like `_truncate`, but keeps the end of `text` (the most recent lines)."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return "..." + text[len(text) - max_chars + 3:].lstrip()
+
+
+class BoundedSummaryMemory(BaseChatMemory):
+    """
+    Rolling window of recent turns plus an incrementally updated summary.
+
+    Args:
+        llm: Chat model used to update the summary (a small, fast model).
+        max_window_tokens (int): Ceiling for the verbatim recent turns.
+        max_summary_tokens (int): Ceiling for the summary of older turns.
+        max_message_tokens (int): Ceiling for any single stored message.
+        max_pending_tokens (int): Ceiling for evicted turns waiting to be summarized.
+    """
+
+    llm: Any
+    memory_key: str = "chat_history"
+    max_window_tokens: int = 600
+    max_summary_tokens: int = 200
+    max_message_tokens: int = 300
+    max_pending_tokens: int = 600
+    summary: str = ""
+
+    _pending: List[BaseMessage] = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _future: Optional[Future] = PrivateAttr(default=None)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages: List[BaseMessage] = []
+        with self._lock:
+            if self.summary:
+                messages.append(SystemMessage(content=f"Summary of earlier conversation: {self.summary}"))
+            # Evicted turns whose summary is still being written
+            messages.extend(self._pending)
+        messages.extend(self.chat_memory.messages)
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        self.chat_memory.add_user_message(_truncate(input_str, self.max_message_tokens))
+        self.chat_memory.add_ai_message(_truncate(output_str, self.max_message_tokens))
+        self._prune()
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self._pending = []
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Blocks until the pending summary update (if any) has finished."""
+        future = self._future
+        if future is not None:
+            future.result(timeout)
+
+    def _prune(self) -> None:
+        messages = list(self.chat_memory.messages)
+        evicted: List[BaseMessage] = []
+        # Evict whole turns (user + assistant), but always keep the latest turn
+        while len(messages) > 2 and sum(estimate_tokens(m.content) for m in messages) > self.max_window_tokens:
+            evicted.extend(messages[:2])
+            messages = messages[2:]
+        if not evicted:
+            return
+
+        self.chat_memory.clear()
+        self.chat_memory.add_messages(messages)
+
+        with self._lock:
+            self._pending.extend(evicted)
+            self._fold_overflow()
+            if self._future is None:
+                self._future = _SUMMARY_EXECUTOR.submit(self._summarize)
+
+    def _fold_overflow(self) -> None:
+        """Folds the oldest pending turns into the summary as text while over the cap (lock held)."""
+        overflow: List[BaseMessage] = []
+        while len(self._pending) > 2 and sum(estimate_tokens(m.content) for m in self._pending) > self.max_pending_tokens:
+            overflow.extend(self._pending[:2])
+            del self._pending[:2]
+        if overflow:
+            logger.info("memory summary behind, folding %d messages as text", len(overflow))
+            self.summary = _truncate_start(f"{self.summary}\n{get_buffer_string(overflow)}".strip(), self.max_summary_tokens)
+
+    def _summarize(self) -> None:
+        """Folds the pending evicted turns into the summary, until none are left."""
+        while True:
+            with self._lock:
+                evicted = list(self._pending)
+                summary = self.summary
+                if not evicted:
+                    self._future = None
+                    return
+
+            new_lines = get_buffer_string(evicted)
+            try:
+                with stage("memory_summary"):
+                    response = self.llm.invoke(SUMMARY_PROMPT.format(summary=summary, new_lines=new_lines))
+                summary = _truncate(str(getattr(response, "content", response)).strip(), self.max_summary_tokens)
+            except Exception:
+                # Keep the history bounded even without the LLM; the newest lines matter most
+                logger.warning("memory summary failed, truncating instead", exc_info=True)
+                summary = _truncate_start(f"{summary}\n{new_lines}".strip(), self.max_summary_tokens)
+
+            with self._lock:
+                # Unless cleared or folded meanwhile (the loop then summarizes what is left)
+                if self._pending[: len(evicted)] == evicted:
+                    self.summary = summary
+                    del self._pending[: len(evicted)]
@@ -0,0 +1,231 @@
+"""
+Retrieval quality and speed evaluation against a golden set.
+
+The golden file is JSONL, one question per line:
+
+    {"question": "How many casual leaves do I get?", "pages": [12]}
+    {"question": "What is the sandwich rule?", "pages": [14, 15], "source": "POLICIES 2.3- ... 2025.pdf"}
+
+`pages` are 1-based page numbers as shown in a PDF viewer. `source` is
+optional; when given, only chunks from that PDF (matched by file name)
+count as relevant. Write the entries by checking the policy PDFs by hand.
+The tool does not guess them. `eval/golden.jsonl` covers the policy PDF
+shipped in `data/`; extend it when PDFs are added.
+
+For every combination of chunk size, overlap, index type and retrieval
+mode it reports, for each k:
+
+- recall@k: share of a question's expected pages found in the top k, averaged
+- hit@k: share of questions with at least one expected page in the top k
+- MRR: mean reciprocal rank of the first relevant chunk (within max k)
+- build time (split + embed + index), index size and search latency
+
+Chunk embeddings are computed once per chunking configuration and reused
+for every index type.
+
+Usage:
+    python eval_retrieval.py [--golden eval/golden.jsonl] \\
+        [--chunk-sizes 500,1000] [--overlaps 100,200] [--k 3,6,10] \\
+        [--index-types flat,flat-fp16,hnsw,ivf,ivf-pq] [--nprobe 16] [--ef-search 64] [--modes vector,hybrid] [--output retrieval_eval.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from ann_index import EF_SEARCH, NPROBE, apply_search_params, build_ann_index
+from benchmark import percentiles
+from index_builder import list_policy_pdfs
+from ingest import iter_chunks, iter_parsed_pdfs
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from policy_handler import CHUNK_OVERLAP, CHUNK_SIZE, get_text_splitter
+
+INDEX_TYPES = ("flat", "flat-fp16", "hnsw", "ivf", "ivf-pq")
+MODES = ("vector", "hybrid")
+GOLDEN_PATH = os.path.join("eval", "golden.jsonl")
+
+
+def load_golden(path: str) -> List[Dict]:
+    """Reads the golden JSONL file (see module docstring for the format)."""
+    golden = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("question") or not item.get("pages"):
+                raise ValueError(f"{path}:{line_no}: 'question' and 'pages' are required")
+            golden.append({
+                "question": item["question"],
+                "pages": {int(p) for p in item["pages"]},
+                "source": os.path.basename(item["source"]) if item.get("source") else None,
+            })
+    return golden
+
+
+def chunk_labels(chunks) -> List[Tuple[str, int]]:
+    """(file name, 1-based page) of every chunk, by position."""
+    return [
+        (os.path.basename(str(doc.metadata.get("source", ""))), int(doc.metadata.get("page", 0)) + 1)
+        for doc in chunks
+    ]
+
+
+def score_ranking(ranking: Sequence[int], labels: List[Tuple[str, int]], item: Dict, ks: Sequence[int]) -> Dict:
+    """Recall/hit at every k and reciprocal rank for one question."""
+    def relevant(pos: int) -> bool:
+        source, page = labels[pos]
+        return page in item["pages"] and (item["source"] is None or item["source"] == source)
+
+    scores = {}
+    for k in ks:
+        found = {labels[pos][1] for pos in ranking[:k] if relevant(pos)}
+        scores[f"recall@{k}"] = len(found) / len(item["pages"])
+        scores[f"hit@{k}"] = 1.0 if found else 0.0
+    first = next((rank for rank, pos in enumerate(ranking, 1) if relevant(pos)), None)
+    scores["rr"] = 1.0 / first if first else 0.0
+    return scores
+
+
+def evaluate_config(
+    index,
+    lexical: Optional[BM25Index],
+    query_vectors: np.ndarray,
+    golden: List[Dict],
+    labels: List[Tuple[str, int]],
+    ks: Sequence[int],
+    candidate_factor: int = 3,
+) -> Dict:
+    """Runs every golden question at the largest k and scores all smaller k from it."""
+    max_k = max(ks)
+    per_question, latencies = [], []
+    for item, vector in zip(golden, query_vectors):
+        started = time.perf_counter()
+        n_candidates = max_k * candidate_factor if lexical is not None else max_k
+        _, positions = index.search(vector[None, :], n_candidates)
+        ranking = [int(p) for p in positions[0] if p >= 0]
+        if lexical is not None:
+            lexical_hits = [pos for pos, _ in lexical.search(item["question"], n_candidates)]
+            ranking = reciprocal_rank_fusion([ranking, lexical_hits])
+        ranking = ranking[:max_k]
+        latencies.append(time.perf_counter() - started)
+        per_question.append(score_ranking(ranking, labels, item, ks))
+
+    metrics = {key: round(float(np.mean([q[key] for q in per_question])), 4) for key in per_question[0] if key != "rr"}
+    metrics["mrr"] = round(float(np.mean([q["rr"] for q in per_question])), 4)
+    metrics["search_latency"] = percentiles(latencies)
+    return metrics
+
+
+def run_sweep(args, embeddings) -> List[Dict]:
+    golden = load_golden(args.golden)
+    if not golden:
+        sys.exit(f"No questions in {args.golden}")
+    ks = sorted({int(k) for k in args.k.split(",")})
+
+    # Parse PDFs once; chunking is redone per configuration
+    started = time.perf_counter()
+    pages = [page for _, doc_pages in iter_parsed_pdfs(list_policy_pdfs(args.data_dir), workers=args.workers, data_dir=args.data_dir) for page in doc_pages]
+    parse_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # Through the query path, as at serving time (onnx-int8 embeds only queries in int8)
+    query_vectors = np.asarray([embeddings.embed_query(g["question"]) for g in golden], dtype=np.float32)
+    query_embed_s = (time.perf_counter() - started) / len(golden)
+
+    results = []
+    for chunk_size in [int(v) for v in args.chunk_sizes.split(",")]:
+        for overlap in [int(v) for v in args.overlaps.split(",")]:
+            if overlap >= chunk_size:
+                continue
+            started = time.perf_counter()
+            chunks = list(iter_chunks(pages, get_text_splitter(chunk_size, overlap)))
+            split_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            vectors = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+            embed_s = time.perf_counter() - started
+            labels = chunk_labels(chunks)
+
+            lexical, lexical_s = None, 0.0
+            if "hybrid" in args.modes:
+                started = time.perf_counter()
+                lexical = BM25Index.from_chunks(enumerate(c.page_content for c in chunks))
+                lexical_s = time.perf_counter() - started
+
+            for index_type in args.index_types.split(","):
+                started = time.perf_counter()
+                index, factory = build_ann_index(vectors, index_type)
+                apply_search_params(index, args.nprobe, args.ef_search)
+                index_s = time.perf_counter() - started
+                index_bytes = int(faiss.serialize_index(index).size)
+
+                for mode in args.modes.split(","):
+                    metrics = evaluate_config(
+                        index, lexical if mode == "hybrid" else None, query_vectors, golden, labels, ks
+                    )
+                    build_s = split_s + embed_s + index_s + (lexical_s if mode == "hybrid" else 0.0)
+                    results.append({
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": overlap,
+                        "index_type": index_type,
+                        "index_factory": factory,
+                        "mode": mode,
+                        "chunks": len(chunks),
+                        "build_s": round(build_s, 3),
+                        "embed_s": round(embed_s, 3),
+                        "index_bytes": index_bytes,
+                        "query_embed_ms": round(query_embed_s * 1000, 2),
+                        **metrics,
+                    })
+                    print(_format_row(results[-1], ks), file=sys.stderr)
+
+    for row in results:
+        row["parse_s"] = round(parse_s, 3)
+    return results
+
+
+def _format_row(row: Dict, ks: Sequence[int]) -> str:
+    recalls = " ".join(f"R@{k}={row[f'recall@{k}']:.2f}" for k in ks)
+    return (
+        f"size={row['chunk_size']:<5} overlap={row['chunk_overlap']:<4} {row['index_type']:<9} {row['mode']:<7} "
+        f"{recalls} MRR={row['mrr']:.3f} build={row['build_s']:.1f}s "
+        f"size={row['index_bytes'] / 1024:.0f}KB p95={row['search_latency'].get('p95_ms')}ms"
+    )
+
+
+if __name__ == "__main__":
+    from qa_chain import DATA_DIR, EMBEDDING_MODEL, load_embeddings
+
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and speed against a golden set")
+    parser.add_argument("--golden", default=GOLDEN_PATH, help="JSONL file of {question, pages[, source]}")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--chunk-sizes", default=f"500,{CHUNK_SIZE},1500")
+    parser.add_argument("--overlaps", default=f"100,{CHUNK_OVERLAP}")
+    parser.add_argument("--k", default="3,6,10")
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int, default=NPROBE, help="IVF lists probed per query")
+    parser.add_argument("--ef-search", type=int, default=EF_SEARCH, help="HNSW candidate list size")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--fake-embeddings", action="store_true", help="Timing-only run without the MiniLM weights")
+    parser.add_argument("--output", default="retrieval_eval.json")
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=384)
+    else:
+        embeddings = load_embeddings()
+
+    rows = run_sweep(args, embeddings)
+    rows.sort(key=lambda r: (-r["mrr"], r["search_latency"].get("p50_ms", 0)))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"embedding_model": EMBEDDING_MODEL, "golden": args.golden, "results": rows}, f, indent=2)
+    print(f"Best by MRR: {_format_row(rows[0], sorted(int(k) for k in args.k.split(',')))}")
+    print(f"Wrote {args.output}", file=sys.stderr)
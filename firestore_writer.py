@@ -0,0 +1,281 @@
+"""
+Background, batched chat-log persistence to Firestore.
+
+Instead of rewriting the whole `messages` array on every turn, each new
+message is appended as its own document:
+
+    chat_logs/{user_id}_{session_id}                  (session summary, merged)
+    chat_logs/{user_id}_{session_id}/messages/{index} (one doc per message)
+
+Writes are queued on a bounded queue and committed by a single background
+thread in batched commits, so a slow Firestore round trip never blocks the
+Streamlit script. A batch never exceeds Firestore's 500-write limit: an
+append that does not fit waits for the next batch, and one that is larger
+than the limit on its own is split when queued. Pending writes are flushed
+at interpreter exit.
+
+The writer only needs a client with `collection()` and `batch()`. That can
+be `firestore.client()` (which honours FIRESTORE_EMULATOR_HOST) or the
+`InMemoryFirestore` stand-in below.
+"""
+import time
+import queue
+import atexit
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from telemetry import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Firestore allows at most 500 writes per batched commit
+MAX_WRITES_PER_BATCH = 500
+
+
+class FirestoreChatWriter:
+    """
+    Appends chat messages to Firestore from a background thread.
+
+    Args:
+        db: Firestore client (or a compatible stand-in).
+        collection (str): Top-level collection for sessions.
+        max_queue (int): Maximum pending appends; beyond this `append` drops
+            the write after `put_timeout` and counts it in `dropped`.
+        flush_interval (float): Maximum seconds a write waits to be batched.
+        put_timeout (float): Seconds `append` may block on a full queue.
+        timestamp_value: Value stored as `timestamp`; defaults to
+            `firestore.SERVER_TIMESTAMP`.
+    """
+
+    def __init__(
+        self,
+        db,
+        collection: str = "chat_logs",
+        max_queue: int = 1000,
+        flush_interval: float = 1.0,
+        put_timeout: float = 0.5,
+        timestamp_value: Any = None,
+        max_retries: int = 3,
+    ):
+        self.db = db
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        if timestamp_value is None:
+            from firebase_admin import firestore
+            timestamp_value = firestore.SERVER_TIMESTAMP
+        self.timestamp_value = timestamp_value
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self.commits = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._thread = threading.Thread(target=self._run, name="firestore-chat-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- Public API ----------
+    def append(self, user_id: str, session_id: str, messages: List[Dict], start_index: int) -> bool:
+        """
+        Queues new messages of a session for writing.
+
+        Args:
+            user_id (str): User (or IP) the session belongs to.
+            session_id (str): Session identifier.
+            messages (List[Dict]): Only the messages not yet persisted.
+            start_index (int): Index of `messages[0]` within the session.
+
+        Returns:
+            bool: False if the queue stayed full and the write was dropped.
+        """
+        if not messages:
+            return True
+        # Each item also writes its session doc, so it holds at most MAX_WRITES_PER_BATCH - 1 messages
+        size = MAX_WRITES_PER_BATCH - 1
+        for offset in range(0, len(messages), size):
+            item = (user_id, session_id, [dict(m) for m in messages[offset:offset + size]], start_index + offset)
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                lost = len(messages) - offset
+                self.dropped += lost
+                METRICS.inc("polibot_chat_log_dropped_total", lost)
+                logger.warning("chat log queue full, dropped %d messages", lost)
+                return False
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until everything queued so far is committed (or timeout)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flushes pending writes and stops the background thread."""
+        if self._stop.is_set():
+            return
+        self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self._queue.qsize(),
+            "commits": self.commits,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    # ---------- Background thread ----------
+    @staticmethod
+    def _writes(item) -> int:
+        # The messages plus (at most) one session summary doc
+        return len(item[2]) + 1
+
+    def _run(self) -> None:
+        carried = None  # taken from the queue but did not fit in the previous batch
+        while not self._stop.is_set() or carried is not None:
+            if carried is not None:
+                first, carried = carried, None
+            else:
+                try:
+                    first = self._queue.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+
+            items = [first]
+            writes = self._writes(first)
+            deadline = time.monotonic() + self.flush_interval
+            while writes < MAX_WRITES_PER_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if writes + self._writes(item) > MAX_WRITES_PER_BATCH:
+                    carried = item
+                    break
+                items.append(item)
+                writes += self._writes(item)
+
+            try:
+                self._commit(items)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _commit(self, items) -> None:
+        # Coalesce per session so each session doc is written once per batch
+        sessions: Dict[str, Dict] = {}
+        batch = self.db.batch()
+        count = 0
+        for user_id, session_id, messages, start_index in items:
+            doc_id = f"{user_id}_{session_id}"
+            session_ref = self.db.collection(self.collection).document(doc_id)
+            for offset, message in enumerate(messages):
+                index = start_index + offset
+                batch.set(
+                    session_ref.collection("messages").document(f"{index:06d}"),
+                    {**message, "index": index, "timestamp": self.timestamp_value},
+                )
+                count += 1
+            summary = sessions.setdefault(doc_id, {"ref": session_ref, "user_id": user_id, "session_id": session_id, "count": 0})
+            summary["count"] = max(summary["count"], start_index + len(messages))
+
+        for summary in sessions.values():
+            batch.set(summary["ref"], {
+                "user_id": summary["user_id"],
+                "session_id": summary["session_id"],
+                "message_count": summary["count"],
+                "timestamp": self.timestamp_value,
+            }, merge=True)
+
+        for attempt in range(self.max_retries):
+            try:
+                started = time.perf_counter()
+                batch.commit()
+                METRICS.observe("polibot_firestore_commit_seconds", time.perf_counter() - started)
+                self.commits += 1
+                self.written += count
+                return
+            except Exception as exc:  # network/quota errors; retry with backoff
+                logger.warning("chat log commit failed (attempt %d): %s", attempt + 1, exc)
+                time.sleep(0.5 * 2 ** attempt)
+        self.failed += count
+
+
+class _MemoryDocument:
+    def __init__(self, store: Dict, path: str):
+        self._store = store
+        self.path = path
+
+    def collection(self, name: str) -> "_MemoryCollection":
+        return _MemoryCollection(self._store, f"{self.path}/{name}")
+
+    def set(self, data: Dict, merge: bool = False) -> None:
+        if merge and self.path in self._store:
+            self._store[self.path].update(data)
+        else:
+            self._store[self.path] = dict(data)
+
+    def get(self) -> Optional[Dict]:
+        return self._store.get(self.path)
+
+
+class _MemoryCollection:
+    def __init__(self, store: Dict, path: str):
+        self._store = store
+        self.path = path
+
+    def document(self, doc_id: str) -> _MemoryDocument:
+        return _MemoryDocument(self._store, f"{self.path}/{doc_id}")
+
+    def list(self) -> List[Dict]:
+        prefix = self.path + "/"
+        return [
+            data for path, data in sorted(self._store.items())
+            if path.startswith(prefix) and "/" not in path[len(prefix):]
+        ]
+
+
+class _MemoryBatch:
+    def __init__(self, store: Dict):
+        self._store = store
+        self._ops = []
+
+    def set(self, ref: _MemoryDocument, data: Dict, merge: bool = False) -> None:
+        self._ops.append((ref, data, merge))
+
+    def commit(self) -> None:
+        for ref, data, merge in self._ops:
+            ref.set(data, merge=merge)
+        self._ops = []
+
+
+class InMemoryFirestore:
+    """
+    Minimal in-process stand-in for the Firestore client API used above.
+
+    Useful for local runs without credentials and for exercising the writer
+    without the emulator. Documents are kept in a dict keyed by path.
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, Dict] = {}
+
+    def collection(self, name: str) -> _MemoryCollection:
+        return _MemoryCollection(self.documents, name)
+
+    def batch(self) -> _MemoryBatch:
+        return _MemoryBatch(self.documents)
@@ -0,0 +1,300 @@
+"""
+Hedged answer calls with a fallback model, per-model circuit breakers and
+first-token latency stats.
+
+`HedgedChatModel` sends a call to the primary model. If no first token has
+arrived within `hedge_after` seconds of the call actually being sent, it
+sends the same call to the fallback model (another Groq model or endpoint).
+Time spent waiting in the dispatch queue for a TPM reservation does not
+count, because a hedge fired then would only add load to the same budget. Whichever streams first wins; the
+other call is cancelled after its next chunk. If other sessions joined
+that call through the dispatch layer's coalescing, it keeps running for
+them and only this caller stops reading it. A primary that fails before
+its first token fails over to the fallback straight away.
+
+Each model has a `ModelHealth` record. This is a circuit breaker plus a
+rolling first-token latency histogram. An error, or a primary that missed
+the deadline and lost the race, counts as a failure. After
+`POLIBOT_BREAKER_FAILURES` consecutive failures the breaker opens:
+
+- an open primary sends every call to the fallback
+- an open fallback turns hedging off
+
+Every `POLIBOT_BREAKER_RESET` seconds one trial call is let through
+(half-open). If it succeeds the breaker closes again.
+
+Metrics: `polibot_llm_first_token_seconds{model}`, the counters
+`polibot_llm_hedges_total`, `polibot_llm_hedge_wins_total{model}`,
+`polibot_llm_breaker_open_total{model}`, and `health_stats()` for a
+per-model summary. `MockChatModel(slow_every=..., slow_latency=...)`
+simulates slow responses locally (see `benchmark.py --slow-every`).
+"""
+import os
+import time
+import queue
+import logging
+import threading
+import contextvars
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from llm_dispatch import DispatchedChatModel, iter_model_chunks, on_call_issued
+from telemetry import METRICS, Histogram, count
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURES = int(os.getenv("POLIBOT_BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("POLIBOT_BREAKER_RESET", "30"))
+
+PRIMARY = "primary"
+FALLBACK = "fallback"
+
+
+class ModelHealth:
+    """
+    Circuit breaker and first-token latency stats of one model.
+
+    Args:
+        model_name (str): Model the record belongs to.
+        failure_threshold (int): Consecutive failures that open the breaker.
+        reset_after (float): Seconds the breaker stays open before a trial call.
+    """
+
+    def __init__(self, model_name: str, failure_threshold: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET_S):
+        self.model_name = model_name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.first_token = Histogram()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True if a call may be sent (a half-open breaker lets one trial through)."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # One trial per reset period, so a trial that was cancelled unresolved does not block forever
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = "half_open"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self, first_token_s: Optional[float] = None) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info("circuit for %s closed", self.model_name)
+            self.state = "closed"
+            self.failures = 0
+            if first_token_s is not None:
+                self.first_token.observe(first_token_s)
+        if first_token_s is not None:
+            METRICS.observe("polibot_llm_first_token_seconds", first_token_s, model=self.model_name)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            opening = self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold)
+            if opening:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+        if opening:
+            count("llm_breaker_open", model=self.model_name)
+            logger.warning("circuit for %s opened after %d failures", self.model_name, self.failures)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "first_token": {"count": self.first_token.count, **self.first_token.quantiles()},
+            }
+
+
+_health: Dict[str, ModelHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_health(model_name: str) -> ModelHealth:
+    """Returns the process-wide health record of `model_name`."""
+    with _health_lock:
+        if model_name not in _health:
+            _health[model_name] = ModelHealth(model_name)
+        return _health[model_name]
+
+
+def health_stats() -> Dict[str, Dict[str, Any]]:
+    with _health_lock:
+        records = dict(_health)
+    return {name: record.stats() for name, record in records.items()}
+
+
+def _model_name(model: BaseChatModel) -> str:
+    return getattr(model, "model_name", None) or model._llm_type
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    Chat model that races a fallback against a slow primary.
+
+    Args:
+        primary (BaseChatModel): Preferred model (usually a `DispatchedChatModel`).
+        fallback (BaseChatModel): Model tried when the primary is slow, failing or tripped.
+        hedge_after (float): First-token deadline of the primary, in seconds.
+        streaming (bool): Stream tokens from both models.
+    """
+
+    primary: BaseChatModel
+    fallback: BaseChatModel
+    hedge_after: float = 3.0
+    streaming: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "primary": self.primary._identifying_params,
+            "fallback": self.fallback._identifying_params,
+            "hedge_after": self.hedge_after,
+        }
+
+    @property
+    def model_name(self) -> str:
+        return _model_name(self.primary)
+
+    def _start(self, role: str, events: "queue.Queue", cancelled: threading.Event, messages, stop, kwargs) -> None:
+        model = self.primary if role == PRIMARY else self.fallback
+
+        def work():
+            # A dispatched model reports when its call leaves the queue; others are sent right away
+            if isinstance(model, DispatchedChatModel):
+                on_call_issued(lambda: events.put((role, "issued", time.perf_counter())))
+            else:
+                events.put((role, "issued", time.perf_counter()))
+            chunks = iter_model_chunks(model, messages, stop, self.streaming, **kwargs)
+            try:
+                for chunk in chunks:
+                    if cancelled.is_set():
+                        return
+                    events.put((role, "chunk", chunk))
+                events.put((role, "done", None))
+            except Exception as exc:
+                events.put((role, "error", exc))
+            finally:
+                chunks.close()  # a cancelled loser releases its connection and queue slot
+
+        # Run in a copy of the caller's context so stage timings land in its turn trace
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(work,), name=f"hedge-{role}", daemon=True).start()
+
+    def _race(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        health = {PRIMARY: get_health(_model_name(self.primary)), FALLBACK: get_health(_model_name(self.fallback))}
+        events: "queue.Queue" = queue.Queue()
+        cancel = {PRIMARY: threading.Event(), FALLBACK: threading.Event()}
+        started = time.perf_counter()
+        issued_at: Dict[str, float] = {}
+        running, launched, winner, errors = set(), set(), None, []
+
+        def launch(role: str) -> None:
+            running.add(role)
+            launched.add(role)
+            self._start(role, events, cancel[role], messages, stop, kwargs)
+
+        # Step 1: Send to the primary, or straight to the fallback if the primary's circuit is open
+        if health[PRIMARY].allow():
+            launch(PRIMARY)
+            can_hedge = self.hedge_after > 0
+        else:
+            count("llm_hedges", reason="primary_open")
+            launch(FALLBACK)
+            can_hedge = False
+        deadline = None  # set once the primary call is actually sent
+
+        try:
+            while True:
+                # Step 2: Wait for the first token, hedging once the deadline passes
+                waiting = winner is None and can_hedge and deadline is not None
+                timeout = max(0.0, deadline - time.perf_counter()) if waiting else None
+                try:
+                    role, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    can_hedge = False
+                    if health[FALLBACK].allow():
+                        count("llm_hedges", reason="slow_primary")
+                        logger.info("no first token from %s after %.1fs, hedging", self.model_name, self.hedge_after)
+                        launch(FALLBACK)
+                    continue
+                if winner is not None and role != winner:
+                    continue
+                if kind == "issued":
+                    issued_at.setdefault(role, payload)
+                    if role == PRIMARY and deadline is None:
+                        deadline = payload + self.hedge_after
+                    continue
+
+                if kind == "error":
+                    running.discard(role)
+                    health[role].record_failure()
+                    errors.append(payload)
+                    if winner == role:
+                        raise payload
+                    # Fail over to the fallback when the primary breaks before its first token
+                    if role == PRIMARY and FALLBACK not in running and can_hedge and health[FALLBACK].allow():
+                        count("llm_hedges", reason="primary_error")
+                        can_hedge = False
+                        launch(FALLBACK)
+                    if not running:
+                        raise errors[0]
+                    continue
+
+                # Step 3: The first model to produce output wins; cancel the other
+                if winner is None:
+                    winner = role
+                    first_token_s = time.perf_counter() - issued_at.get(role, started)
+                    health[role].record_success(first_token_s)
+                    other = FALLBACK if role == PRIMARY else PRIMARY
+                    if other in running:
+                        cancel[other].set()
+                        if role == FALLBACK:
+                            health[PRIMARY].record_failure()  # missed the deadline and lost
+                    if len(launched) == 2:
+                        count("llm_hedge_wins", model=_model_name(self.primary if role == PRIMARY else self.fallback))
+                if kind == "done":
+                    return
+                yield payload
+        finally:
+            for event in cancel.values():
+                event.set()
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        chunks = []
+        for chunk in self._race(messages, stop, **kwargs):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            chunks.append(chunk)
+        return generate_from_stream(iter(chunks or [ChatGenerationChunk(message=AIMessageChunk(content=""))]))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # LangChain forwards each streamed chunk to on_llm_new_token itself
+        yield from self._race(messages, stop, **kwargs)
@@ -0,0 +1,356 @@
+"""
+Incremental FAISS index builder for every policy PDF in `data/`.
+
+Each PDF is hashed; unchanged PDFs are skipped entirely. Changed or new PDFs
+are parsed and split through the streaming `ingest` pipeline (the same
+chunks `load_policy_pdf` produces) and every chunk gets a content-hash id,
+so only chunks that did not exist before are embedded and chunks that
+disappeared are deleted from the index. Chunks of a changed PDF that kept
+their text keep their vectors but get fresh metadata, since the policy
+version and effective date are read from the cover page. The index is stored as
+`index.faiss` + `chunks.sqlite` (see `chunk_store`) and the state is kept in
+`manifest.json` next to them.
+
+Every update is written to a new version directory and published by
+switching the `CURRENT` pointer (see `index_versions`). Running apps pick it
+up without a restart. Builders hold a file lock on the index directory, so
+workers that start together build once.
+
+Policy facts for instant answers (see `policy_facts`) are extracted from
+the pages of changed PDFs and stored in `facts.json`.
+
+Each subfolder of `data/` is a policy set (PDFs directly in `data/` belong
+to `default`). Chunks record their set, and with more than one set a
+sub-index per set is written to `partitions/` so a query limited to some
+sets only searches those.
+
+The serving index type (see `ann_index`) is recorded in the manifest. When
+it changes and no PDF did, only `index.faiss` is rebuilt from the stored
+vectors and nothing is re-embedded. This is how an existing `faiss_index/`
+is migrated:
+
+    python index_builder.py --index-type hnsw
+
+Usage:
+    python index_builder.py [--data-dir data] [--index-dir faiss_index] [--workers N] [--batch-size 64]
+                            [--index-type auto|flat|flat-fp16|hnsw|hnsw-fp16|ivf|ivf-fp16|ivf-pq]
+"""
+import os
+import json
+import glob
+import shutil
+import hashlib
+import argparse
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain.vectorstores import FAISS
+
+from ann_index import ANN_INDEX, INDEX_TYPES
+from chunk_store import (
+    CHUNK_STORE_NAME, FAISS_INDEX_NAME, LEGACY_PICKLE_NAME, PARTITIONS_DIR, VECTORS_NAME,
+    has_chunk_store, load_vectorstore, read_master_index, save_vectorstore, write_partitions, write_serving_index,
+)
+from index_versions import build_lock, link_or_copy, new_version_dir, publish_version, resolve_index_dir
+from ingest import DEFAULT_BATCH_SIZE, BatchIndexWriter, IngestStats, iter_chunks, iter_parsed_pdfs
+from onnx_embeddings import document_embedding_info
+from policy_facts import FACTS_NAME, extract_facts, load_facts, save_facts
+
+MANIFEST_NAME = "manifest.json"
+# Files of an index built before versioning, directly in the index root
+LEGACY_FILES = (FAISS_INDEX_NAME, VECTORS_NAME, CHUNK_STORE_NAME, FACTS_NAME, MANIFEST_NAME, LEGACY_PICKLE_NAME)
+# 2: chunks carry policy set, version, effective date and section metadata
+MANIFEST_VERSION = 2
+
+
+def file_sha256(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(doc: Document) -> str:
+    """
+    Returns a stable id for a chunk derived from its policy set, source, page and text.
+
+    The same chunk always maps to the same id, which is what lets an update
+    keep the vectors of untouched chunks. The same PDF in two policy sets
+    gets distinct ids.
+    """
+    key = "\0".join([
+        str(doc.metadata.get("policy_set", "")),
+        os.path.basename(str(doc.metadata.get("source", ""))),
+        str(doc.metadata.get("page", "")),
+        doc.page_content,
+    ])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def load_manifest(index_dir: str) -> Optional[Dict]:
+    """Reads `manifest.json` from `index_dir`, or returns None if absent."""
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(index_dir: str, manifest: Dict) -> None:
+    """Writes the manifest atomically (temp file + rename)."""
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def list_policy_pdfs(data_dir: str) -> List[str]:
+    """Returns all PDFs under `data_dir`, sorted for a deterministic order."""
+    return sorted(glob.glob(os.path.join(data_dir, "**", "*.pdf"), recursive=True))
+
+
+def build_or_update_index(
+    data_dir: str,
+    index_dir: str,
+    embeddings,
+    embedding_model: str = "",
+    workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    index_type: str = ANN_INDEX,
+    embedding_backend: str = "torch",
+) -> Tuple[Optional[FAISS], Dict]:
+    """
+    Brings the FAISS index in `index_dir` in sync with the PDFs in `data_dir`.
+
+    An index without a manifest or chunk store (built before this builder
+    existed), with an older manifest version, or built with a different
+    embedding model, backend or quantization, is rebuilt from scratch once.
+    When nothing changed the index is not loaded at all. Otherwise the
+    result is published as a new version of `index_dir`.
+
+    Args:
+        data_dir (str): Directory scanned for policy PDFs.
+        index_dir (str): Versioned index root (see `index_versions`).
+        embeddings: LangChain embeddings used for new chunks.
+        embedding_model (str): Model name recorded in the manifest.
+        workers (int, optional): Processes used to parse changed PDFs.
+        batch_size (int): Chunks per embedding batch.
+        index_type (str): Serving index type (see `ann_index.INDEX_TYPES`).
+        embedding_backend (str): Backend of `embeddings` ("torch", "onnx" or
+            "onnx-int8"); what it embeds documents with is recorded in the
+            manifest (see `onnx_embeddings.document_embedding_info`).
+
+    Returns:
+        Tuple[Optional[FAISS], Dict]: The updated vector store (None when the
+        index on disk was already current) and a report with `added`,
+        `deleted`, `unchanged_docs` and `changed_docs` counts, the serving
+        `index_factory` (plus `migrated` when only the index type changed),
+        the live `index_version`, the number of `facts` and the ingestion
+        throughput.
+    """
+    # Workers starting together wait here; the later ones then find the index current
+    with build_lock(index_dir):
+        return _build_or_update_index(
+            data_dir, index_dir, embeddings, embedding_model, workers, batch_size, index_type, embedding_backend
+        )
+
+
+def _build_or_update_index(
+    data_dir: str,
+    index_dir: str,
+    embeddings,
+    embedding_model: str,
+    workers: Optional[int],
+    batch_size: int,
+    index_type: str,
+    embedding_backend: str,
+) -> Tuple[Optional[FAISS], Dict]:
+    live_version, live_dir = resolve_index_dir(index_dir)
+    manifest = load_manifest(live_dir)
+    vectors = document_embedding_info(embedding_backend)
+    if not (
+        manifest
+        and manifest.get("version") == MANIFEST_VERSION
+        and manifest.get("embedding_model") == embedding_model
+        and manifest.get("embedding_backend") == vectors["backend"]
+        and manifest.get("embedding_quantization") == vectors["quantization"]
+        and has_chunk_store(live_dir)
+    ):
+        manifest = None
+    old_docs: Dict[str, Dict] = manifest["documents"] if manifest else {}
+
+    report = {"added": 0, "refreshed": 0, "deleted": 0, "unchanged_docs": 0, "changed_docs": 0, "removed_docs": 0}
+    new_manifest_docs: Dict[str, Dict] = {}
+    stale_ids: List[str] = []
+
+    # Step 1: Hash every PDF and keep the unchanged ones as they are
+    changed, unchanged = {}, {}
+    for path in list_policy_pdfs(data_dir):
+        key = os.path.relpath(path, data_dir)
+        sha = file_sha256(path)
+        previous = old_docs.get(key)
+        if previous and previous["sha256"] == sha:
+            new_manifest_docs[key] = previous
+            unchanged[key] = path
+            report["unchanged_docs"] += 1
+        else:
+            changed[path] = (key, sha, previous)
+    present = set(new_manifest_docs).union(key for key, _, _ in changed.values())
+    removed = [key for key in old_docs if key not in present]
+
+    # Facts of unchanged PDFs are kept; all are re-extracted when facts.json is missing or outdated
+    old_facts = load_facts(live_dir) if manifest is not None else None
+    facts_stale = manifest is not None and old_facts is None
+    new_facts: Dict[str, List[Dict]] = {}
+    if facts_stale:
+        keys = {path: key for key, path in unchanged.items()}
+        for path, pages in iter_parsed_pdfs(list(keys), workers=workers, data_dir=data_dir):
+            new_facts[keys[path]] = extract_facts(pages)
+    elif old_facts:
+        new_facts = {key: old_facts[key] for key in unchanged if key in old_facts}
+
+    stats = IngestStats()
+    if manifest is not None and not changed and not removed:
+        # Indexes built before index types existed are flat
+        migrate = manifest.get("index_type", "flat") != index_type
+        if migrate or facts_stale:
+            master = read_master_index(live_dir) if migrate else None
+
+            def write_migrated(target_dir: str, version: str) -> None:
+                link_or_copy(os.path.join(live_dir, CHUNK_STORE_NAME), os.path.join(target_dir, CHUNK_STORE_NAME))
+                if migrate:
+                    manifest["index_type"] = index_type
+                    manifest["index_factory"] = write_serving_index(master, target_dir, index_type)
+                    write_partitions(master, target_dir, index_type)
+                else:
+                    names = [FAISS_INDEX_NAME, VECTORS_NAME]
+                    live_partitions = os.path.join(live_dir, PARTITIONS_DIR)
+                    if os.path.isdir(live_partitions):
+                        os.makedirs(os.path.join(target_dir, PARTITIONS_DIR))
+                        names += [os.path.join(PARTITIONS_DIR, name) for name in os.listdir(live_partitions)]
+                    for name in names:
+                        if os.path.exists(os.path.join(live_dir, name)):
+                            link_or_copy(os.path.join(live_dir, name), os.path.join(target_dir, name))
+                save_facts(target_dir, new_facts)
+                manifest["index_version"] = version
+                save_manifest(target_dir, manifest)
+
+            live_version = _publish_new_version(index_dir, write_migrated)
+            report["migrated"] = migrate
+        report["index_factory"] = manifest.get("index_factory", "Flat")
+        report["index_version"] = live_version
+        report["facts"] = sum(len(facts) for facts in new_facts.values())
+        report["ingest"] = stats.report()
+        return None, report
+    vectorstore = load_vectorstore(live_dir, embeddings) if manifest is not None else None
+
+    # Step 2: Stream changed PDFs through the ingestion pipeline, embedding new chunks only
+    writer = BatchIndexWriter(embeddings, vectorstore, batch_size=batch_size, stats=stats)
+    for path, pages in iter_parsed_pdfs(list(changed), workers=workers, data_dir=data_dir):
+        key, sha, previous = changed[path]
+        old_ids = set(previous["chunk_ids"]) if previous else set()
+        stats.pdfs += 1
+        stats.pages += len(pages)
+        new_facts[key] = extract_facts(pages)
+
+        ids, seen = [], set()
+        for doc in iter_chunks(pages):
+            cid = chunk_id(doc)
+            if cid in seen:  # identical chunk on the same page, keep one copy
+                continue
+            seen.add(cid)
+            ids.append(cid)
+            stats.chunks += 1
+            if cid not in old_ids:
+                writer.add(doc, cid)
+                report["added"] += 1
+            else:
+                # Same text and vector, but the cover page (version, effective date) may have changed
+                writer.vectorstore.docstore.delete([cid])
+                writer.vectorstore.docstore.add({cid: doc})
+                report["refreshed"] += 1
+
+        stale_ids.extend(old_ids.difference(ids))
+        new_manifest_docs[key] = {"sha256": sha, "chunk_ids": ids}
+        report["changed_docs"] += 1
+    writer.flush()
+    vectorstore = writer.vectorstore
+
+    # Step 3: Drop chunks of PDFs that were removed from data/
+    for key in removed:
+        stale_ids.extend(old_docs[key]["chunk_ids"])
+        report["removed_docs"] += 1
+
+    if vectorstore is None:
+        raise FileNotFoundError(f"No policy PDFs found in '{data_dir}'")
+
+    if stale_ids:
+        vectorstore.delete(stale_ids)
+        report["deleted"] = len(stale_ids)
+
+    # Step 4: Persist index, chunk store, facts and manifest as a new version, then publish it
+    def write_updated(target_dir: str, version: str) -> None:
+        report["index_factory"] = save_vectorstore(vectorstore, target_dir, index_type)
+        save_facts(target_dir, new_facts)
+        save_manifest(target_dir, {
+            "version": MANIFEST_VERSION,
+            "index_version": version,
+            "embedding_model": embedding_model,
+            "embedding_backend": vectors["backend"],
+            "embedding_quantization": vectors["quantization"],
+            "index_type": index_type,
+            "index_factory": report["index_factory"],
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            "documents": new_manifest_docs,
+        })
+
+    report["index_version"] = _publish_new_version(index_dir, write_updated)
+    report["facts"] = sum(len(facts) for facts in new_facts.values())
+    report["ingest"] = stats.report()
+    return vectorstore, report
+
+
+def _publish_new_version(index_dir: str, write: Callable[[str, str], None]) -> str:
+    """
+    Calls `write(target_dir, version)` for a fresh version directory and publishes it.
+
+    A failed write removes the partial directory and leaves the live version
+    untouched. The files of an old unversioned index in `index_dir` are
+    pruned like the oldest version, once enough newer versions exist.
+    """
+    version, target_dir = new_version_dir(index_dir)
+    try:
+        write(target_dir, version)
+    except BaseException:
+        shutil.rmtree(target_dir, ignore_errors=True)
+        raise
+    publish_version(index_dir, version, legacy_files=LEGACY_FILES)
+    return version
+
+
+if __name__ == "__main__":
+    from qa_chain import DATA_DIR, EMBEDDING_BACKEND, EMBEDDING_MODEL, INDEX_DIR, load_embeddings
+
+    parser = argparse.ArgumentParser(description="Incrementally (re)build the policy FAISS index.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="PDF parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--index-type", default=ANN_INDEX, choices=INDEX_TYPES, help="Serving FAISS index type")
+    args = parser.parse_args()
+
+    _, result = build_or_update_index(
+        args.data_dir,
+        args.index_dir,
+        load_embeddings(),
+        embedding_model=EMBEDDING_MODEL,
+        embedding_backend=EMBEDDING_BACKEND,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        index_type=args.index_type,
+    )
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,246 @@
+"""
+Versioned index directories with an atomic "current" pointer.
+
+Layout of `faiss_index/`:
+
+    CURRENT                  name of the live version (replaced atomically)
+    versions/<version>/      index.faiss, chunks.sqlite, manifest.json, ...
+
+The index builder never modifies a published version. Each update is
+written to a new `versions/<version>/` directory and goes live when
+`CURRENT` is renamed over. A crash mid-build leaves the old version
+serving. Old versions are pruned, keeping the newest `POLIBOT_INDEX_KEEP`.
+A lagging worker can still read the version it has open.
+
+Running engines poll `CURRENT` (`IndexWatcher`). When it changes they
+open the new version on a background thread. `VersionedRetriever` then
+switches to it between requests. A query that already started finishes
+on the version it began with, and each answer reports the version that
+served it.
+
+An index built before versioning (files directly in `faiss_index/`) is
+served as version "unversioned" until the next update publishes a
+versioned copy. Its files count as the oldest version and are pruned like
+one.
+
+Builds and publishes are serialized across processes by `build_lock`, so
+workers starting together do not race on the same index.
+"""
+import os
+import uuid
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+CURRENT_NAME = "CURRENT"
+VERSIONS_DIR = "versions"
+UNVERSIONED = "unversioned"
+KEEP_VERSIONS = int(os.getenv("POLIBOT_INDEX_KEEP", "3"))
+POLL_INTERVAL = float(os.getenv("POLIBOT_INDEX_POLL", "10"))
+LOCK_NAME = ".build.lock"
+
+
+def current_version(index_dir: str) -> Optional[str]:
+    """Reads the `CURRENT` pointer, or returns None for an unversioned index."""
+    try:
+        with open(os.path.join(index_dir, CURRENT_NAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_path(index_dir: str, version: str) -> str:
+    return os.path.join(index_dir, VERSIONS_DIR, version)
+
+
+def resolve_index_dir(index_dir: str) -> Tuple[str, str]:
+    """
+    Returns the live `(version, directory)` of `index_dir`.
+
+    For an index without a `CURRENT` pointer this is
+    `("unversioned", index_dir)`.
+    """
+    version = current_version(index_dir)
+    if version is None:
+        return UNVERSIONED, index_dir
+    return version, version_path(index_dir, version)
+
+
+def new_version_dir(index_dir: str) -> Tuple[str, str]:
+    """Creates an empty directory for the next version; names sort by build time."""
+    version = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+    path = version_path(index_dir, version)
+    os.makedirs(path)
+    return version, path
+
+
+@contextmanager
+def build_lock(index_dir: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on `index_dir` across processes (blocking).
+
+    Builders take it before reading the live version and release it after
+    publishing, so a second builder sees the first one's result.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, LOCK_NAME), "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def publish_version(
+    index_dir: str, version: str, keep: int = KEEP_VERSIONS, legacy_files: Sequence[str] = ()
+) -> None:
+    """Points `CURRENT` at `version` (temp file + rename) and prunes old versions."""
+    path = os.path.join(index_dir, CURRENT_NAME)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    logger.info("published index version %s", version)
+    prune_versions(index_dir, keep, legacy_files)
+
+
+def list_versions(index_dir: str) -> List[str]:
+    """All version names under `versions/`, oldest first."""
+    root = os.path.join(index_dir, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+
+
+def prune_versions(index_dir: str, keep: int = KEEP_VERSIONS, legacy_files: Sequence[str] = ()) -> List[str]:
+    """
+    Deletes all but the newest `keep` versions (never the current one).
+
+    `legacy_files` are the files of an unversioned index in `index_dir`.
+    They are treated as the oldest version, so workers still serving them
+    keep them until `keep` newer versions exist.
+    """
+    live = current_version(index_dir)
+    versions = list_versions(index_dir)
+    legacy = [name for name in legacy_files if os.path.exists(os.path.join(index_dir, name))]
+    if legacy and live is not None:
+        versions.insert(0, UNVERSIONED)
+    removed = []
+    for version in versions[:-keep] if keep > 0 else []:
+        if version == live:
+            continue
+        if version == UNVERSIONED:
+            for name in legacy:
+                os.remove(os.path.join(index_dir, name))
+        else:
+            shutil.rmtree(version_path(index_dir, version), ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+def link_or_copy(source: str, target: str) -> None:
+    """Hard-links an immutable file into a new version, copying across filesystems."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class VersionedRetriever(BaseRetriever):
+    """
+    Retriever that delegates to the current version's retriever.
+
+    `active` holds the `(retriever, version)` pair and `swap` replaces it
+    in one assignment. Each query reads it once, so it runs entirely on one
+    version. Returned documents carry `index_version` in their metadata.
+    """
+
+    active: Tuple[Any, str]
+
+    @property
+    def version(self) -> str:
+        return self.active[1]
+
+    def swap(self, retriever: BaseRetriever, version: str) -> None:
+        self.active = (retriever, version)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> List[Document]:
+        retriever, version = self.active
+        docs = retriever.invoke(query, config={"callbacks": run_manager.get_child()}, **kwargs)
+        for doc in docs:
+            doc.metadata["index_version"] = version
+        return docs
+
+
+class IndexWatcher:
+    """
+    Polls `CURRENT` and hands each new version to `on_change` on a daemon thread.
+
+    Args:
+        index_dir (str): The versioned index root.
+        version (str): Version the engine started with.
+        on_change (Callable): Called with `(version, path)`; may take a while
+            (it loads the new version) and should swap retrievers at the end.
+        interval (float): Seconds between polls.
+    """
+
+    def __init__(self, index_dir: str, version: str, on_change: Callable[[str, str], Any], interval: float = POLL_INTERVAL):
+        self.index_dir = index_dir
+        self.version = version
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """Loads the current version if it changed; returns True after a swap."""
+        version, path = resolve_index_dir(self.index_dir)
+        if version == self.version:
+            return False
+        try:
+            self.on_change(version, path)
+        except Exception:
+            # Retried on the next poll (e.g. the version was pruned or is unreadable)
+            logger.exception("failed to load index version %s", version)
+            return False
+        self.version = version
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self) -> "IndexWatcher":
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
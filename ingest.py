@@ -0,0 +1,164 @@
+"""
+Streaming ingestion pipeline for large collections of policy PDFs.
+
+PDFs are parsed into pages in a process pool (a bounded number of PDFs in
+flight at a time). Pages are split lazily into chunks, and the chunks are
+embedded in fixed-size batches that go straight into the FAISS index. Only
+one batch of chunks and a few parsed PDFs are held in memory at once. The
+main process encodes batches while the workers parse the next PDFs, which
+keeps every core busy.
+"""
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain.vectorstores import FAISS
+
+from policy_handler import DEFAULT_POLICY_SET, get_text_splitter, iter_policy_pages, policy_set_for
+
+DEFAULT_BATCH_SIZE = 64
+
+
+def parse_pdf(path: str, policy_set: str = DEFAULT_POLICY_SET) -> List[Document]:
+    """Parses one PDF into page documents (runs inside a worker process)."""
+    return list(iter_policy_pages(path, policy_set))
+
+
+def iter_parsed_pdfs(
+    paths: List[str],
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    data_dir: Optional[str] = None,
+) -> Iterator[Tuple[str, List[Document]]]:
+    """
+    Parses PDFs in parallel and yields `(path, pages)` in input order.
+
+    Args:
+        paths (List[str]): PDFs to parse.
+        workers (int, optional): Worker processes; defaults to the CPU count.
+            With one worker or one PDF, parsing happens in-process.
+        max_in_flight (int, optional): PDFs submitted but not yet consumed;
+            bounds memory. Defaults to `2 * workers`.
+        data_dir (str, optional): Root that policy sets are derived from
+            (see `policy_handler.policy_set_for`); without it every PDF is
+            in the default set.
+
+    Returns:
+        Iterator[Tuple[str, List[Document]]]: Parsed PDFs.
+    """
+    def policy_set(path: str) -> str:
+        return policy_set_for(path, data_dir) if data_dir else DEFAULT_POLICY_SET
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, parse_pdf(path, policy_set(path))
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    # "spawn" avoids forking a process that already holds torch/FAISS threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        remaining = iter(paths)
+        for path in remaining:
+            pending.append((path, pool.submit(parse_pdf, path, policy_set(path))))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(parse_pdf, next_path, policy_set(next_path))))
+            yield path, future.result()
+
+
+def iter_chunks(pages: Iterable[Document], splitter=None) -> Iterator[Document]:
+    """Lazily splits page documents into chunks, one page at a time."""
+    splitter = splitter or get_text_splitter()
+    for page in pages:
+        yield from splitter.split_documents([page])
+
+
+class IngestStats:
+    """Counters and timings for one ingestion run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pdfs = 0
+        self.pages = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.batches = 0
+        self.embed_seconds = 0.0
+
+    def report(self) -> Dict:
+        """Returns throughput in pages/sec and chunks/sec plus raw counts."""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "pdfs": self.pdfs,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "embedded_chunks": self.embedded,
+            "batches": self.batches,
+            "seconds": round(elapsed, 3),
+            "embed_seconds": round(self.embed_seconds, 3),
+            "pages_per_sec": round(self.pages / elapsed, 2),
+            "chunks_per_sec": round(self.chunks / elapsed, 2),
+            "embedded_chunks_per_sec": round(self.embedded / self.embed_seconds, 2) if self.embed_seconds else 0.0,
+        }
+
+
+class BatchIndexWriter:
+    """
+    Buffers chunks and adds them to a FAISS store in fixed-size batches.
+
+    Each full batch goes through one `embed_documents` call, so the
+    sentence-transformer encodes many chunks per forward pass. The vectors
+    are then appended to the index with `add_embeddings`.
+
+    Args:
+        embeddings: LangChain embeddings used for encoding.
+        vectorstore (FAISS, optional): Store to append to; created on the
+            first batch when None.
+        batch_size (int): Chunks per encoder call.
+        stats (IngestStats, optional): Counters to update.
+    """
+
+    def __init__(self, embeddings, vectorstore: Optional[FAISS] = None, batch_size: int = DEFAULT_BATCH_SIZE, stats: Optional[IngestStats] = None):
+        self.embeddings = embeddings
+        self.vectorstore = vectorstore
+        self.batch_size = batch_size
+        self.stats = stats or IngestStats()
+        self._docs: List[Document] = []
+        self._ids: List[str] = []
+
+    def add(self, doc: Document, doc_id: str) -> None:
+        self._docs.append(doc)
+        self._ids.append(doc_id)
+        if len(self._docs) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._docs:
+            return
+        texts = [doc.page_content for doc in self._docs]
+        metadatas = [doc.metadata for doc in self._docs]
+
+        started = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self.stats.embed_seconds += time.perf_counter() - started
+
+        pairs = list(zip(texts, vectors))
+        if self.vectorstore is None:
+            self.vectorstore = FAISS.from_embeddings(pairs, self.embeddings, metadatas=metadatas, ids=self._ids)
+        else:
+            self.vectorstore.add_embeddings(pairs, metadatas=metadatas, ids=self._ids)
+
+        self.stats.embedded += len(texts)
+        self.stats.batches += 1
+        self._docs, self._ids = [], []
@@ -0,0 +1,174 @@
+"""
+In-memory BM25 inverted index and hybrid (lexical + vector) retrieval.
+
+HR questions often hinge on exact terms ("CL", "LWP", "comp-off",
+"Vishaka") that MiniLM embeddings blur. The lexical index is built once
+from the chunk store. Every posting stores its full BM25 weight, so scoring
+a query is a few numpy scatter-adds with no per-query normalization.
+"""
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from telemetry import stage
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "the to what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cases and tokenizes text for the lexical index.
+
+    Hyphenated words are kept whole and also split into their parts, so
+    "comp-off" matches both "comp-off" and "comp off".
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "-" in token:
+            tokens.extend(part for part in token.split("-") if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunks keyed by their FAISS position.
+
+    Args:
+        k1 (float): Term-frequency saturation.
+        b (float): Length normalization.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = 0
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Tuple[int, str]], **kwargs) -> "BM25Index":
+        """
+        Builds the index from `(position, text)` pairs.
+
+        Args:
+            chunks (Iterable[Tuple[int, str]]): Chunk positions and texts.
+
+        Returns:
+            BM25Index: Index with precomputed posting weights.
+        """
+        index = cls(**kwargs)
+        term_freqs: Dict[str, Dict[int, int]] = defaultdict(dict)
+        lengths: Dict[int, int] = {}
+        for pos, text in chunks:
+            tokens = tokenize(text)
+            lengths[pos] = len(tokens)
+            for token in tokens:
+                term_freqs[token][pos] = term_freqs[token].get(pos, 0) + 1
+
+        index.size = (max(lengths) + 1) if lengths else 0
+        avg_len = (sum(lengths.values()) / len(lengths)) if lengths else 1.0
+        n_docs = len(lengths)
+        for term, postings in term_freqs.items():
+            positions = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            doc_len = np.fromiter((lengths[p] for p in postings), dtype=np.float32, count=len(postings))
+            idf = np.log(1.0 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            norm = tf + index.k1 * (1.0 - index.b + index.b * doc_len / avg_len)
+            weights = (idf * tf * (index.k1 + 1.0) / norm).astype(np.float32)
+            index._postings[term] = (positions, weights)
+        return index
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Returns the top-k `(position, score)` pairs for `query`."""
+        if not self.size:
+            return []
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self._postings.get(token)
+            if posting is not None:
+                np.add.at(scores, posting[0], posting[1])
+
+        hits = np.flatnonzero(scores)
+        if hits.size == 0:
+            return []
+        if hits.size > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(int(pos), float(scores[pos])) for pos in hits]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], rrf_k: int = 60) -> List[int]:
+    """
+    Fuses several ranked lists of positions with reciprocal rank fusion.
+
+    Args:
+        rankings (Sequence[Sequence[int]]): Best-first lists of positions.
+        rrf_k (int): RRF damping constant.
+
+    Returns:
+        List[int]: Positions ordered by fused score.
+    """
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking):
+            fused[pos] += 1.0 / (rrf_k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses FAISS vector hits with BM25 hits using reciprocal rank fusion.
+
+    Both retrievers fetch `k * candidate_factor` candidates. The fused top-k
+    positions are then read from the chunk store in a single query.
+
+    With several policy sets, `lexical_partitions` holds one BM25 index per
+    set instead of `lexical_index`. Each is keyed by row within its set, and
+    the rows map to positions through `vector_retriever.partitions`. A query
+    limited to some sets scores only their postings, and the per-set
+    rankings are fused by rank.
+    """
+
+    vector_retriever: Any
+    lexical_index: Any = None
+    lexical_partitions: Dict[str, Any] = {}
+    k: int = 6
+    candidate_factor: int = 3
+    rrf_k: int = 60
+
+    def lexical_search(self, query: str, k: int, policy_sets: Optional[Sequence[str]] = None) -> List[int]:
+        """Returns the positions of the top-k BM25 hits (of `policy_sets`), best first."""
+        selected = self.vector_retriever.select_partitions(policy_sets)
+        if selected is None and self.lexical_index is not None:
+            return [pos for pos, _ in self.lexical_index.search(query, k)]
+        # Each set has its own IDF, so scores are not comparable across sets; fuse by rank
+        rankings = []
+        for name in self.lexical_partitions if selected is None else selected:
+            positions = self.vector_retriever.partitions[name][1]
+            rankings.append([int(positions[row]) for row, _ in self.lexical_partitions[name].search(query, k)])
+        return reciprocal_rank_fusion(rankings, rrf_k=self.rrf_k)[:k]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, policy_sets: Optional[Sequence[str]] = None
+    ) -> List[Document]:
+        n_candidates = self.k * self.candidate_factor
+        with stage("embed_query"):
+            vector = self.vector_retriever.embeddings.embed_query(query)
+        vector_hits = self.vector_retriever.search_positions(vector, n_candidates, policy_sets)
+        with stage("bm25_search"):
+            lexical_hits = self.lexical_search(query, n_candidates, policy_sets)
+
+        fused = reciprocal_rank_fusion([vector_hits, lexical_hits], rrf_k=self.rrf_k)[: self.k]
+        with stage("chunk_fetch"):
+            return self.vector_retriever.store.get(fused)
@@ -0,0 +1,526 @@
+"""
+Shared dispatch layer in front of the chat models (Groq in production).
+
+Every LLM call of the process goes through a `DispatchedChatModel`, which
+adds four things to the wrapped model:
+
+1. Single-flight coalescing. When an identical prompt (same model,
+   messages and stop words) is already in flight, the new caller joins it
+   instead of sending another request. It receives the same tokens as they
+   arrive. This covers the burst after an HR announcement, when many
+   sessions ask the same question over the same retrieved context. If the
+   leading caller stops early (for example it lost a hedge race) while
+   others still follow the call, the call finishes on a thread of its own
+   for them; only an unshared call is aborted.
+2. Token-per-minute scheduling. Each model has a `TokenBucketScheduler`
+   sized to its Groq TPM limit (`POLIBOT_LLM_TPM`, 0 = unlimited) and capped
+   at `POLIBOT_LLM_CONCURRENCY` requests in flight. A call reserves
+   prompt + expected completion tokens before it is sent and settles the
+   reservation with the actual count afterwards. Waiting calls are served
+   by priority (interactive turns before background memory summaries),
+   then first come, first served.
+3. Retries. A 429, 5xx or connection error that happens before the first
+   token is retried with exponential backoff and full jitter. A 429 also
+   pauses the model's scheduler for the server's `retry-after`, so the
+   queue backs off as a whole.
+4. Connection pooling. `shared_http_client` returns one keep-alive httpx
+   client that every Groq client of the process shares.
+
+`on_call_issued` lets a caller learn when its call leaves the queue and is
+actually sent (the hedging deadline starts there).
+
+Metrics: `polibot_llm_queue_seconds` and `polibot_llm_model_seconds` per
+model, the `llm_queue` / `llm_model` stages of the turn trace, and the
+counters `polibot_llm_requests_total`, `polibot_llm_coalesced_total`,
+`polibot_llm_retries_total` and `polibot_llm_rate_limited_total`.
+"""
+import os
+import json
+import heapq
+import random
+import hashlib
+import logging
+import itertools
+import threading
+import time
+import contextvars
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage, get_buffer_string
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from telemetry import METRICS, count, stage
+from token_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Groq limits are per model; 0 disables the token budget
+LLM_TPM = int(os.getenv("POLIBOT_LLM_TPM", "12000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("POLIBOT_LLM_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("POLIBOT_LLM_RETRIES", "4"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("POLIBOT_LLM_QUEUE_TIMEOUT", "60"))
+LLM_POOL_SIZE = int(os.getenv("POLIBOT_LLM_POOL_SIZE", "20"))
+# Completion tokens reserved per call until the real count is known
+COMPLETION_ESTIMATE = 300
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+
+class LLMQueueTimeout(RuntimeError):
+    """Raised when a call waited longer than the queue timeout for its budget."""
+
+
+# ---------- Scheduling ----------
+class TokenBucketScheduler:
+    """
+    Token bucket with priority queues for one model.
+
+    The bucket holds up to one minute of budget and refills continuously.
+    `acquire` blocks until the caller is the best waiter (lowest priority
+    value, then oldest), enough tokens are available and a concurrency
+    slot is free.
+
+    Args:
+        tokens_per_minute (int): Budget; 0 means unlimited.
+        max_concurrency (int): Requests allowed in flight at once.
+    """
+
+    def __init__(self, tokens_per_minute: int = LLM_TPM, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        rate = self.tokens_per_minute / 60.0
+        self._tokens = min(float(self.tokens_per_minute), self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _wait_time(self, cost: int, now: float) -> float:
+        """Seconds until a call of `cost` tokens may start (0 = now)."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.tokens_per_minute <= 0 or self._tokens >= cost:
+            return 0.0
+        return (cost - self._tokens) / (self.tokens_per_minute / 60.0)
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE, timeout: float = LLM_QUEUE_TIMEOUT) -> int:
+        """
+        Waits for budget and a slot, then reserves `tokens`.
+
+        Returns:
+            int: The reserved amount, to be passed to `release`.
+
+        Raises:
+            LLMQueueTimeout: If no budget was available within `timeout` seconds.
+        """
+        cost = min(tokens, self.tokens_per_minute) if self.tokens_per_minute > 0 else 0
+        ticket = (priority, next(self._seq))
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = None
+                    if self._waiters[0] == ticket and self._in_flight < self.max_concurrency:
+                        wait = self._wait_time(cost, now)
+                        if wait == 0.0:
+                            self._tokens -= cost
+                            self._in_flight += 1
+                            return cost
+                    if now >= deadline:
+                        raise LLMQueueTimeout(f"no LLM budget within {timeout:.0f}s")
+                    self._cond.wait(min(deadline - now, wait) if wait else deadline - now)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def release(self, reserved: int, used: int) -> None:
+        """Frees the slot and corrects the bucket by the actual token count."""
+        with self._cond:
+            self._in_flight -= 1
+            if self.tokens_per_minute > 0:
+                self._tokens = min(float(self.tokens_per_minute), self._tokens + reserved - used)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Holds every waiter back for `seconds` (after a 429) and empties the bucket."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "tokens_per_minute": self.tokens_per_minute,
+                "available_tokens": round(self._tokens, 1),
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+            }
+
+
+_schedulers: Dict[str, TokenBucketScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(model_name: str) -> TokenBucketScheduler:
+    """Returns the process-wide scheduler of `model_name`, creating it on first use."""
+    with _schedulers_lock:
+        if model_name not in _schedulers:
+            _schedulers[model_name] = TokenBucketScheduler()
+        return _schedulers[model_name]
+
+
+def set_rate_limit(model_name: str, tokens_per_minute: int, max_concurrency: int = LLM_MAX_CONCURRENCY) -> None:
+    """Replaces the scheduler of `model_name` (e.g. for a higher paid-tier limit)."""
+    with _schedulers_lock:
+        _schedulers[model_name] = TokenBucketScheduler(tokens_per_minute, max_concurrency)
+
+
+def scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {name: scheduler.stats() for name, scheduler in schedulers.items()}
+
+
+# ---------- HTTP ----------
+_http_client = None
+_http_lock = threading.Lock()
+
+
+def shared_http_client():
+    """One pooled, keep-alive httpx client for every Groq client of the process."""
+    global _http_client
+    if _http_client is None:
+        with _http_lock:
+            if _http_client is None:
+                import httpx
+                _http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=LLM_POOL_SIZE,
+                        max_keepalive_connections=LLM_POOL_SIZE,
+                        keepalive_expiry=60.0,
+                    ),
+                    timeout=httpx.Timeout(60.0, connect=5.0),
+                )
+    return _http_client
+
+
+# ---------- Retries ----------
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for rate limits, server errors and connection failures."""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout")
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """The server's `retry-after` hint in seconds, if it sent one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, hint: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter, never shorter than the server's hint."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    return max(delay, hint + random.uniform(0, BACKOFF_BASE)) if hint else delay
+
+
+# ---------- Coalescing ----------
+class _LeaderGone(Exception):
+    """The leading caller stopped consuming before the call completed."""
+
+
+class _Flight:
+    """One in-flight model call whose chunks are shared with any followers."""
+
+    def __init__(self):
+        self.followers = 0  # guarded by _flights_lock
+        self._chunks: List[ChatGenerationChunk] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def publish(self, chunk: ChatGenerationChunk) -> None:
+        with self._cond:
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def follow(self) -> Iterator[ChatGenerationChunk]:
+        seen = 0
+        while True:
+            with self._cond:
+                while seen >= len(self._chunks) and not self._done:
+                    self._cond.wait()
+                chunks = self._chunks[seen:]
+                done, error = self._done, self._error
+            yield from chunks
+            seen += len(chunks)
+            if done and seen >= len(self._chunks):
+                if isinstance(error, GeneratorExit):
+                    if seen == 0:
+                        raise _LeaderGone()
+                    raise RuntimeError("shared LLM call was cancelled mid-stream")
+                if error is not None:
+                    raise error
+                return
+
+
+_issue_callback: contextvars.ContextVar = contextvars.ContextVar("polibot_llm_issue_callback", default=None)
+
+
+def on_call_issued(callback: Optional[Callable[[], None]]) -> None:
+    """
+    Calls `callback` when a dispatched call of the current context is sent.
+
+    That is after its TPM reservation is granted (again on each retry), or
+    right away when it joins an identical call already in flight.
+    """
+    _issue_callback.set(callback)
+
+
+def _notify_issued() -> None:
+    callback = _issue_callback.get()
+    if callback is not None:
+        callback()
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def _unregister(key: str, flight: _Flight) -> None:
+    with _flights_lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+
+
+def _abandon_if_unshared(key: str, flight: _Flight) -> bool:
+    """Unregisters `flight` if nobody follows it, atomically so nobody can join it afterwards."""
+    with _flights_lock:
+        if flight.followers:
+            return False
+        if _flights.get(key) is flight:
+            del _flights[key]
+        return True
+
+
+# ---------- Model wrapper ----------
+def iter_model_chunks(
+    model: BaseChatModel, messages: List[BaseMessage], stop: Optional[List[str]], streaming: bool, **kwargs: Any
+) -> Iterator[ChatGenerationChunk]:
+    """Calls `model` without callbacks, streaming when asked and supported, else as one chunk."""
+    if streaming and type(model)._stream is not BaseChatModel._stream:
+        yield from model._stream(messages, stop=stop, **kwargs)
+        return
+    message = model._generate(messages, stop=stop, **kwargs).generations[0].message
+    yield ChatGenerationChunk(
+        message=AIMessageChunk(content=message.content, usage_metadata=getattr(message, "usage_metadata", None))
+    )
+
+
+class DispatchedChatModel(BaseChatModel):
+    """
+    Chat model that coalesces, schedules and retries calls to `inner`.
+
+    Args:
+        inner (BaseChatModel): The real model (ChatGroq, or a mock in benchmarks).
+        priority (int): `PRIORITY_INTERACTIVE` or `PRIORITY_BACKGROUND`.
+        streaming (bool): Stream tokens from `inner` (needed for the answer model).
+        max_retries (int): Retries of a failed call before the first token.
+        coalesce (bool): Share identical in-flight calls.
+    """
+
+    inner: BaseChatModel
+    priority: int = PRIORITY_INTERACTIVE
+    streaming: bool = False
+    max_retries: int = LLM_MAX_RETRIES
+    coalesce: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return f"dispatched-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {**self.inner._identifying_params, "priority": self.priority}
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.inner, "model_name", None) or self.inner._llm_type
+
+    def _flight_key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            [self.inner._identifying_params, stop, sorted(kwargs.items()), [(m.type, m.content) for m in messages]],
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _dispatch(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if not self.coalesce:
+            yield from self._call_with_retries(messages, stop, **kwargs)
+            return
+
+        key = self._flight_key(messages, stop, kwargs)
+        while True:
+            with _flights_lock:
+                flight = _flights.get(key)
+                leading = flight is None
+                if leading:
+                    flight = _flights[key] = _Flight()
+                else:
+                    flight.followers += 1
+            if leading:
+                yield from self._lead(key, flight, messages, stop, **kwargs)
+                return
+            count("llm_coalesced", model=self.model_name)
+            _notify_issued()
+            try:
+                yield from flight.follow()
+                return
+            except _LeaderGone:
+                continue
+            finally:
+                with _flights_lock:
+                    flight.followers -= 1
+
+    def _lead(self, key: str, flight: _Flight, messages, stop, **kwargs) -> Iterator[ChatGenerationChunk]:
+        calls = self._call_with_retries(messages, stop, **kwargs)
+        try:
+            for chunk in calls:
+                flight.publish(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The consumer stopped early; other sessions may still be following this call
+            if not _abandon_if_unshared(key, flight):
+                threading.Thread(
+                    target=self._finish_detached, args=(key, flight, calls), name="llm-detached", daemon=True
+                ).start()
+                return
+            calls.close()
+            flight.finish(GeneratorExit())
+            raise
+        except BaseException as exc:
+            _unregister(key, flight)
+            flight.finish(exc)
+            raise
+        _unregister(key, flight)
+        flight.finish()
+
+    @staticmethod
+    def _finish_detached(key: str, flight: _Flight, calls: Iterator[ChatGenerationChunk]) -> None:
+        """Completes a call whose leader left, for its followers; stops once they all left too."""
+        try:
+            for chunk in calls:
+                flight.publish(chunk)
+                if _abandon_if_unshared(key, flight):
+                    calls.close()
+                    flight.finish(GeneratorExit())
+                    return
+        except Exception as exc:
+            _unregister(key, flight)
+            flight.finish(exc)
+            return
+        _unregister(key, flight)
+        flight.finish()
+
+    def _call_with_retries(self, messages, stop, **kwargs) -> Iterator[ChatGenerationChunk]:
+        scheduler = get_scheduler(self.model_name)
+        prompt_tokens = estimate_tokens(get_buffer_string(messages))
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            with stage("llm_queue"):
+                reserved = scheduler.acquire(prompt_tokens + COMPLETION_ESTIMATE, self.priority)
+            METRICS.observe("polibot_llm_queue_seconds", time.perf_counter() - started, model=self.model_name)
+            _notify_issued()
+
+            started, parts, completed = time.perf_counter(), [], False
+            try:
+                with stage("llm_model"):
+                    for chunk in iter_model_chunks(self.inner, messages, stop, self.streaming, **kwargs):
+                        parts.append(chunk.text)
+                        yield chunk
+                completed = True
+                METRICS.observe("polibot_llm_model_seconds", time.perf_counter() - started, model=self.model_name)
+                count("llm_requests", model=self.model_name, outcome="ok")
+                return
+            except Exception as exc:
+                if parts or attempt >= self.max_retries or not is_retryable(exc):
+                    count("llm_requests", model=self.model_name, outcome="error")
+                    raise
+                hint = retry_after_seconds(exc)
+                delay = backoff_delay(attempt, hint)
+                if _status_code(exc) == 429:
+                    count("llm_rate_limited", model=self.model_name)
+                    scheduler.pause(hint or delay)
+                count("llm_retries", model=self.model_name)
+                logger.warning("LLM call to %s failed (%s), retry %d in %.2fs", self.model_name, exc, attempt + 1, delay)
+            finally:
+                # A call rejected before any output is not billed against the TPM limit
+                used = prompt_tokens + estimate_tokens("".join(parts)) if parts or completed else 0
+                scheduler.release(reserved, used)
+            time.sleep(delay)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        chunks = []
+        for chunk in self._dispatch(messages, stop, **kwargs):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            chunks.append(chunk)
+        return generate_from_stream(iter(chunks or [ChatGenerationChunk(message=AIMessageChunk(content=""))]))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # LangChain forwards each streamed chunk to on_llm_new_token itself
+        yield from self._dispatch(messages, stop, **kwargs)
+
+
+def dispatched(llm: BaseChatModel, priority: int = PRIORITY_INTERACTIVE, streaming: bool = False) -> DispatchedChatModel:
+    """Wraps `llm` in the dispatch layer (an already wrapped model gets a new priority)."""
+    if isinstance(llm, DispatchedChatModel):
+        llm = llm.inner
+    return DispatchedChatModel(inner=llm, priority=priority, streaming=streaming)
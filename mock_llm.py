@@ -0,0 +1,142 @@
+"""
+Deterministic, offline stand-in for `ChatGroq`.
+
+`MockChatModel` waits `first_token_latency` seconds, then emits words at
+`tokens_per_second` through the normal LangChain callbacks. Streaming,
+the answer-token filter and the chains behave as they do against Groq, but
+no network or API key is needed. The reply is always derived from the
+prompt, so repeated runs produce identical answers:
+
+- condense prompts ("Standalone question:") echo the follow-up question
+- everything else gets `answer_tokens` words taken from the prompt
+
+Every call is recorded (prompt/completion token estimates, model time) so
+benchmarks can report what would have been sent to the real model.
+
+`slow_every` / `slow_latency` make every n-th call wait longer for its first
+token, like the occasional slow Groq response (for testing hedging).
+"""
+import time
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, get_buffer_string
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from token_utils import estimate_tokens
+
+
+class MockChatModel(BaseChatModel):
+    """
+    Chat model with configurable latency and token rate.
+
+    Args:
+        model_name (str): Reported model name (e.g. the Groq model it replaces).
+        first_token_latency (float): Seconds before the first token.
+        tokens_per_second (float): Emission rate after the first token (0 = instant).
+        answer_tokens (int): Number of words in a generated answer.
+        slow_every (int): Every n-th call is slow (0 = never).
+        slow_latency (float): First-token latency of a slow call.
+    """
+
+    model_name: str = "mock"
+    first_token_latency: float = 0.3
+    tokens_per_second: float = 200.0
+    answer_tokens: int = 80
+    slow_every: int = 0
+    slow_latency: float = 5.0
+
+    _started_calls: int = PrivateAttr(default=0)
+    _calls: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    # ---------- Recorded calls ----------
+    @property
+    def calls(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._calls)
+
+    def reset_calls(self) -> None:
+        with self._lock:
+            self._calls.clear()
+
+    # ---------- Generation ----------
+    def _reply(self, prompt: str) -> List[str]:
+        if "Standalone question:" in prompt and "Follow-Up Input:" in prompt:
+            follow_up = prompt.split("Follow-Up Input:", 1)[1].split("Standalone question:", 1)[0]
+            return follow_up.split()
+        source = prompt.split("Context:", 1)[-1].split() or ["ok"]
+        words = [source[i % len(source)] for i in range(self.answer_tokens)]
+        return words
+
+    def _tokens(self, messages: List[BaseMessage]) -> Iterator[str]:
+        prompt = get_buffer_string(messages)
+        started = time.perf_counter()
+        words = self._reply(prompt)
+        with self._lock:
+            self._started_calls += 1
+            slow = self.slow_every > 0 and self._started_calls % self.slow_every == 0
+        latency = self.slow_latency if slow else self.first_token_latency
+        if latency > 0:
+            time.sleep(latency)
+        first_token = time.perf_counter() - started
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        for i, word in enumerate(words):
+            if i and delay:
+                time.sleep(delay)
+            yield word if i == 0 else " " + word
+        with self._lock:
+            self._calls.append({
+                "slow": slow,
+                "prompt_tokens": estimate_tokens(prompt),
+                "completion_tokens": len(words),
+                "first_token_s": first_token,
+                "model_s": time.perf_counter() - started,
+            })
+
+    def _usage(self, messages: List[BaseMessage], text: str) -> Dict[str, int]:
+        prompt_tokens = estimate_tokens(get_buffer_string(messages))
+        completion_tokens = len(text.split())
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        parts = []
+        for token in self._tokens(messages):
+            parts.append(token)
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+        text = "".join(parts)
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # LangChain forwards each streamed chunk to on_llm_new_token itself
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,70 @@
+"""
+Local copies of the Hugging Face models the bot needs.
+
+`python prewarm.py` downloads each model once into `POLIBOT_MODEL_DIR`
+(default `models/`), e.g. `models/sentence-transformers__all-MiniLM-L6-v2`.
+At runtime `resolve_model` returns that directory instead of the hub id and
+switches the hub libraries to offline mode, so loading a model never touches
+the network. Models that were not vendored are still fetched from the hub
+as before.
+"""
+import os
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.getenv("POLIBOT_MODEL_DIR", "models")
+
+# Weights in other formats that sentence-transformers never loads on CPU
+_SKIP_PATTERNS = ["*.h5", "*.msgpack", "*.ot", "openvino/*", "onnx/*", "*.onnx"]
+
+
+def local_model_path(model_name: str, model_dir: Optional[str] = None) -> str:
+    """Returns where `model_name` is (or would be) vendored under `model_dir`."""
+    return os.path.join(model_dir or MODEL_DIR, model_name.replace("/", "__"))
+
+
+def is_vendored(model_name: str, model_dir: Optional[str] = None) -> bool:
+    return os.path.exists(os.path.join(local_model_path(model_name, model_dir), "config.json"))
+
+
+def resolve_model(model_name: str, model_dir: Optional[str] = None) -> str:
+    """
+    Returns the local directory of a vendored model, else the hub id.
+
+    Args:
+        model_name (str): Hub id, e.g. "sentence-transformers/all-MiniLM-L6-v2".
+        model_dir (str, optional): Directory populated by `vendor_model`;
+            defaults to `MODEL_DIR`.
+
+    Returns:
+        str: Path or hub id to pass to the model loader.
+    """
+    if is_vendored(model_name, model_dir):
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+        return local_model_path(model_name, model_dir)
+    logger.info("model %s not vendored in %s, loading from the hub", model_name, model_dir or MODEL_DIR)
+    return model_name
+
+
+def vendor_model(model_name: str, model_dir: Optional[str] = None, include_onnx: bool = False) -> str:
+    """
+    Downloads `model_name` from the hub into `model_dir` (no-op if present).
+
+    Args:
+        model_name (str): Hub id.
+        model_dir (str, optional): Destination root; defaults to `MODEL_DIR`.
+        include_onnx (bool): Also fetch the ONNX exports, if the repo has any.
+
+    Returns:
+        str: The local model directory.
+    """
+    from huggingface_hub import snapshot_download
+
+    path = local_model_path(model_name, model_dir)
+    skip = [p for p in _SKIP_PATTERNS if not (include_onnx and "onnx" in p)]
+    snapshot_download(repo_id=model_name, local_dir=path, ignore_patterns=skip)
+    return path
+
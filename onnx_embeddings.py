@@ -0,0 +1,195 @@
+"""
+ONNX Runtime backend for the MiniLM sentence embeddings.
+
+`OnnxMiniLMEmbeddings` reproduces the sentence-transformers pipeline of
+all-MiniLM-L6-v2 without torch:
+
+    WordPiece tokenize (max 256 tokens) -> transformer (ONNX) ->
+    mean pooling over the attention mask -> L2 normalize
+
+so its vectors can be searched against the existing `faiss_index/`. The
+fp32 export matches the PyTorch vectors to float precision. The int8
+(dynamically quantized) model trades a little accuracy for speed and
+memory. It is only used for queries: documents are always embedded with
+the fp32 model, so the index does not depend on quantization error.
+`document_embedding_info` describes the vectors stored in an index, and
+the index builder rebuilds when that changes. `AGREEMENT_TOLERANCE` gives the minimum cosine similarity to the
+PyTorch vectors each backend is expected to keep
+(`bench_embeddings.py` checks it).
+
+The model files come from the hub repo's `onnx/` folder, which
+`python prewarm.py --with-onnx` vendors into `models/`. If no int8 model is
+shipped, one is quantized from `onnx/model.onnx` on first use.
+
+Requires the optional packages `onnxruntime` and `tokenizers`.
+"""
+import os
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from model_store import local_model_path, vendor_model, is_vendored
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+MAX_SEQ_LENGTH = 256  # sentence_bert_config.json of all-MiniLM-L6-v2
+# Minimum cosine similarity to the PyTorch vectors, per backend
+AGREEMENT_TOLERANCE = {"onnx": 0.999, "onnx-int8": 0.97}
+
+ONNX_FP32_FILE = os.path.join("onnx", "model.onnx")
+# Prefer the hub's int8 export for AVX2 (runs on any x86-64 host of the last decade)
+ONNX_INT8_FILES = (os.path.join("onnx", "model_quint8_avx2.onnx"), os.path.join("onnx", "model_int8_dynamic.onnx"))
+
+
+def _quantize(model_dir: str) -> str:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(model_dir, ONNX_FP32_FILE)
+    target = os.path.join(model_dir, ONNX_INT8_FILES[-1])
+    tmp_path = target + ".tmp"
+    quantize_dynamic(source, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, target)
+    return target
+
+
+def document_embedding_info(backend: str) -> dict:
+    """Backend and quantization that embed the *documents* for `backend` (int8 is query-only)."""
+    if backend == "onnx-int8":
+        return {"backend": "onnx", "quantization": "fp32"}
+    return {"backend": backend, "quantization": "fp32"}
+
+
+def find_onnx_model(model_dir: str, quantized: bool) -> str:
+    """Returns the ONNX file to load from a vendored model directory."""
+    if not quantized:
+        path = os.path.join(model_dir, ONNX_FP32_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run `python prewarm.py --with-onnx`")
+        return path
+    for name in ONNX_INT8_FILES:
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            return path
+    logger.info("no int8 ONNX model in %s, quantizing %s", model_dir, ONNX_FP32_FILE)
+    return _quantize(model_dir)
+
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """
+    LangChain embeddings running a MiniLM ONNX export on ONNX Runtime (CPU).
+
+    Args:
+        model_name (str): Hub id of the sentence-transformers model.
+        quantized (bool): Embed queries with the int8 model instead of fp32;
+            documents use fp32 either way (loaded on first use).
+        batch_size (int): Texts per forward pass in `embed_documents`.
+        threads (int, optional): ONNX Runtime intra-op threads (default: ORT's choice).
+        model_dir (str, optional): Vendored model directory; defaults to `models/`.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        quantized: bool = False,
+        batch_size: int = 32,
+        threads: Optional[int] = None,
+        model_dir: Optional[str] = None,
+    ):
+        from tokenizers import Tokenizer
+
+        if not is_vendored(model_name, model_dir):
+            vendor_model(model_name, model_dir, include_onnx=True)
+        path = local_model_path(model_name, model_dir)
+
+        self.model_name = model_name
+        self.quantized = quantized
+        self.batch_size = batch_size
+        self.model_path = find_onnx_model(path, quantized)
+        self._path = path
+        self._threads = threads
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self._tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self._tokenizer_lock = threading.Lock()  # encode_batch on a shared tokenizer
+
+        self._session = self._load_session(self.model_path)
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._document_session = None if quantized else self._session
+        self._session_lock = threading.Lock()
+
+    def _load_session(self, model_path: str):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self._threads:
+            options.intra_op_num_threads = self._threads
+        return ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    def _documents_session(self):
+        with self._session_lock:
+            if self._document_session is None:
+                self._document_session = self._load_session(find_onnx_model(self._path, quantized=False))
+            return self._document_session
+
+    def _encode(self, texts: List[str], session=None) -> np.ndarray:
+        with self._tokenizer_lock:
+            encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feed["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = (session or self._session).run(None, feed)[0]  # (batch, seq, dim)
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Batch texts of similar length together to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        session = self._documents_session()
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self._encode([texts[i] for i in batch], session)
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+            vectors[batch] = encoded
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def create_embeddings(model_name: str, backend: str = "torch", batch_size: int = 32):
+    """
+    Builds the embeddings for `backend` ("torch", "onnx" or "onnx-int8").
+
+    Args:
+        model_name (str): Hub id of the sentence-transformers model.
+        backend (str): Which implementation to use.
+        batch_size (int): Texts per forward pass for the ONNX backends.
+
+    Returns:
+        Embeddings: A LangChain embeddings object.
+    """
+    if backend == "torch":
+        from langchain.embeddings import HuggingFaceEmbeddings
+        from model_store import resolve_model
+        return HuggingFaceEmbeddings(model_name=resolve_model(model_name))
+    if backend in ("onnx", "onnx-int8"):
+        threads = int(os.getenv("POLIBOT_ONNX_THREADS", "0")) or None
+        return OnnxMiniLMEmbeddings(
+            model_name, quantized=backend == "onnx-int8", batch_size=batch_size, threads=threads
+        )
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
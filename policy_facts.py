@@ -0,0 +1,331 @@
+"""
+Structured policy facts extracted at index time, and a fast matcher that
+answers numeric lookups from them without retrieval or an LLM call.
+
+Many questions are plain lookups: how many casual leaves, the office
+hours, the lunch break. When a PDF is indexed, its pages are scanned once
+for three kinds of facts, each kept with its source PDF and page:
+
+- key-value lines with a number, time or weekday in the value
+  ("Lunch Break time: 45 minutes (1:00 PM to 1:45 PM)")
+- table rows whose second cell is a duration ("Paternity Leaves" / "2 days")
+- leave entitlements in running text ("7 Casual Leave [CL] & 7 Sick Leave")
+
+Each fact keeps the full text of its item, so conditions that follow the
+value ("... should be pre-approved by your Technical Project Manager") are
+quoted in the answer. A label that appears with different values (e.g. the
+owner of two policies) is ambiguous and is dropped. The facts are stored in
+`facts.json` next to the index.
+
+At query time `FactTable.match` compares the content words of the question
+with the fact labels, after synonyms and simple stemming ("CL" -> casual
+leave, "timings" -> hours). A question is answered only when every content
+word of it appears in one fact label and that label is the single best
+match. Questions with other qualifiers ("... for trainees") or broad ones
+("explain", "policy", "conditions", "eligible") go through the normal RAG
+path. The answer cites the
+page, as the QA prompt does. Facts belong to the policy set of their PDF,
+and a lookup limited to some sets only matches their facts. The fact-path
+hit rate is in `stats()` and `polibot_fact_path_total{result}`.
+"""
+import os
+import re
+import json
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from langchain.schema import Document
+
+from policy_handler import DEFAULT_POLICY_SET
+
+logger = logging.getLogger(__name__)
+
+FACTS_NAME = "facts.json"
+FACTS_VERSION = 3
+FACTS_ENABLED = os.getenv("POLIBOT_FACTS", "1") == "1"
+# Share of a fact label's words the question must contain
+FACT_MIN_COVERAGE = float(os.getenv("POLIBOT_FACT_MIN_COVERAGE", "0.5"))
+
+MAX_LABEL_WORDS = 5
+MAX_VALUE_CHARS = 240
+# Longer items are left to retrieval rather than quoted whole
+MAX_TEXT_CHARS = 800
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_KEY_VALUE_RE = re.compile(r"^\s*(?:\d{1,2}[.)]\s*)?([A-Za-z][A-Za-z /&()-]{1,60}?)\s*:\s*(\S.*)$")
+_TABLE_LABEL_RE = re.compile(r"^\s*([A-Za-z][A-Za-z ]{2,40}?)\s*$")
+_TABLE_VALUE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?\s*(?:days?|weeks?|months?|hours?))\s*$", re.IGNORECASE)
+_FACTUAL_VALUE_RE = re.compile(
+    r"\d|\b(?:mon|tues|wednes|thurs|fri|satur|sun)day\b|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b",
+    re.IGNORECASE,
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+_NEW_ITEM_RE = re.compile(r"^\s*(?:\d{1,2}[.)]|[•\-–*]|[A-Z]\.)\s|^\s*[A-Za-z][A-Za-z /&()-]{1,60}:")
+
+# (label, pattern): the first group is the value
+_TEXT_PATTERNS = [
+    ("Total leaves per year", re.compile(r"\b(\d+)\s+Leaves\s+in\s+a\s+year", re.IGNORECASE)),
+    ("Casual leaves per year", re.compile(r"\b(\d+)\s+Casual\s+Leaves?\b", re.IGNORECASE)),
+    ("Sick leaves per year", re.compile(r"\b(\d+)\s+Sick\s+Leaves?\b", re.IGNORECASE)),
+    ("Earned leaves per year", re.compile(r"\b(\d+)\s+(?:leaves\s+are\s+termed\s+as\s+)?Earned\s+Leaves?\b", re.IGNORECASE)),
+    ("Notice period", re.compile(r"\bnotice\s+period\s+(?:of|is)\s+(\d+\s*(?:days|weeks|months?))", re.IGNORECASE)),
+]
+
+# Question words that carry no meaning for the lookup
+_FILLER = frozenset(
+    "a an the is are was be do does did i we you my our me us of in on at to for from by with and or "
+    "what whats which who when how many much long number total overall per each every year yearly annual "
+    "annually get gets given allowed entitled can could should would will employee employees member members "
+    "staff company office psspl please tell know want there any".split()
+)
+# Questions asking for an explanation rather than a value
+_BROAD = frozenset(
+    "about explain describe detail details elaborate why policy policies rule rules process procedure "
+    "more difference compare example condition conditions eligible eligibility".split()
+)
+_SYNONYMS = {
+    "cl": ["casual", "leave"],
+    "sl": ["sick", "leave"],
+    "el": ["earned", "leave"],
+    "pl": ["earned", "leave"],
+    "wfh": ["work", "home"],
+    "workday": ["work", "day"],
+    "timing": ["hour"],
+    "time": ["hour"],
+    "duration": ["hour"],
+    "working": ["work"],
+    "shifts": ["shift"],
+    "holidays": ["holiday"],
+}
+
+
+def _stem(word: str) -> str:
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def content_words(text: str) -> Set[str]:
+    """Lower-cased, stemmed, synonym-expanded words of `text` without filler."""
+    words: Set[str] = set()
+    for raw in _WORD_RE.findall(text.lower()):
+        for word in _SYNONYMS.get(raw) or _SYNONYMS.get(_stem(raw)) or [_stem(raw)]:
+            if word not in _FILLER:
+                words.add(word)
+    return words
+
+
+def _fact(label: str, value: str, text: str, page: Document) -> Dict:
+    return {
+        "label": label.strip(),
+        "value": value.strip().rstrip(",;"),
+        "text": " ".join(text.split()),
+        "source": page.metadata.get("source"),
+        "page": page.metadata.get("page"),
+        "policy_set": page.metadata.get("policy_set", DEFAULT_POLICY_SET),
+    }
+
+
+def _item_text(lines: List[str]) -> str:
+    """Joins wrapped lines until the item ends (a blank line or the next item)."""
+    text = lines[0].strip()
+    for line in lines[1:]:
+        if not line.strip() or _NEW_ITEM_RE.match(line):
+            break
+        text = f"{text} {line.strip()}"
+    return text
+
+
+def _first_sentence(lines: List[str]) -> str:
+    """Joins wrapped lines until the first sentence ends (or the next item starts)."""
+    value = lines[0].strip()
+    for line in lines[1:]:
+        if _SENTENCE_END_RE.search(value) or value.endswith(".") or not line.strip() or _NEW_ITEM_RE.match(line):
+            break
+        value = f"{value} {line.strip()}"
+    value = _SENTENCE_END_RE.split(value)[0]
+    return value[:MAX_VALUE_CHARS]
+
+
+def _page_facts(page: Document) -> Iterable[Dict]:
+    lines = page.page_content.splitlines()
+    for i, line in enumerate(lines):
+        # Key-value lines ("Normal Work Duration: 9 hours")
+        match = _KEY_VALUE_RE.match(line)
+        if match and len(match.group(1).split()) <= MAX_LABEL_WORDS:
+            value = _first_sentence([match.group(2)] + lines[i + 1:])
+            text = f"{match.group(1)}: {_item_text([match.group(2)] + lines[i + 1:])}"
+            if _FACTUAL_VALUE_RE.search(value) and len(text) <= MAX_TEXT_CHARS:
+                yield _fact(match.group(1), value, text, page)
+            continue
+
+        # Table rows: a short label cell followed by a duration cell
+        label = _TABLE_LABEL_RE.match(line)
+        value = _TABLE_VALUE_RE.match(lines[i + 1]) if i + 1 < len(lines) else None
+        if label and value and len(label.group(1).split()) <= MAX_LABEL_WORDS:
+            yield _fact(label.group(1), value.group(1), f"{label.group(1)}: {value.group(1)}", page)
+
+    # Entitlements in running text
+    text = " ".join(page.page_content.split())
+    for label, pattern in _TEXT_PATTERNS:
+        for match in pattern.finditer(text):
+            start = text.rfind(". ", 0, match.start()) + 1
+            end = text.find(". ", match.end())
+            yield _fact(label, match.group(1), text[start:end if end >= 0 else None], page)
+
+
+def extract_facts(pages: Iterable[Document]) -> List[Dict]:
+    """
+    Extracts the facts of one policy document.
+
+    Args:
+        pages (Iterable[Document]): Page documents (see `policy_handler.iter_policy_pages`).
+
+    Returns:
+        List[Dict]: Facts with `label`, `value`, `text`, `source`, `page` and `policy_set`.
+    """
+    facts = []
+    for page in pages:
+        facts.extend(_page_facts(page))
+    return facts
+
+
+def save_facts(index_dir: str, documents: Dict[str, List[Dict]]) -> None:
+    """Writes `facts.json` (facts per PDF key, as in the manifest) atomically."""
+    path = os.path.join(index_dir, FACTS_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": FACTS_VERSION, "documents": documents}, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def load_facts(index_dir: str) -> Optional[Dict[str, List[Dict]]]:
+    """Reads the facts per PDF key, or None if absent or from an older extractor."""
+    path = os.path.join(index_dir, FACTS_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != FACTS_VERSION:
+        return None
+    return data["documents"]
+
+
+def read_facts(index_dir: str) -> List[Dict]:
+    """All facts of an index directory (empty if it has none)."""
+    documents = load_facts(index_dir) or {}
+    return [fact for facts in documents.values() for fact in facts]
+
+
+def _unambiguous(facts: Iterable[Dict]) -> List[Dict]:
+    """Keeps one fact per label and policy set; labels seen with different values are dropped."""
+    by_label: Dict[tuple, Dict] = {}
+    conflicting: Set[tuple] = set()
+    for fact in facts:
+        key = (fact.get("policy_set", DEFAULT_POLICY_SET), " ".join(sorted(content_words(fact["label"]))))
+        if not key[1]:
+            continue
+        seen = by_label.get(key)
+        if seen is not None and seen["value"].lower() != fact["value"].lower():
+            conflicting.add(key)
+        by_label.setdefault(key, fact)
+    return [fact for key, fact in by_label.items() if key not in conflicting]
+
+
+class FactTable:
+    """
+    In-memory fact table with a conservative intent matcher.
+
+    Thread-safe; `replace` swaps in the facts of a new index version.
+
+    Args:
+        facts (Iterable[Dict]): Facts as returned by `extract_facts`.
+        min_coverage (float): Share of a fact label's words the question
+            must contain.
+    """
+
+    def __init__(self, facts: Iterable[Dict] = (), min_coverage: float = FACT_MIN_COVERAGE):
+        self.min_coverage = min_coverage
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._entries: List = []
+        self.replace(facts)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "FactTable":
+        return cls(read_facts(index_dir))
+
+    def replace(self, facts: Iterable[Dict]) -> None:
+        entries = [(content_words(fact["label"]), fact) for fact in _unambiguous(facts)]
+        with self._lock:
+            self._entries = entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def match(self, question: str, policy_sets: Optional[Sequence[str]] = None) -> Optional[Dict]:
+        """
+        Returns the fact that answers `question`, or None.
+
+        Every content word of the question must be in the fact's label, and
+        the label must be covered to at least `min_coverage`. A tie between
+        two facts with different values is a miss.
+
+        Args:
+            question (str): The standalone question.
+            policy_sets (Sequence[str], optional): Only match facts of these sets.
+        """
+        words = content_words(question)
+        best, best_score, tied = None, 0.0, False
+        if words and not words & _BROAD:
+            for label_words, fact in self._entries:
+                if policy_sets is not None and fact.get("policy_set", DEFAULT_POLICY_SET) not in policy_sets:
+                    continue
+                if not words <= label_words:
+                    continue
+                score = len(words) / len(label_words)
+                if score > best_score:
+                    best, best_score, tied = fact, score, False
+                elif score == best_score and fact["value"].lower() != best["value"].lower():
+                    tied = True
+        hit = best if best is not None and best_score >= self.min_coverage and not tied else None
+        with self._lock:
+            self.lookups += 1
+            self.hits += hit is not None
+        return hit
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "facts": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            }
+
+
+def format_fact_answer(fact: Dict) -> str:
+    """Answer text for a fact, with the page reference the QA prompt asks for."""
+    answer = f"{fact['label']}: {fact['value']}"
+    if not answer.endswith("."):
+        answer += "."
+    if fact["text"].rstrip(".") != answer.rstrip("."):
+        # Facts found in running text keep their sentence, which carries the conditions
+        answer += f"\n\n> {fact['text'].rstrip('.')}."
+    if fact.get("page") is not None:
+        answer += f"\n\nFor more information, refer to page {fact['page']}."
+    return answer
+
+
+def fact_document(fact: Dict) -> Document:
+    """The fact as a source Document, so callers log and show it like a retrieved chunk."""
+    metadata = {
+        "source": fact["source"],
+        "page": fact["page"],
+        "policy_set": fact.get("policy_set", DEFAULT_POLICY_SET),
+        "fact": True,
+    }
+    return Document(page_content=fact["text"], metadata=metadata)
@@ -1,32 +1,148 @@
+import os
+import re
+from datetime import date
 from langchain.document_loaders import PyMuPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional
 from langchain.schema import Document
 
-def load_policy_pdf(path: str) -> List[Document]:
+CHUNK_SIZE = 1000     # Max characters per chunk
+CHUNK_OVERLAP = 200   # Overlap between chunks for better context flow
+
+# PDFs directly in data/ belong to this set; data/<set>/... holds the other policy sets
+DEFAULT_POLICY_SET = "default"
+
+_VERSION_RE = re.compile(r"\bVersion\s*(?:#|No\.?|:)?\s*(\d+(?:\.\d+)*)", re.IGNORECASE)
+_DATE_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?[ -]([A-Za-z]{3,9})\.?,?[ -](\d{4})\b|\b(\d{4})-(\d{2})-(\d{2})\b")
+_EFFECTIVE_RE = re.compile(r"effective\s*(?:date|from)?\s*[:\-]?\s*", re.IGNORECASE)
+_TOC_RE = re.compile(r"^\s*(?:\d+\.\s*)?([A-Za-z][^.]{2,80}?)\s*\.{4,}\s*\d+\s*$")
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+
+def get_text_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> RecursiveCharacterTextSplitter:
+    """
+    Returns the text splitter used for every policy document.
+
+    Keeping it in one place guarantees that the incremental indexer and the
+    batch ingestion pipeline produce exactly the same chunks as
+    `load_policy_pdf`. The retrieval evaluation passes other sizes to
+    compare chunking configurations.
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+
+
+def policy_set_for(path: str, data_dir: str) -> str:
+    """
+    Returns the policy set of a PDF: its folder below `data_dir`.
+
+    `data/trainees/leave.pdf` belongs to "trainees". `data/ahmedabad/staff/leave.pdf`
+    belongs to "ahmedabad/staff". PDFs directly in `data_dir` belong to
+    `DEFAULT_POLICY_SET`.
+    """
+    folder = os.path.dirname(os.path.relpath(path, data_dir))
+    return folder.replace(os.sep, "/") if folder else DEFAULT_POLICY_SET
+
+
+def _parse_date(match: "re.Match") -> Optional[str]:
+    try:
+        if match.group(4):
+            return date(int(match.group(4)), int(match.group(5)), int(match.group(6))).isoformat()
+        month = _MONTHS.index(match.group(2)[:3].lower()) + 1
+        return date(int(match.group(3)), month, int(match.group(1))).isoformat()
+    except ValueError:
+        return None
+
+
+def describe_policy(cover_text: str) -> Dict[str, Optional[str]]:
+    """
+    Reads the version and effective date of a policy document from its cover page.
+
+    A date after "effective" wins; otherwise the first date on the page is used.
+
+    Returns:
+        Dict[str, Optional[str]]: `policy_version` and ISO `effective_date` (None if not found).
+    """
+    version = _VERSION_RE.search(cover_text)
+    effective = _EFFECTIVE_RE.search(cover_text)
+    dates = list(_DATE_RE.finditer(cover_text, effective.end() if effective else 0)) or list(_DATE_RE.finditer(cover_text))
+    parsed = [value for value in map(_parse_date, dates) if value]
+    return {
+        "policy_version": version.group(1) if version else None,
+        "effective_date": parsed[0] if parsed else None,
+    }
+
+
+def annotate_policy_pages(pages: Iterable[Document], policy_set: str = DEFAULT_POLICY_SET) -> Iterator[Document]:
+    """
+    Adds `policy_set`, `policy_version`, `effective_date` and `section` to page metadata.
+
+    Version and effective date come from the first page. Section titles come
+    from the table of contents (dot-leader lines) or a "Policy" header line.
+    A section starts on the page where its title appears alone on a line and
+    continues until the next one.
+    """
+    details: Optional[Dict[str, Optional[str]]] = None
+    titles: Dict[str, str] = {}
+    section: Optional[str] = None
+    for page in pages:
+        lines = [line.strip() for line in page.page_content.splitlines() if line.strip()]
+        if details is None:
+            details = describe_policy(page.page_content)
+
+        toc = [match.group(1).strip() for match in map(_TOC_RE.match, page.page_content.splitlines()) if match]
+        if toc:
+            titles.update((title.lower(), title) for title in toc)
+        else:
+            for i, line in enumerate(lines):
+                if line.lower() == "policy" and i + 1 < len(lines):
+                    titles.setdefault(lines[i + 1].lower(), lines[i + 1])
+            section = next((titles[line.lower()] for line in lines if line.lower() in titles), section)
+
+        page.metadata.update(details, policy_set=policy_set, section=section)
+        yield page
+
+
+def iter_policy_pages(path: str, policy_set: str = DEFAULT_POLICY_SET) -> Iterator[Document]:
+    """
+    Lazily yields one Document per PDF page.
+
+    Metadata includes 'page' and the fields added by `annotate_policy_pages`.
+
+    Args:
+        path (str): Path to the PDF file.
+        policy_set (str): Policy set the PDF belongs to (see `policy_set_for`).
+
+    Returns:
+        Iterator[Document]: Page documents, in page order.
+    """
+    return annotate_policy_pages(PyMuPDFLoader(path).lazy_load(), policy_set)
+
+
+def load_policy_pdf(path: str, policy_set: str = DEFAULT_POLICY_SET) -> List[Document]:
     """
     Loads and splits a PDF document into smaller chunks for retrieval-based QA systems.
 
     This function:
     - Loads the PDF using PyMuPDF.
+    - Records the policy set, version, effective date and section of every page.
     - Splits the text into overlapping chunks to preserve context.
     - Retains metadata like page numbers to enable traceable responses.
 
     Args:
         path (str): Path to the PDF file containing HR policy or similar documents.
+        policy_set (str): Policy set the PDF belongs to (see `policy_set_for`).
 
     Returns:
         List[Document]: A list of document chunks with metadata.
     """
-    # Load the PDF document using PyMuPDF (returns a list of Document objects)
-    loader = PyMuPDFLoader(path)
-    documents = loader.load()  # Each document contains metadata including 'page'
+    # Load the PDF document using PyMuPDF (each page Document carries 'page' and the policy metadata)
+    documents = list(iter_policy_pages(path, policy_set))
 
     # Initialize the text splitter to break content into manageable chunks
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,    # Max characters per chunk
-        chunk_overlap=200   # Overlap between chunks for better context flow
-    )
+    splitter = get_text_splitter()
 
     # Split the loaded documents into smaller chunks (preserving metadata)
     split_docs = splitter.split_documents(documents)
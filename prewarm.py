@@ -0,0 +1,99 @@
+"""
+Build-time prewarm and startup-time report.
+
+Run at image build time (with network access):
+
+    python prewarm.py [--model-dir models] [--with-reranker] [--skip-index]
+
+This vendors the MiniLM weights (and optionally the cross-encoder) into
+`models/` and brings the FAISS index up to date. The container then starts
+without any hub download.
+
+Measure where startup time goes (run in a fresh process):
+
+    python prewarm.py --startup-report [--output startup.json]
+
+The report has import times for the heavy modules, every `QAEngine`
+construction step and the warm-up query.
+"""
+import sys
+import json
+import time
+import argparse
+import importlib
+
+import model_store
+from model_store import MODEL_DIR, vendor_model
+
+# Heavy modules, in the order the engine pulls them in
+HEAVY_IMPORTS = ["numpy", "faiss", "langchain", "torch", "sentence_transformers", "langchain_groq"]
+
+
+def prewarm(model_dir: str = MODEL_DIR, with_reranker: bool = False, build_index: bool = True, include_onnx: bool = False) -> dict:
+    """Vendors the models and updates the index; returns what was done."""
+    model_store.MODEL_DIR = model_dir  # so load_embeddings() picks up the fresh copy
+    from qa_chain import DATA_DIR, EMBEDDING_BACKEND, EMBEDDING_MODEL, INDEX_DIR, load_embeddings
+    from reranker import DEFAULT_CROSS_ENCODER
+    from index_builder import build_or_update_index
+
+    report = {"models": {EMBEDDING_MODEL: vendor_model(EMBEDDING_MODEL, model_dir, include_onnx=include_onnx)}}
+    if with_reranker:
+        report["models"][DEFAULT_CROSS_ENCODER] = vendor_model(DEFAULT_CROSS_ENCODER, model_dir)
+    if build_index:
+        _, report["index"] = build_or_update_index(
+            DATA_DIR, INDEX_DIR, load_embeddings(), embedding_model=EMBEDDING_MODEL, embedding_backend=EMBEDDING_BACKEND
+        )
+    return report
+
+
+def startup_report() -> dict:
+    """Times heavy imports, engine construction and warm-up in this process."""
+    imports = {}
+    for name in HEAVY_IMPORTS:
+        if name in sys.modules:
+            continue
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        imports[name] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    import qa_chain
+    imports["qa_chain"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    engine = qa_chain.get_shared_engine()
+    wall = time.perf_counter() - started
+    return {
+        "imports_s": imports,
+        "engine_s": engine.startup,
+        "engine_wall_s": round(wall, 3),
+        "total_s": round(sum(imports.values()) + wall, 3),
+    }
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Vendor models / report startup time for PSSPL Polibot")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--with-reranker", action="store_true", help="Also vendor the cross-encoder")
+    parser.add_argument("--with-onnx", action="store_true", help="Also vendor the ONNX export of MiniLM")
+    parser.add_argument("--skip-index", action="store_true", help="Do not build/update the FAISS index")
+    parser.add_argument("--startup-report", action="store_true", help="Measure startup instead of prewarming")
+    parser.add_argument("--output", default=None, help="Write the JSON result to this file")
+    args = parser.parse_args()
+
+    if args.startup_report:
+        result = startup_report()
+    else:
+        result = prewarm(args.model_dir, args.with_reranker, not args.skip_index, args.with_onnx)
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
@@ -1,43 +1,79 @@
 import os
-from langchain_groq import ChatGroq
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import FAISS
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.callbacks import CallbackManagerForChainRun
 from langchain.memory import ConversationBufferMemory
 from langchain.chains import StuffDocumentsChain, LLMChain
-from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
+from langchain.retrievers import ContextualCompressionRetriever
+from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain, _get_chat_history
 from langchain.prompts import PromptTemplate
+from langchain.schema import Document
 
-from policy_handler import load_policy_pdf
+from answer_cache import SemanticAnswerCache, corpus_fingerprint
+from chat_log_sink import LOG_DIR
+from conversation_memory import BoundedSummaryMemory
+from condense import FIRST_TURN, REPHRASED, SELF_CONTAINED, classify_question
+from chunk_store import CHUNK_STORE_NAME, ChunkStore, ChunkStoreRetriever, open_partitions, read_faiss_index
+from index_builder import build_or_update_index
+from index_versions import POLL_INTERVAL as INDEX_POLL_INTERVAL, IndexWatcher, VersionedRetriever, resolve_index_dir
+from lexical_index import BM25Index, HybridRetriever
+from hedging import HedgedChatModel
+from llm_dispatch import PRIORITY_BACKGROUND, dispatched, shared_http_client
+from onnx_embeddings import create_embeddings
+from policy_facts import FACTS_ENABLED, FactTable, fact_document, format_fact_answer, read_facts
+from query_embedding_cache import CachedQueryEmbeddings, top_questions
+from reranker import CrossEncoderReranker, RerankStats
+from streaming import ANSWER_TAG, StreamingAnswer
+from telemetry import METRICS, count, stage, trace_turn
+from token_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
 
 INDEX_DIR = "faiss_index"
+DATA_DIR = "data"
 PDF_PATH = "data/POLICIES 2.3- Code of Conduct, Work Hour Policy & Leave Policy 2025.pdf"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# "torch" (sentence-transformers), "onnx" or "onnx-int8" (ONNX Runtime, no torch)
+EMBEDDING_BACKEND = os.getenv("POLIBOT_EMBEDDINGS", "torch")
+LLM_MODEL = "llama-3.3-70b-versatile"
+# Smaller, faster model used only to rephrase follow-ups into standalone questions
+CONDENSE_MODEL = os.getenv("POLIBOT_CONDENSE_MODEL", "llama-3.1-8b-instant")
+# Opt-in hedging: answer model raced against the primary when its first token is later
+# than POLIBOT_HEDGE_AFTER seconds (both must be set, e.g. "llama-3.1-8b-instant" and 3);
+# POLIBOT_FALLBACK_BASE_URL points it at another Groq-compatible endpoint
+FALLBACK_MODEL = os.getenv("POLIBOT_FALLBACK_MODEL", "")
+FALLBACK_BASE_URL = os.getenv("POLIBOT_FALLBACK_BASE_URL") or None
+HEDGE_AFTER = float(os.getenv("POLIBOT_HEDGE_AFTER", "0"))
 
-def get_or_create_qa_chain():
-    # Step 1: Initialize embeddings
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-    # Step 2: Load or create FAISS index
-    if os.path.exists(INDEX_DIR):
-        vectorstore = FAISS.load_local(INDEX_DIR, embeddings, allow_dangerous_deserialization=True)
-    else:
-        docs = load_policy_pdf(PDF_PATH)
-        vectorstore = FAISS.from_documents(docs, embeddings)
-        vectorstore.save_local(INDEX_DIR)
+RETRIEVER_K = 6
+# "bounded" keeps recent turns + a running summary under a token ceiling; "buffer" keeps everything
+MEMORY_MODE = os.getenv("POLIBOT_MEMORY", "bounded")
+MEMORY_WINDOW_TOKENS = int(os.getenv("POLIBOT_MEMORY_WINDOW_TOKENS", "600"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("POLIBOT_MEMORY_SUMMARY_TOKENS", "200"))
+# Fuse BM25 keyword hits with vector hits (set POLIBOT_HYBRID=0 for vector-only)
+HYBRID_ENABLED = os.getenv("POLIBOT_HYBRID", "1") == "1"
+# Optional cross-encoder reranking that packs the context into a token budget
+RERANK_ENABLED = os.getenv("POLIBOT_RERANK", "0") == "1"
+RERANK_CANDIDATES = int(os.getenv("POLIBOT_RERANK_CANDIDATES", "12"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("POLIBOT_CONTEXT_TOKENS", "800"))
+# Policy sets (subfolders of data/) new sessions search by default; empty searches all
+POLICY_SETS = [name.strip() for name in os.getenv("POLIBOT_POLICY_SETS", "").split(",") if name.strip()]
 
-    # Step 3: Setup retriever with higher recall
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 6})
+# Query-embedding LRU (0 disables) and how many top logged questions to pre-embed at startup
+QUERY_CACHE_SIZE = int(os.getenv("POLIBOT_QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_PREFILL = int(os.getenv("POLIBOT_QUERY_CACHE_PREFILL", "200"))
 
-    # Step 4: Initialize LLM
-    llm = ChatGroq(
-        groq_api_key=os.getenv("GROQ_API_KEY"),
-        model_name="llama-3.3-70b-versatile",
-        temperature=0.1
-    )
+# Answer cache settings (set POLIBOT_ANSWER_CACHE=0 to disable)
+ANSWER_CACHE_ENABLED = os.getenv("POLIBOT_ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("POLIBOT_ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.getenv("POLIBOT_ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("POLIBOT_ANSWER_CACHE_TTL", str(24 * 3600)))
 
-    # Step 5: Define prompts (cleaned and minimal)
-    qa_prompt = PromptTemplate(
-        input_variables=["context", "question"],
-        template="""You are an assistant helping employees understand HR policies at Prakash Software Solutions Pvt. Ltd.
+QA_PROMPT = PromptTemplate(
+    input_variables=["context", "question"],
+    template="""You are an assistant helping employees understand HR policies at Prakash Software Solutions Pvt. Ltd.
 
 Use the following extracted document content to answer the question.
 Be concise, professional, and easy to understand.
@@ -51,11 +87,11 @@ Question:
 {question}
 
 Answer:"""
-    )
+)
 
-    question_prompt = PromptTemplate(
-        input_variables=["chat_history", "question"],
-        template="""Given the following conversation and a follow-up question, rephrase the follow-up to be a standalone question.
+QUESTION_PROMPT = PromptTemplate(
+    input_variables=["chat_history", "question"],
+    template="""Given the following conversation and a follow-up question, rephrase the follow-up to be a standalone question.
 
 Chat History:
 {chat_history}
@@ -64,33 +100,498 @@ Follow-Up Input:
 {question}
 
 Standalone question:"""
-    )
+)
 
-    # Step 6: QA and question generator chains
-    qa_llm_chain = LLMChain(llm=llm, prompt=qa_prompt)
-    question_generator_chain = LLMChain(llm=llm, prompt=question_prompt)
+WARM_UP_QUESTION = "How many casual leaves do employees get?"
 
-    # Step 7: Combine context chunks
-    stuff_chain = StuffDocumentsChain(
-        llm_chain=qa_llm_chain,
-        document_variable_name="context"
-    )
 
-    # Step 8: Add memory
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        return_messages=True,
-        output_key="result"
+def load_embeddings(model_name: str = EMBEDDING_MODEL, backend: Optional[str] = None):
+    """
+    Loads the sentence embeddings, from `models/` when vendored.
+
+    `backend` (default `POLIBOT_EMBEDDINGS`) picks PyTorch or ONNX Runtime
+    (fp32 or int8); all produce vectors compatible with the same index (see
+    `onnx_embeddings`). The int8 model only embeds queries. Imports are deferred so importing this module stays
+    cheap.
+    """
+    return create_embeddings(model_name, backend or EMBEDDING_BACKEND)
+
+
+def groq_chat(model_name: str, temperature: float, streaming: bool = False, base_url: Optional[str] = None):
+    """
+    Builds a ChatGroq client (imported lazily, like the embeddings).
+
+    All clients share one pooled HTTP client. SDK retries are off because
+    `llm_dispatch` retries and backs off across the whole process instead.
+    """
+    from langchain_groq import ChatGroq
+    endpoint = {"base_url": base_url} if base_url else {}  # else GROQ_API_BASE or the default
+    return ChatGroq(
+        groq_api_key=os.getenv("GROQ_API_KEY"),
+        model_name=model_name,
+        temperature=temperature,
+        streaming=streaming,
+        http_client=shared_http_client(),
+        max_retries=0,
+        **endpoint
     )
 
-    # Step 9: Final conversational chain
-    qa_chain = ConversationalRetrievalChain(
-        retriever=retriever,
-        combine_docs_chain=stuff_chain,
-        question_generator=question_generator_chain,
+
+class QAEngine:
+    """
+    Process-wide resources shared by every chat session.
+
+    The embeddings model, FAISS index, chunk store, retriever and Groq clients are
+    expensive to build, so they are created once per process. All of them are
+    read-only after construction and safe to use from Streamlit's script
+    threads. Only the conversation memory is per session (see
+    `get_or_create_qa_chain`). `startup` records how long each step took,
+    and `ready` turns True once `warm_up` has answered a retrieval query.
+
+    Args:
+        index_dir (str): Directory holding `index.faiss`/`chunks.sqlite`.
+        data_dir (str): Directory with the policy PDFs to index.
+        embeddings: Embeddings to use instead of the MiniLM model.
+        llm: Answer chat model to use instead of Groq (e.g. a local mock).
+        condense_llm: Condense/summary chat model to use instead of Groq.
+        fallback_llm: Hedging fallback model to use instead of Groq.
+        hedge_after (float, optional): First-token deadline before hedging
+            (default `POLIBOT_HEDGE_AFTER`; 0 disables hedging).
+    """
+
+    def __init__(
+        self,
+        index_dir: str = INDEX_DIR,
+        data_dir: str = DATA_DIR,
+        embeddings=None,
+        llm=None,
+        condense_llm=None,
+        fallback_llm=None,
+        hedge_after: Optional[float] = None,
+    ):
+        self.startup: Dict[str, float] = {}
+        self.ready = False
+        mark = time.perf_counter()
+
+        # Step 1: Initialize embeddings, behind a cache of recent query vectors
+        self.embeddings = embeddings or load_embeddings()
+        if QUERY_CACHE_SIZE > 0:
+            self.embeddings = CachedQueryEmbeddings(self.embeddings, max_entries=QUERY_CACHE_SIZE)
+        mark = self._lap("embeddings_load", mark)
+
+        # Step 2: Bring the FAISS index up to date, embedding only new or changed chunks
+        _, self.index_report = build_or_update_index(
+            data_dir, index_dir, self.embeddings, embedding_model=EMBEDDING_MODEL, embedding_backend=EMBEDDING_BACKEND
+        )
+        mark = self._lap("index_update", mark)
+
+        # Step 3: Open the live index version behind a retriever that can be swapped at runtime
+        self.index_dir = index_dir
+        self.rerank_stats = None
+        self.reranker = None
+        if RERANK_ENABLED:
+            self.rerank_stats = RerankStats()
+            self.reranker = CrossEncoderReranker(
+                token_budget=CONTEXT_TOKEN_BUDGET, max_docs=RETRIEVER_K, stats=self.rerank_stats
+            )
+        version, path = resolve_index_dir(index_dir)
+        retriever, self.chunk_store, mark = self._open_version(path, mark)
+        self.retriever = VersionedRetriever(active=(retriever, version))
+        self.fact_table = FactTable.load(path) if FACTS_ENABLED else None
+        self._retired: List[ChunkStore] = []
+        self.watcher: Optional[IndexWatcher] = None
+
+        # Step 4: Initialize LLMs behind the shared dispatch layer (coalescing, TPM budget,
+        # retries); the answer model streams so tokens reach callback handlers
+        self.llm = dispatched(llm or groq_chat(LLM_MODEL, temperature=0.1, streaming=True), streaming=True)
+        hedge_after = HEDGE_AFTER if hedge_after is None else hedge_after
+        if hedge_after > 0 and (fallback_llm is not None or FALLBACK_MODEL):
+            fallback_llm = fallback_llm or groq_chat(
+                FALLBACK_MODEL, temperature=0.1, streaming=True, base_url=FALLBACK_BASE_URL
+            )
+            self.llm = HedgedChatModel(
+                primary=self.llm, fallback=dispatched(fallback_llm, streaming=True), hedge_after=hedge_after
+            )
+        self.condense_llm = dispatched(condense_llm or groq_chat(CONDENSE_MODEL, temperature=0))
+        # Memory summaries use the condense model but yield to interactive calls
+        self.summary_llm = dispatched(self.condense_llm, priority=PRIORITY_BACKGROUND)
+        mark = self._lap("llm_clients", mark)
+
+        # Step 5: QA and question generator chains (stateless, so shared)
+        self.qa_llm_chain = LLMChain(llm=self.llm, prompt=QA_PROMPT, tags=[ANSWER_TAG])
+        self.question_generator_chain = LLMChain(llm=self.condense_llm, prompt=QUESTION_PROMPT)
+
+        # Step 6: Combine context chunks
+        self.stuff_chain = StuffDocumentsChain(
+            llm_chain=self.qa_llm_chain,
+            document_variable_name="context"
+        )
+
+        # Step 7: Answer cache, dropped whenever the index or a policy PDF changes
+        self.answer_cache = None
+        if ANSWER_CACHE_ENABLED:
+            watched = [data_dir]
+            self.answer_cache = SemanticAnswerCache(
+                self.embeddings,
+                threshold=ANSWER_CACHE_THRESHOLD,
+                max_entries=ANSWER_CACHE_SIZE,
+                ttl_seconds=ANSWER_CACHE_TTL,
+                fingerprint_fn=lambda: (self.retriever.version, corpus_fingerprint(watched)),
+            )
+        self._lap("chains", mark)
+
+    def _lap(self, step: str, since: float) -> float:
+        now = time.perf_counter()
+        self.startup[f"{step}_s"] = round(now - since, 3)
+        return now
+
+    def _open_version(self, path: str, mark: Optional[float] = None) -> Tuple[Any, ChunkStore, Optional[float]]:
+        """
+        Opens one index version: the mmapped FAISS index + chunk store, the
+        per-policy-set partitions, BM25 and the reranker. Startup steps are
+        timed when `mark` is given.
+        """
+        # Higher recall; over-fetch candidates when a reranker trims them afterwards
+        fetch_k = RERANK_CANDIDATES if RERANK_ENABLED else RETRIEVER_K
+        chunk_store = ChunkStore(os.path.join(path, CHUNK_STORE_NAME))
+        partitions = open_partitions(path, chunk_store)
+        retriever = ChunkStoreRetriever(
+            index=read_faiss_index(path), store=chunk_store, embeddings=self.embeddings, k=fetch_k,
+            partitions=partitions,
+        )
+        if mark is not None:
+            mark = self._lap("index_open", mark)
+        if HYBRID_ENABLED:
+            if len(partitions) > 1:
+                # One BM25 index per set, keyed by row within the set
+                lexical_partitions = {
+                    name: BM25Index.from_chunks(enumerate(text for _, text in chunk_store.iter_texts(name)))
+                    for name in partitions
+                }
+                retriever = HybridRetriever(
+                    vector_retriever=retriever, lexical_partitions=lexical_partitions, k=fetch_k
+                )
+            else:
+                lexical_index = BM25Index.from_chunks(chunk_store.iter_texts())
+                retriever = HybridRetriever(vector_retriever=retriever, lexical_index=lexical_index, k=fetch_k)
+            if mark is not None:
+                mark = self._lap("lexical_index", mark)
+        if self.reranker is not None:
+            retriever = ContextualCompressionRetriever(base_compressor=self.reranker, base_retriever=retriever)
+        return retriever, chunk_store, mark
+
+    def swap_index_version(self, version: str, path: str) -> None:
+        """
+        Loads index `version` and switches new queries to it.
+
+        Runs on the watcher thread. The new version is opened and warmed
+        while the old one keeps serving. Queries already running finish on
+        the old version. Its chunk store is closed one swap later.
+        """
+        started = time.perf_counter()
+        retriever, chunk_store, _ = self._open_version(path)
+        retriever.invoke(WARM_UP_QUESTION)  # fault in index pages before taking traffic
+        facts = read_facts(path) if self.fact_table is not None else None
+        previous, self.chunk_store = self.chunk_store, chunk_store
+        self.retriever.swap(retriever, version)
+        if facts is not None:
+            self.fact_table.replace(facts)
+        for store in self._retired:
+            store.close()
+        self._retired = [previous]
+        METRICS.observe("polibot_index_swap_seconds", time.perf_counter() - started)
+        count("index_swaps")
+        logger.info("now serving index version %s", version)
+
+    def start_index_watcher(self, interval: float = INDEX_POLL_INTERVAL) -> Optional[IndexWatcher]:
+        """Polls for newly published index versions (no-op when `interval` is 0)."""
+        if self.watcher is None and interval > 0:
+            self.watcher = IndexWatcher(
+                self.index_dir, self.retriever.version, self.swap_index_version, interval=interval
+            ).start()
+        return self.watcher
+
+    def warm_up(self, questions: Optional[List[str]] = None) -> Dict[str, float]:
+        """
+        Runs retrieval queries so the first user does not pay for lazy init.
+
+        The first forward pass of the embedding model (and of the reranker,
+        when enabled) is much slower than the next ones, and SQLite/mmap pages
+        are faulted in on first read. The query-embedding cache is filled with
+        the most asked questions from the chat logs. The LLM is not called.
+
+        Returns:
+            Dict[str, float]: The startup breakdown, including `warm_up_s`.
+        """
+        started = time.perf_counter()
+        if isinstance(self.embeddings, CachedQueryEmbeddings) and QUERY_CACHE_PREFILL > 0:
+            self.embeddings.prepopulate(top_questions(LOG_DIR, QUERY_CACHE_PREFILL))
+            started = self._lap("query_cache_prefill", started)
+        for question in questions or [WARM_UP_QUESTION]:
+            self.retriever.invoke(question)
+        self._lap("warm_up", started)
+        self.startup["total_s"] = round(sum(v for k, v in self.startup.items() if k != "total_s"), 3)
+        self.ready = True
+        logger.info("engine ready, startup breakdown %s", self.startup)
+        return self.startup
+
+
+class PolicyQAChain(ConversationalRetrievalChain):
+    """
+    ConversationalRetrievalChain that consults a semantic answer cache.
+
+    A follow-up is condensed into a standalone question only when
+    `classify_question` says it refers back to the conversation. First
+    turns and self-contained questions skip that LLM round trip. The
+    `condense_path` output key records which path was taken. If an
+    equivalent standalone question was answered before, the cached answer
+    and source documents are returned and both the FAISS search and the
+    answer LLM call are skipped. Plain lookups ("how many casual leaves?")
+    are answered straight from the policy fact table with a page citation.
+    The output carries `cache_hit` and `fact_hit` flags so callers can log
+    which path served the turn. With `policy_sets`, retrieval, facts and
+    cached answers are limited to those policy sets.
+    """
+
+    answer_cache: Optional[SemanticAnswerCache] = None
+    fact_table: Optional[FactTable] = None
+    policy_sets: Optional[List[str]] = None
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        with trace_turn() as trace:
+            output = self._answer(inputs, run_manager)
+            output["trace"] = trace.as_dict()
+        logger.info("turn trace %s", output["trace"])
+        return output
+
+    def _answer(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question = inputs["question"]
+        get_chat_history = self.get_chat_history or _get_chat_history
+        chat_history_str = get_chat_history(inputs["chat_history"])
+
+        # Step 1: Condense a follow-up into a standalone question, only when needed
+        new_question, condense_path = self._condense_question(question, chat_history_str, _run_manager)
+
+        # Step 2: Answer plain lookups from the policy fact table, skipping retrieval and the LLM
+        if self.fact_table is not None:
+            with stage("fact_lookup"):
+                fact = self.fact_table.match(new_question, self.policy_sets)
+            count("fact_path", result="hit" if fact is not None else "miss")
+            if fact is not None:
+                return self._build_output(
+                    format_fact_answer(fact), [fact_document(fact)], new_question, condense_path,
+                    cache_hit=False, fact_hit=True,
+                )
+
+        # Step 3: Serve repeated questions from the cache
+        vector = None
+        if self.answer_cache is not None:
+            with stage("cache_embed"):
+                vector = self.answer_cache.embed(new_question)
+            with stage("cache_lookup"):
+                cached = self.answer_cache.lookup(new_question, vector=vector, scope=self._cache_scope())
+            count("answer_cache", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                return self._build_output(
+                    cached["result"], cached["source_documents"], new_question, condense_path, cache_hit=True
+                )
+
+        # Step 4: Retrieve context and ask the LLM
+        started = time.perf_counter()
+        with stage("retrieve"):
+            docs = self._get_docs(new_question, inputs, run_manager=_run_manager)
+        if self.response_if_no_docs_found is not None and len(docs) == 0:
+            return self._build_output(
+                self.response_if_no_docs_found, docs, new_question, condense_path, cache_hit=False
+            )
+
+        new_inputs = inputs.copy()
+        if self.rephrase_question:
+            new_inputs["question"] = new_question
+        new_inputs["chat_history"] = chat_history_str
+        with stage("answer_llm"):
+            answer = self.combine_docs_chain.run(
+                input_documents=docs, callbacks=_run_manager.get_child(), **new_inputs
+            )
+        count("prompt_tokens", estimate_tokens(new_inputs["question"]) + sum(estimate_tokens(d.page_content) for d in docs))
+        count("completion_tokens", estimate_tokens(answer))
+
+        if self.answer_cache is not None:
+            self.answer_cache.put(
+                new_question, answer, docs, latency=time.perf_counter() - started, vector=vector,
+                scope=self._cache_scope(),
+            )
+        return self._build_output(answer, docs, new_question, condense_path, cache_hit=False)
+
+    def _get_docs(
+        self,
+        question: str,
+        inputs: Dict[str, Any],
+        *,
+        run_manager: CallbackManagerForChainRun,
+    ) -> List[Document]:
+        kwargs = {} if self.policy_sets is None else {"policy_sets": self.policy_sets}
+        docs = self.retriever.invoke(question, config={"callbacks": run_manager.get_child()}, **kwargs)
+        return self._reduce_tokens_below_limit(docs)
+
+    def _cache_scope(self) -> Optional[Tuple[str, ...]]:
+        return None if self.policy_sets is None else tuple(sorted(set(self.policy_sets)))
+
+    def _index_version(self, docs) -> Optional[str]:
+        """Version of the index the context came from (the live one if nothing was retrieved)."""
+        for doc in docs:
+            if doc.metadata.get("index_version"):
+                return doc.metadata["index_version"]
+        return getattr(self.retriever, "version", None)
+
+    def stream_answer(self, question: str) -> StreamingAnswer:
+        """
+        Answers `question` while streaming the answer tokens.
+
+        Args:
+            question (str): The user's message.
+
+        Returns:
+            StreamingAnswer: Iterate it for tokens; `.response` holds the full
+            output (including `source_documents`) once iteration is complete.
+        """
+        return StreamingAnswer(
+            lambda handler: self.invoke({"question": question}, config={"callbacks": [handler]})
+        )
+
+    def _condense_question(self, question: str, chat_history_str: str, run_manager) -> Tuple[str, str]:
+        if not chat_history_str:
+            path, reason, new_question = FIRST_TURN, "no_history", question
+        else:
+            needs_rephrasing, reason = classify_question(question)
+            if needs_rephrasing:
+                path = REPHRASED
+                with stage("condense_llm"):
+                    new_question = self.question_generator.run(
+                        question=question, chat_history=chat_history_str, callbacks=run_manager.get_child()
+                    )
+            else:
+                path, new_question = SELF_CONTAINED, question
+        logger.info("condense path=%s reason=%s", path, reason)
+        count("condense", path=path)
+        return new_question, path
+
+    def _build_output(
+        self, answer, docs, new_question, condense_path: str, cache_hit: bool, fact_hit: bool = False
+    ) -> Dict[str, Any]:
+        output: Dict[str, Any] = {
+            self.output_key: answer,
+            "cache_hit": cache_hit,
+            "fact_hit": fact_hit,
+            "condense_path": condense_path,
+            "index_version": self._index_version(docs),
+        }
+        if self.return_source_documents:
+            output["source_documents"] = docs
+        if self.return_generated_question:
+            output["generated_question"] = new_question
+        return output
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_shared_engine() -> QAEngine:
+    """
+    Returns the process-wide `QAEngine`, building it on first use.
+
+    Double-checked locking ensures that concurrent Streamlit sessions starting
+    at the same moment load the embeddings model and FAISS index only once.
+    The engine is published only after its warm-up query has run. It then
+    watches the index for new versions and swaps to them without a restart.
+
+    Returns:
+        QAEngine: The shared engine for this process.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = QAEngine()
+                engine.warm_up()
+                engine.start_index_watcher()
+                _engine = engine
+    return _engine
+
+
+def is_ready() -> bool:
+    """True once the shared engine is built and warmed up."""
+    return _engine is not None and _engine.ready
+
+
+def start_background_warmup() -> threading.Thread:
+    """Builds and warms the shared engine on a daemon thread (returns at once)."""
+    thread = threading.Thread(target=get_shared_engine, name="engine-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def set_shared_engine(engine: Optional[QAEngine]) -> None:
+    """
+    Replaces the process-wide engine (used by the benchmark to inject a mock LLM).
+
+    Args:
+        engine (Optional[QAEngine]): The engine to share, or None to rebuild lazily.
+    """
+    global _engine
+    with _engine_lock:
+        _engine = engine
+
+
+def get_or_create_qa_chain(policy_sets: Optional[List[str]] = None):
+    """
+    Creates a per-session chain on the shared engine.
+
+    Args:
+        policy_sets (List[str], optional): Policy sets the session may search;
+            defaults to POLIBOT_POLICY_SETS (all sets when that is empty).
+    """
+    engine = get_shared_engine()
+    if policy_sets is None and POLICY_SETS:
+        policy_sets = list(POLICY_SETS)
+
+    # Per-session memory; everything else comes from the shared engine
+    if MEMORY_MODE == "buffer":
+        memory = ConversationBufferMemory(
+            memory_key="chat_history",
+            return_messages=True,
+            output_key="result"
+        )
+    else:
+        memory = BoundedSummaryMemory(
+            llm=engine.summary_llm,
+            memory_key="chat_history",
+            return_messages=True,
+            output_key="result",
+            max_window_tokens=MEMORY_WINDOW_TOKENS,
+            max_summary_tokens=MEMORY_SUMMARY_TOKENS
+        )
+
+    qa_chain = PolicyQAChain(
+        retriever=engine.retriever,
+        combine_docs_chain=engine.stuff_chain,
+        question_generator=engine.question_generator_chain,
         memory=memory,
         return_source_documents=True,
-        output_key="result"
+        output_key="result",
+        answer_cache=engine.answer_cache,
+        fact_table=engine.fact_table,
+        policy_sets=policy_sets
     )
 
     return qa_chain
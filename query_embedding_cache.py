@@ -0,0 +1,134 @@
+"""
+LRU cache of query embeddings in front of the engine's embeddings model.
+
+The same questions recur across sessions ("how many casual leaves?"), and
+within one turn the answer cache and the retriever both embed the same
+standalone question. `CachedQueryEmbeddings` keys `embed_query` on the
+normalized question text (see `normalize_question`), so every repeat skips
+the encoder. Normalized variants ("Sandwich rule?" / "sandwich rule") share
+the vector of whichever form was embedded first. MiniLM is uncased and the
+difference in trailing punctuation is negligible for retrieval.
+
+`embed_documents` (index building) is passed straight through.
+`prepopulate` fills the cache at startup with the most frequent questions
+found in the chat logs, encoded in batches.
+"""
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List
+
+from langchain_core.embeddings import Embeddings
+
+from answer_cache import normalize_question
+from chat_log_sink import iter_chat_sessions
+from telemetry import count
+
+
+def top_questions(log_dir: str, limit: int) -> List[str]:
+    """
+    Returns the `limit` most asked questions in `log_dir`, most frequent first.
+
+    Each question is returned in its most common original spelling.
+    """
+    counts: Counter = Counter()
+    spellings: Dict[str, Counter] = {}
+    for session in iter_chat_sessions(log_dir):
+        for message in session["messages"]:
+            if message.get("role") != "user":
+                continue
+            text = str(message.get("content", "")).strip()
+            key = normalize_question(text)
+            if not key:
+                continue
+            counts[key] += 1
+            spellings.setdefault(key, Counter())[text] += 1
+    return [spellings[key].most_common(1)[0][0] for key, _ in counts.most_common(limit)]
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Thread-safe, bounded query-embedding cache wrapping another `Embeddings`.
+
+    Args:
+        base (Embeddings): The real embeddings model.
+        max_entries (int): LRU capacity (a MiniLM vector is ~1.5 KB as floats).
+    """
+
+    def __init__(self, base: Embeddings, max_entries: int = 2048):
+        self.base = base
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_question(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if vector is not None:
+            count("query_embedding_cache", result="hit")
+            return list(vector)
+
+        # Encode outside the lock; a concurrent miss on the same key just computes it twice
+        vector = self.base.embed_query(text)
+        with self._lock:
+            self.misses += 1
+            self._store(key, vector)
+        count("query_embedding_cache", result="miss")
+        return list(vector)
+
+    def _store(self, key: str, vector: List[float]) -> None:
+        self._entries[key] = list(vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def prepopulate(self, questions: Iterable[str], batch_size: int = 64) -> int:
+        """
+        Embeds `questions` in batches and caches them.
+
+        `embed_documents` is used for batching; for sentence-transformers
+        models it returns the same vectors as `embed_query`.
+
+        Returns:
+            int: Number of questions added.
+        """
+        pending, seen = [], set()
+        for question in questions:
+            key = normalize_question(question)
+            if key and key not in seen:
+                seen.add(key)
+                pending.append((key, question))
+        pending = pending[: self.max_entries]
+
+        added = 0
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            vectors = self.base.embed_documents([question for _, question in batch])
+            with self._lock:
+                for (key, _), vector in zip(batch, vectors):
+                    if key not in self._entries:
+                        self._store(key, vector)
+                        added += 1
+        return added
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,180 @@
+"""
+Cross-encoder reranking and context packing between retriever and stuff chain.
+
+The retriever over-fetches candidates. This stage then:
+- drops duplicate chunks and chunks fully contained in another one,
+- scores every (question, chunk) pair with a small CPU cross-encoder in one
+  batched call,
+- packs the best chunks into a token budget, trimming the text a chunk
+  shares with a neighbouring chunk that is already packed (the splitter's
+  200-character overlap).
+
+Per-query token savings are kept in `RerankStats`.
+"""
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor
+from pydantic import PrivateAttr
+
+from model_store import resolve_model
+from telemetry import stage
+from token_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+
+
+def _normalized(text: str) -> str:
+    return " ".join(text.split())
+
+
+def shared_overlap(first: str, second: str) -> int:
+    """Returns the length of the longest suffix of `first` that prefixes `second`."""
+    limit = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for length in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def deduplicate(docs: Sequence[Document]) -> List[Document]:
+    """Removes exact duplicates and chunks whose text is contained in another chunk."""
+    unique: List[Document] = []
+    texts: List[str] = []
+    for doc in docs:
+        text = _normalized(doc.page_content)
+        if any(text in other for other in texts):
+            continue
+        keep = [i for i, other in enumerate(texts) if other not in text]
+        unique = [unique[i] for i in keep] + [doc]
+        texts = [texts[i] for i in keep] + [text]
+    return unique
+
+
+class RerankStats:
+    """Thread-safe totals plus the most recent per-query metrics."""
+
+    def __init__(self, history: int = 200):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.recent: deque = deque(maxlen=history)
+
+    def record(self, metrics: Dict) -> None:
+        with self._lock:
+            self.queries += 1
+            self.tokens_in += metrics["tokens_in"]
+            self.tokens_out += metrics["tokens_out"]
+            self.recent.append(metrics)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "avg_tokens_saved": (self.tokens_in - self.tokens_out) / self.queries if self.queries else 0.0,
+            }
+
+
+class CrossEncoderReranker(BaseDocumentCompressor):
+    """
+    Document compressor that reranks with a cross-encoder and packs a token budget.
+
+    Use it with `ContextualCompressionRetriever`. The cross-encoder is loaded
+    lazily once and shared by all sessions.
+    """
+
+    model_name: str = DEFAULT_CROSS_ENCODER
+    batch_size: int = 32
+    token_budget: int = 800
+    max_docs: int = 6
+    stats: Any = None
+
+    _model: Any = PrivateAttr(default=None)
+    _model_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(resolve_model(self.model_name), device="cpu")
+        return self._model
+
+    def score(self, query: str, docs: Sequence[Document]) -> np.ndarray:
+        """Scores all (query, chunk) pairs in batched forward passes."""
+        if not docs:
+            return np.zeros(0, dtype=np.float32)
+        pairs = [(query, doc.page_content) for doc in docs]
+        return np.asarray(self._get_model().predict(pairs, batch_size=self.batch_size), dtype=np.float32)
+
+    def pack(self, docs: Sequence[Document], scores: np.ndarray) -> List[Document]:
+        """
+        Greedily packs the highest-scoring chunks into `token_budget`.
+
+        Text shared with an adjacent chunk that is already packed is trimmed
+        first. The best chunk is always kept, even if it alone exceeds the
+        budget.
+        """
+        packed: List[Document] = []
+        used = 0
+        for i in np.argsort(-scores):
+            if len(packed) >= self.max_docs:
+                break
+            doc = docs[int(i)]
+            text = doc.page_content
+            for other in packed:
+                if other.metadata.get("source") != doc.metadata.get("source"):
+                    continue
+                text = text[shared_overlap(other.page_content, text):]
+                cut = shared_overlap(text, other.page_content)
+                if cut:
+                    text = text[:-cut]
+            if not text.strip():
+                continue
+
+            tokens = estimate_tokens(text)
+            if packed and used + tokens > self.token_budget:
+                continue
+            metadata = dict(doc.metadata, rerank_score=float(scores[int(i)]))
+            packed.append(Document(page_content=text, metadata=metadata))
+            used += tokens
+        return packed
+
+    def compress_documents(
+        self,
+        documents: Sequence[Document],
+        query: str,
+        callbacks: Optional[Callbacks] = None,
+    ) -> Sequence[Document]:
+        # Baseline: what the plain retriever would have stuffed (its first max_docs hits)
+        tokens_in = sum(estimate_tokens(doc.page_content) for doc in documents[: self.max_docs])
+        candidates = deduplicate(documents)
+        with stage("rerank"):
+            scores = self.score(query, candidates)
+        packed = self.pack(candidates, scores)
+
+        metrics = {
+            "candidates": len(documents),
+            "deduplicated": len(documents) - len(candidates),
+            "selected": len(packed),
+            "tokens_in": tokens_in,
+            "tokens_out": sum(estimate_tokens(doc.page_content) for doc in packed),
+        }
+        metrics["tokens_saved"] = metrics["tokens_in"] - metrics["tokens_out"]
+        if self.stats is not None:
+            self.stats.record(metrics)
+        logger.info("rerank %s", metrics)
+        return packed
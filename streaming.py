@@ -0,0 +1,102 @@
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from telemetry import METRICS
+
+ANSWER_TAG = "answer"
+
+_DONE = object()
+
+
+class AnswerTokenHandler(BaseCallbackHandler):
+    """
+    Callback handler that forwards answer tokens to a queue.
+
+    Only tokens produced by the LLM running under the chain tagged
+    `ANSWER_TAG` (the stuff/QA chain) are forwarded, so the condensed
+    question generated on follow-ups never leaks into the chat window.
+
+    Args:
+        token_queue (queue.Queue): Destination for streamed tokens.
+    """
+
+    def __init__(self, token_queue: "queue.Queue"):
+        self.token_queue = token_queue
+        self._answer_chains: Set[UUID] = set()
+        self._answer_llm_runs: Set[UUID] = set()
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, tags=None, **kwargs: Any) -> None:
+        if tags and ANSWER_TAG in tags:
+            self._answer_chains.add(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        if parent_run_id in self._answer_chains:
+            self._answer_llm_runs.add(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        if parent_run_id in self._answer_chains:
+            self._answer_llm_runs.add(run_id)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._answer_llm_runs and token:
+            self.token_queue.put(token)
+
+
+class StreamingAnswer:
+    """
+    Iterator over answer tokens for one chat turn.
+
+    The chain runs on a background thread; iterating yields tokens as the
+    model produces them. Once iteration finishes, `response` holds the full
+    chain output (`result`, `source_documents`, ...) for logging. When the
+    answer did not come from the LLM (e.g. an answer-cache hit) the complete
+    text is yielded as a single chunk.
+
+    Args:
+        run (Callable): Invokes the chain with the given callback handler.
+    """
+
+    def __init__(self, run: Callable[[BaseCallbackHandler], Dict[str, Any]]):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._run = run
+        self._error: Optional[BaseException] = None
+        self.response: Optional[Dict[str, Any]] = None
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _worker(self) -> None:
+        try:
+            self.response = self._run(AnswerTokenHandler(self._queue))
+        except BaseException as exc:  # re-raised on the consumer thread
+            self._error = exc
+        finally:
+            self._queue.put(_DONE)
+
+    def __iter__(self) -> Iterator[str]:
+        streamed = False
+        while True:
+            token = self._queue.get()
+            if token is _DONE:
+                break
+            if not streamed:
+                METRICS.observe("polibot_first_token_seconds", time.perf_counter() - self._started)
+            streamed = True
+            yield token
+
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        if not streamed and self.response:
+            METRICS.observe("polibot_first_token_seconds", time.perf_counter() - self._started)
+            yield self.response.get("result", "")
+
+    @property
+    def text(self) -> str:
+        """Final answer text (available after iteration)."""
+        return (self.response or {}).get("result", "")
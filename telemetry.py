@@ -0,0 +1,269 @@
+"""
+Per-stage latency tracing and process-wide metrics.
+
+Each chat turn runs inside a `TurnTrace`. Code on the turn's path wraps its
+work in `stage(name)`, which records the elapsed time on the current trace
+(if any) and in a histogram shared by the whole process. The trace is kept
+in a context variable, so the retriever and chain record their stages
+without having them passed in.
+
+Metrics are exported in the Prometheus text format:
+- `GET /metrics` on the API server
+- `start_metrics_server(port)` (POLIBOT_METRICS_PORT) for the Streamlit apps
+- `write_metrics_file(path)` (POLIBOT_METRICS_FILE), throttled, for scraping
+  by a node exporter's textfile collector or for reading by hand
+
+Recording is a `perf_counter()` pair plus one lock-protected update, so the
+overhead is a few microseconds per stage.
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond FAISS searches up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROLLING_WINDOW = 1024
+
+METRICS_FILE = os.getenv("POLIBOT_METRICS_FILE")
+METRICS_FILE_INTERVAL = float(os.getenv("POLIBOT_METRICS_FILE_INTERVAL", "10"))
+
+
+class Histogram:
+    """
+    Cumulative Prometheus-style buckets plus a rolling window for quantiles.
+
+    Args:
+        buckets (Sequence[float]): Upper bounds, ascending.
+        window (int): Number of recent observations kept for quantiles.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, window: int = ROLLING_WINDOW):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent: deque = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self) -> Dict[str, float]:
+        if not self.recent:
+            return {}
+        arr = np.fromiter(self.recent, dtype=float) * 1000.0
+        p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+        return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+
+class MetricsRegistry:
+    """Thread-safe store of labelled histograms and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict:
+        """Counters and per-histogram count/mean/quantiles as plain dicts."""
+        with self._lock:
+            histograms = {
+                _series(name, labels): {
+                    "count": h.count,
+                    "mean_ms": round(h.sum / h.count * 1000.0, 2) if h.count else 0.0,
+                    **h.quantiles(),
+                }
+                for (name, labels), h in self._histograms.items()
+            }
+            counters = {_series(name, labels): value for (name, labels), value in self._counters.items()}
+        return {"histograms": histograms, "counters": counters}
+
+    def render_prometheus(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted({n for n, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), h in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, n_obs in zip([f"{b:g}" for b in h.buckets] + ["+Inf"], h.counts):
+                        cumulative += n_obs
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {h.sum:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {h.count}")
+            for name in sorted({n for n, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _series(name: str, labels: Tuple) -> str:
+    return name + _labels(labels)
+
+
+METRICS = MetricsRegistry()
+
+
+# ---------- Per-turn tracing ----------
+class TurnTrace:
+    """Stage timings and counts for one chat turn."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, float] = {}
+
+    def add(self, stage_name: str, seconds: float) -> None:
+        # A stage can run more than once per turn (e.g. two embeddings)
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def as_dict(self) -> Dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000.0, 2),
+            "stages_ms": {k: round(v * 1000.0, 2) for k, v in self.stages.items()},
+            **self.counts,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[TurnTrace]] = contextvars.ContextVar("polibot_trace", default=None)
+
+
+@contextmanager
+def trace_turn() -> Iterator[TurnTrace]:
+    """Makes a new `TurnTrace` current for the enclosed code and records its total."""
+    trace = TurnTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        METRICS.observe("polibot_turn_seconds", time.perf_counter() - trace.started)
+        METRICS.inc("polibot_turns_total")
+
+
+def current_trace() -> Optional[TurnTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times the enclosed block as stage `name` of the current turn."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        METRICS.observe("polibot_stage_seconds", elapsed, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+
+
+def count(name: str, amount: float = 1, **labels: str) -> None:
+    """Increments counter `polibot_<name>_total` and the current turn's `name`."""
+    METRICS.inc(f"polibot_{name}_total", amount, **labels)
+    trace = _current_trace.get()
+    if trace is not None and not labels:
+        trace.counts[name] = trace.counts.get(name, 0) + amount
+
+
+# ---------- Export ----------
+_file_lock = threading.Lock()
+_last_file_write = 0.0
+
+
+def write_metrics_file(path: Optional[str] = METRICS_FILE, min_interval: float = METRICS_FILE_INTERVAL) -> bool:
+    """
+    Writes the Prometheus text to `path` atomically, at most every `min_interval` seconds.
+
+    Returns:
+        bool: True if the file was written.
+    """
+    global _last_file_write
+    if not path:
+        return False
+    with _file_lock:
+        now = time.monotonic()
+        if now - _last_file_write < min_interval:
+            return False
+        _last_file_write = now
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(METRICS.render_prometheus())
+    os.replace(tmp_path, path)
+    return True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serves `/metrics` on a daemon thread; later calls return the running server."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as exc:  # e.g. another process already serves this port
+                logger.warning("metrics server not started on port %d: %s", port, exc)
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_pdf(path, pages):
+    """Writes a small text PDF with one string per page."""
+    import fitz
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+POLICY_PAGES = [
+    "HR Policies\nPolicy Version: 2.3\nEffective Date: 1st January 2025",
+    "Leave Policy\nEvery employee gets 7 Casual Leave [CL] & 7 Sick Leave [SL] in a year.\n"
+    "Leaves must be applied for in the HR portal before they are taken.",
+    "Work Hour Policy\nOffice Hours: 9:30 AM to 6:30 PM\nLunch Break time: 45 minutes",
+]
+
+
+@pytest.fixture
+def fake_embeddings():
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    return DeterministicFakeEmbedding(size=16)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A `data/` directory with one policy PDF in the default set."""
+    root = tmp_path / "data"
+    write_pdf(str(root / "policy.pdf"), POLICY_PAGES)
+    return str(root)
@@ -0,0 +1,101 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import api_server
+
+
+class FakeChain:
+    def __init__(self, policy_sets=None):
+        self.policy_sets = policy_sets
+        self.questions = []
+
+    def invoke(self, inputs):
+        self.questions.append(inputs["question"])
+        return {"result": f"answer {len(self.questions)}", "source_documents": []}
+
+    def stream_answer(self, question):
+        return BrokenStream()
+
+
+class BrokenStream:
+    """Streams one token, then the LLM call fails."""
+
+    response = None
+
+    def __iter__(self):
+        yield "Every"
+        raise RuntimeError("connection to the LLM dropped")
+
+
+def _run(monkeypatch, scenario, **app_kwargs):
+    monkeypatch.setattr(api_server, "is_ready", lambda: True)
+    monkeypatch.setattr(api_server, "get_shared_engine", lambda: None)
+    monkeypatch.setattr(api_server, "get_or_create_qa_chain", FakeChain)
+
+    async def main():
+        client = TestClient(TestServer(api_server.create_app(**{"max_concurrency": 1, **app_kwargs})))
+        await client.start_server()
+        try:
+            await scenario(client)
+        finally:
+            await client.close()
+
+    asyncio.run(main())
+
+
+def test_non_object_body_is_bad_request(monkeypatch):
+    async def scenario(client):
+        for body in (["question"], "question", 42):
+            for path in ("/v1/chat", "/v1/chat/stream", "/v1/sessions"):
+                resp = await client.post(path, json=body)
+                assert resp.status == 400, (path, body)
+
+    _run(monkeypatch, scenario)
+
+
+def test_unknown_session_is_not_found(monkeypatch):
+    async def scenario(client):
+        for path in ("/v1/chat", "/v1/chat/stream"):
+            resp = await client.post(path, json={"question": "how many leaves?", "session_id": "gone"})
+            assert resp.status == 404
+        assert len(client.app["sessions"]) == 0
+
+    _run(monkeypatch, scenario)
+
+
+def test_session_is_created_only_without_id(monkeypatch):
+    async def scenario(client):
+        resp = await client.post("/v1/chat", json={"question": "how many leaves?"})
+        assert resp.status == 200
+        session_id = (await resp.json())["session_id"]
+
+        resp = await client.post("/v1/chat", json={"question": "and trainees?", "session_id": session_id})
+        assert resp.status == 200
+        data = await resp.json()
+        assert data["session_id"] == session_id
+        assert data["answer"] == "answer 2"
+        assert len(client.app["sessions"]) == 1
+
+    _run(monkeypatch, scenario)
+
+
+def test_rejected_turn_does_not_create_a_session(monkeypatch):
+    async def scenario(client):
+        for path in ("/v1/chat", "/v1/chat/stream"):
+            resp = await client.post(path, json={"question": "how many leaves?"})
+            assert resp.status == 503
+        assert len(client.app["sessions"]) == 0
+
+    _run(monkeypatch, scenario, max_pending=0)
+
+
+def test_stream_reports_a_failed_answer(monkeypatch):
+    async def scenario(client):
+        resp = await client.post("/v1/chat/stream", json={"question": "how many leaves?"})
+        assert resp.status == 200
+        body = await resp.text()
+        assert "event: token" in body and "event: error" in body
+        assert "event: done" not in body
+
+    _run(monkeypatch, scenario)
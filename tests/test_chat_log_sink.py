@@ -0,0 +1,21 @@
+import json
+
+from chat_log_sink import JsonlFileSink, iter_chat_sessions
+
+
+def test_replay_skips_records_without_a_session(tmp_path):
+    log_dir = str(tmp_path / "chat_logs")
+    sink = JsonlFileSink(log_dir)
+    sink.append("u1", "s1", [{"role": "user", "content": "How many leaves?"}], 0)
+    sink.close()
+    with open(next((tmp_path / "chat_logs").glob("*.jsonl")), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"user_id": "u1", "messages": []}) + "\n")  # valid JSON, no session_id
+        f.write(json.dumps(["not", "a", "record"]) + "\n")
+        f.write(json.dumps({"session_id": "s2", "messages": "oops"}) + "\n")
+        f.write(json.dumps({"user_id": "u1", "session_id": "s1", "start_index": 1,
+                            "messages": [{"role": "assistant", "content": "7 casual leaves."}]}) + "\n")
+        f.write('{"session_id": "s3", "mess')  # torn last line
+
+    sessions = list(iter_chat_sessions(log_dir))
+    assert [s["session_id"] for s in sessions] == ["s1"]
+    assert [m["content"] for m in sessions[0]["messages"]] == ["How many leaves?", "7 casual leaves."]
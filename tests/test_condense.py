@@ -0,0 +1,40 @@
+import pytest
+
+from condense import classify_question
+
+
+@pytest.mark.parametrize("question", [
+    "Is there a dress code?",
+    "Can I take one day off without approval?",
+    "What is the notice period for this company?",
+    "Is it mandatory to inform HR before taking leave?",
+    "Is it true that trainees get a stipend?",
+    "How long does it take to get reimbursed?",
+    "How many sick leaves do trainees get?",
+    "Does the policy say that trainees get a stipend?",
+    "Which leaves such as sick leave need a certificate?",
+    "How many leaves can I take this year?",
+])
+def test_standalone_questions_skip_rephrasing(question):
+    assert classify_question(question) == (False, "standalone")
+
+
+@pytest.mark.parametrize("question, reason", [
+    ("Can I carry it forward to next year?", "refers_to_it"),
+    ("Can I encash it at the end of the year?", "refers_to_it"),
+    ("What does that mean for trainees?", "refers_to_that"),
+    ("Does this apply to interns as well?", "refers_to_this"),
+    ("Do they get the same number of leaves?", "refers_to_same"),
+    ("Are those leaves paid for interns?", "refers_to_those"),
+    ("Which policy covers that situation?", "refers_to_that"),
+    ("Can I carry forward that leave to next year?", "refers_to_that"),
+    ("Is this leave paid for trainees?", "refers_to_this"),
+    ("How many days of that leave can I take?", "refers_to_that"),
+    ("Who approves such requests?", "refers_to_such"),
+    ("Is it mandatory to apply for it in advance?", "refers_to_it"),
+    ("Is that the latest version of the rule?", "refers_to_that"),
+    ("What about trainees?", "follow_up_opener"),
+    ("Is it paid?", "too_short"),
+])
+def test_follow_ups_are_rephrased(question, reason):
+    assert classify_question(question) == (True, reason)
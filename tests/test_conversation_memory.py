@@ -0,0 +1,88 @@
+import threading
+
+from conversation_memory import BoundedSummaryMemory
+
+
+class BlockingLLM:
+    """Summary model whose calls wait until `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def invoke(self, prompt):
+        self.calls.append(prompt)
+        assert self.release.wait(5)
+        return f"summary {len(self.calls)}"
+
+
+def make_memory(llm):
+    return BoundedSummaryMemory(
+        llm=llm, memory_key="chat_history", return_messages=True, output_key="result", max_window_tokens=20
+    )
+
+
+def turn(memory, n):
+    memory.save_context({"question": f"question number {n} " * 3}, {"result": f"answer number {n} " * 3})
+
+
+def test_summary_runs_off_the_turn_path():
+    llm = BlockingLLM()
+    memory = make_memory(llm)
+    turn(memory, 1)
+    turn(memory, 2)  # evicts turn 1 while the summary model is blocked
+
+    history = memory.load_memory_variables({})["chat_history"]
+    assert "question number 1" in history[0].content  # evicted turn kept verbatim until summarized
+    assert memory.summary == ""
+
+    llm.release.set()
+    memory.wait(5)
+    history = memory.load_memory_variables({})["chat_history"]
+    assert memory.summary == "summary 1"
+    assert history[0].content == "Summary of earlier conversation: summary 1"
+    assert all("question number 1" not in m.content for m in history)
+
+
+def test_failed_summary_keeps_history_bounded():
+    class FailingLLM:
+        def invoke(self, prompt):
+            raise RuntimeError("rate limited")
+
+    memory = make_memory(FailingLLM())
+    for n in range(10):
+        turn(memory, n)
+    memory.wait(5)
+    assert len(memory.summary) <= memory.max_summary_tokens * 4
+    assert len(memory.load_memory_variables({})["chat_history"]) <= 3
+
+
+def test_pending_turns_are_capped_while_the_summary_is_throttled():
+    llm = BlockingLLM()
+    memory = make_memory(llm)
+    memory.max_pending_tokens = 30
+    for n in range(20):
+        turn(memory, n)  # the summary model stays blocked the whole time
+
+    history = memory.load_memory_variables({})["chat_history"]
+    pending = [m for m in history[1:] if m not in memory.chat_memory.messages]
+    assert sum(len(m.content) for m in pending) <= 2 * memory.max_pending_tokens * 4
+    summary = memory.summary  # folded as text while the summary model is blocked
+    assert len(summary) <= memory.max_summary_tokens * 4
+    assert "number 2 " not in summary and "number 17" in summary  # the oldest text is dropped first
+    llm.release.set()
+    memory.wait(5)
+
+
+def test_failed_summary_keeps_the_newest_lines():
+    class FailingLLM:
+        def invoke(self, prompt):
+            raise RuntimeError("rate limited")
+
+    memory = make_memory(FailingLLM())
+    memory.max_summary_tokens = 20
+    for n in range(10):
+        turn(memory, n)
+        memory.wait(5)
+    assert memory.summary.startswith("...")
+    assert "number 8" in memory.summary
@@ -0,0 +1,25 @@
+import os
+
+import fitz
+
+from eval_retrieval import GOLDEN_PATH, load_golden, score_ranking
+from index_builder import list_policy_pdfs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_golden_set_points_at_pages_of_the_shipped_pdf():
+    golden = load_golden(os.path.join(ROOT, GOLDEN_PATH))
+    assert len(golden) >= 20
+    (pdf,) = list_policy_pdfs(os.path.join(ROOT, "data"))
+    with fitz.open(pdf) as doc:
+        pages = doc.page_count
+    assert all(1 <= page <= pages for item in golden for page in item["pages"])
+
+
+def test_score_ranking_counts_expected_pages():
+    labels = [("a.pdf", 1), ("a.pdf", 2), ("a.pdf", 3)]
+    item = {"pages": {2, 3}, "source": None}
+    scores = score_ranking([0, 1, 2], labels, item, [1, 2, 3])
+    assert scores["hit@1"] == 0.0 and scores["recall@2"] == 0.5 and scores["recall@3"] == 1.0
+    assert scores["rr"] == 0.5
@@ -0,0 +1,75 @@
+import pytest
+
+from firestore_writer import MAX_WRITES_PER_BATCH, FirestoreChatWriter, InMemoryFirestore, _MemoryBatch
+
+
+class RecordingBatch(_MemoryBatch):
+    def __init__(self, store, committed):
+        super().__init__(store)
+        self._committed = committed
+
+    def commit(self):
+        self._committed.append(len(self._ops))
+        super().commit()
+
+
+class RecordingFirestore(InMemoryFirestore):
+    """In-memory client that records the number of ops of every committed batch."""
+
+    def __init__(self):
+        super().__init__()
+        self.committed = []
+
+    def batch(self):
+        return RecordingBatch(self.documents, self.committed)
+
+
+def messages(n, start=0):
+    return [{"role": "user", "content": f"message {i}"} for i in range(start, start + n)]
+
+
+@pytest.fixture
+def db():
+    return RecordingFirestore()
+
+
+def make_writer(db):
+    return FirestoreChatWriter(db, flush_interval=0.2, timestamp_value="ts")
+
+
+def test_batches_stay_within_the_write_limit(db):
+    writer = make_writer(db)
+    # 3 appends of 200 messages: the third does not fit with the first two
+    for session in range(3):
+        assert writer.append("u", f"s{session}", messages(200), 0)
+    assert writer.flush(timeout=10)
+    writer.close()
+
+    assert db.committed and max(db.committed) <= MAX_WRITES_PER_BATCH
+    assert writer.written == 600
+    assert writer.failed == 0
+    for session in range(3):
+        assert len(db.collection("chat_logs").document(f"u_s{session}").collection("messages").list()) == 200
+
+
+def test_oversized_append_is_split(db):
+    writer = make_writer(db)
+    assert writer.append("u", "s", messages(1200), 0)
+    assert writer.flush(timeout=10)
+    writer.close()
+
+    assert max(db.committed) <= MAX_WRITES_PER_BATCH
+    stored = db.collection("chat_logs").document("u_s").collection("messages").list()
+    assert [m["index"] for m in stored] == list(range(1200))
+    assert db.collection("chat_logs").document("u_s").get()["message_count"] == 1200
+
+
+def test_small_appends_share_a_batch(db):
+    writer = make_writer(db)
+    for turn in range(5):
+        writer.append("u", "s", messages(2, start=2 * turn), 2 * turn)
+    assert writer.flush(timeout=10)
+    writer.close()
+
+    assert sum(db.committed) == 10 + len(db.committed)  # messages + one session doc per batch
+    assert db.collection("chat_logs").document("u_s").get()["message_count"] == 10
@@ -0,0 +1,119 @@
+import time
+import uuid
+import threading
+
+from langchain_core.messages import HumanMessage
+
+import llm_dispatch
+from hedging import HedgedChatModel, ModelHealth, get_health
+from llm_dispatch import DispatchedChatModel, get_scheduler
+from mock_llm import MockChatModel
+
+
+def unique(name):
+    # Health records and schedulers are per model name and process-wide
+    return f"{name}-{uuid.uuid4().hex[:6]}"
+
+
+def mock(name, latency):
+    return MockChatModel(model_name=unique(name), first_token_latency=latency, tokens_per_second=0, answer_tokens=3)
+
+
+def ask(model, text="hello"):
+    return model.invoke([HumanMessage(content=f"{text} {uuid.uuid4().hex}")])
+
+
+def test_breaker_opens_after_consecutive_failures():
+    health = ModelHealth("m", failure_threshold=3, reset_after=60)
+    for _ in range(2):
+        health.record_failure()
+    assert health.state == "closed" and health.allow()
+    health.record_failure()
+    assert health.state == "open"
+    assert not health.allow()
+
+
+def test_breaker_half_open_trial_closes_or_reopens():
+    health = ModelHealth("m", failure_threshold=1, reset_after=0.05)
+    health.record_failure()
+    assert not health.allow()
+    time.sleep(0.06)
+    assert health.allow() and health.state == "half_open"
+    assert not health.allow()  # one trial per reset period
+    health.record_failure()
+    assert health.state == "open"
+
+    time.sleep(0.06)
+    assert health.allow()
+    health.record_success(0.1)
+    assert health.state == "closed" and health.failures == 0
+
+
+def test_fallback_wins_against_a_slow_primary():
+    primary, fallback = mock("primary", 1.0), mock("fallback", 0.0)
+    model = HedgedChatModel(primary=primary, fallback=fallback, hedge_after=0.1)
+    started = time.perf_counter()
+    ask(model)
+    assert time.perf_counter() - started < 0.8
+    assert fallback._started_calls == 1
+    assert get_health(primary.model_name).failures == 1  # missed the deadline and lost
+    assert get_health(fallback.model_name).state == "closed"
+
+
+def test_fast_primary_is_not_hedged():
+    primary, fallback = mock("primary", 0.0), mock("fallback", 0.0)
+    ask(HedgedChatModel(primary=primary, fallback=fallback, hedge_after=0.3))
+    assert fallback._started_calls == 0
+
+
+def test_open_primary_goes_straight_to_the_fallback():
+    primary, fallback = mock("primary", 0.0), mock("fallback", 0.0)
+    health = get_health(primary.model_name)
+    for _ in range(health.failure_threshold):
+        health.record_failure()
+    ask(HedgedChatModel(primary=primary, fallback=fallback, hedge_after=0.3))
+    assert primary._started_calls == 0 and fallback._started_calls == 1
+
+
+def test_queue_wait_does_not_count_towards_the_hedge_deadline(monkeypatch):
+    inner, fallback = mock("primary", 0.05), mock("fallback", 0.0)
+    primary = DispatchedChatModel(inner=inner, streaming=True)
+    scheduler = get_scheduler(inner.model_name)
+    acquire = scheduler.acquire
+
+    def slow_acquire(*args, **kwargs):
+        time.sleep(0.4)  # waiting for TPM budget
+        return acquire(*args, **kwargs)
+
+    monkeypatch.setattr(scheduler, "acquire", slow_acquire)
+    ask(HedgedChatModel(primary=primary, fallback=fallback, hedge_after=0.2))
+    assert inner._started_calls == 1
+    assert fallback._started_calls == 0
+
+
+def test_cancelled_hedge_loser_still_serves_coalesced_callers():
+    inner = MockChatModel(model_name=unique("primary"), first_token_latency=0.4, tokens_per_second=50, answer_tokens=5)
+    primary = DispatchedChatModel(inner=inner, streaming=True)
+    hedged = HedgedChatModel(primary=primary, fallback=mock("fallback", 0.0), hedge_after=0.1)
+    messages = [HumanMessage(content=f"shared question {uuid.uuid4().hex}")]
+    results = {}
+
+    def run(name, model):
+        try:
+            results[name] = model.invoke(messages).content
+        except Exception as exc:
+            results[name] = exc
+
+    leader = threading.Thread(target=run, args=("hedged", hedged))
+    leader.start()
+    time.sleep(0.05)  # the hedged primary call leads; this session joins it
+    follower = threading.Thread(target=run, args=("other", primary))
+    follower.start()
+    leader.join(5)
+    follower.join(5)
+
+    assert isinstance(results["hedged"], str)  # served by the fallback
+    assert isinstance(results["other"], str), results["other"]
+    assert len(results["other"].split()) == 5
+    assert inner._started_calls == 1
+    assert not llm_dispatch._flights
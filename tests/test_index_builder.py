@@ -0,0 +1,119 @@
+import json
+import os
+
+from chunk_store import CHUNK_STORE_NAME, ChunkStore, ChunkStoreRetriever, read_faiss_index
+from conftest import POLICY_PAGES, write_pdf
+from index_builder import MANIFEST_NAME, build_or_update_index
+from index_versions import resolve_index_dir
+from onnx_embeddings import document_embedding_info
+
+
+def build(data_dir, index_dir, embeddings, backend):
+    return build_or_update_index(
+        data_dir, index_dir, embeddings, embedding_model="fake", embedding_backend=backend, workers=1
+    )[1]
+
+
+def test_int8_only_embeds_queries():
+    assert document_embedding_info("onnx-int8") == {"backend": "onnx", "quantization": "fp32"}
+    assert document_embedding_info("torch") == {"backend": "torch", "quantization": "fp32"}
+
+
+def test_manifest_records_the_embedding_backend(tmp_path, data_dir, fake_embeddings):
+    index_dir = str(tmp_path / "index")
+    build(data_dir, index_dir, fake_embeddings, "onnx-int8")
+    with open(os.path.join(resolve_index_dir(index_dir)[1], MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    assert manifest["embedding_backend"] == "onnx"
+    assert manifest["embedding_quantization"] == "fp32"
+
+
+def test_changing_the_backend_rebuilds_the_index(tmp_path, data_dir, fake_embeddings):
+    index_dir = str(tmp_path / "index")
+    first = build(data_dir, index_dir, fake_embeddings, "onnx")
+    # Same document vectors: the index is reused
+    assert build(data_dir, index_dir, fake_embeddings, "onnx-int8")["changed_docs"] == 0
+    rebuilt = build(data_dir, index_dir, fake_embeddings, "torch")
+    assert rebuilt["changed_docs"] == 1 and rebuilt["added"] == first["added"]
+
+
+def stored_chunks(index_dir):
+    store = ChunkStore(os.path.join(resolve_index_dir(index_dir)[1], CHUNK_STORE_NAME))
+    try:
+        return [doc for _, _, doc in store.iter_all()]
+    finally:
+        store.close()
+
+
+def test_cover_page_change_refreshes_metadata_of_unchanged_chunks(tmp_path, fake_embeddings):
+    data_dir, index_dir = str(tmp_path / "data"), str(tmp_path / "index")
+    write_pdf(os.path.join(data_dir, "policy.pdf"), POLICY_PAGES)
+    build(data_dir, index_dir, fake_embeddings, "torch")
+
+    write_pdf(os.path.join(data_dir, "policy.pdf"), [POLICY_PAGES[0].replace("2.3", "2.4")] + POLICY_PAGES[1:])
+    report = build(data_dir, index_dir, fake_embeddings, "torch")
+
+    assert report["changed_docs"] == 1 and report["refreshed"] > 0
+    leave = [doc for doc in stored_chunks(index_dir) if "Casual Leave" in doc.page_content]
+    assert leave and all(doc.metadata["policy_version"] == "2.4" for doc in leave)
+
+
+HANDBOOK_PAGES = [
+    "Employee Handbook\nPolicy Version: 1.0\nEffective Date: 1st April 2025",
+    "Travel Policy\nTravel expenses are reimbursed within 15 days of submitting bills.",
+]
+
+
+def chunk_texts(index_dir):
+    return sorted(doc.page_content for doc in stored_chunks(index_dir))
+
+
+def test_incremental_build_adds_changes_and_removes_pdfs(tmp_path, fake_embeddings):
+    data_dir, index_dir = str(tmp_path / "data"), str(tmp_path / "index")
+    write_pdf(os.path.join(data_dir, "policy.pdf"), POLICY_PAGES)
+    first = build(data_dir, index_dir, fake_embeddings, "torch")
+    assert first["changed_docs"] == 1 and first["added"] > 0 and first["deleted"] == 0
+    base = chunk_texts(index_dir)
+
+    # Nothing changed: no embedding and no new version
+    again = build(data_dir, index_dir, fake_embeddings, "torch")
+    assert again["added"] == again["deleted"] == again["changed_docs"] == 0
+    assert again["index_version"] == first["index_version"]
+
+    # A new PDF only embeds its own chunks
+    write_pdf(os.path.join(data_dir, "handbook.pdf"), HANDBOOK_PAGES)
+    added = build(data_dir, index_dir, fake_embeddings, "torch")
+    assert added["unchanged_docs"] == 1 and added["changed_docs"] == 1
+    assert added["added"] == len(chunk_texts(index_dir)) - len(base) and added["deleted"] == 0
+
+    # Changing one page re-embeds only that page's chunk and drops the old one
+    changed_pages = HANDBOOK_PAGES[:1] + [HANDBOOK_PAGES[1].replace("15 days", "30 days")]
+    write_pdf(os.path.join(data_dir, "handbook.pdf"), changed_pages)
+    changed = build(data_dir, index_dir, fake_embeddings, "torch")
+    assert changed["added"] == 1 and changed["deleted"] == 1 and changed["refreshed"] == 1
+    texts = chunk_texts(index_dir)
+    assert any("30 days" in text for text in texts) and not any("15 days" in text for text in texts)
+
+    # Removing a PDF deletes all of its chunks
+    os.remove(os.path.join(data_dir, "handbook.pdf"))
+    removed = build(data_dir, index_dir, fake_embeddings, "torch")
+    assert removed["removed_docs"] == 1 and removed["deleted"] == 2 and removed["added"] == 0
+    assert chunk_texts(index_dir) == base
+
+
+def test_rebuilt_index_searches_the_new_chunks(tmp_path, fake_embeddings):
+    data_dir, index_dir = str(tmp_path / "data"), str(tmp_path / "index")
+    write_pdf(os.path.join(data_dir, "policy.pdf"), POLICY_PAGES)
+    build(data_dir, index_dir, fake_embeddings, "torch")
+    write_pdf(os.path.join(data_dir, "handbook.pdf"), HANDBOOK_PAGES)
+    build(data_dir, index_dir, fake_embeddings, "torch")
+
+    path = resolve_index_dir(index_dir)[1]
+    store = ChunkStore(os.path.join(path, CHUNK_STORE_NAME))
+    try:
+        retriever = ChunkStoreRetriever(index=read_faiss_index(path), store=store, embeddings=fake_embeddings, k=1)
+        # DeterministicFakeEmbedding maps equal texts to equal vectors
+        travel = next(text for text in chunk_texts(index_dir) if "Travel" in text)
+        assert retriever.invoke(travel)[0].page_content == travel
+    finally:
+        store.close()
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+
+from index_builder import LEGACY_FILES, MANIFEST_NAME, build_or_update_index
+from index_versions import (
+    CURRENT_NAME, IndexWatcher, VersionedRetriever, build_lock, current_version, list_versions, new_version_dir,
+    prune_versions, publish_version, resolve_index_dir,
+)
+
+
+class StaticRetriever(BaseRetriever):
+    text: str
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return [Document(page_content=self.text)]
+
+
+def publish(index_dir, keep=3, legacy_files=()):
+    version, path = new_version_dir(str(index_dir))
+    publish_version(str(index_dir), version, keep=keep, legacy_files=legacy_files)
+    return version
+
+
+def test_publish_points_current_and_prunes_old_versions(tmp_path):
+    versions = [publish(tmp_path, keep=2) for _ in range(4)]
+    assert current_version(str(tmp_path)) == versions[-1]
+    assert list_versions(str(tmp_path)) == versions[-2:]
+    assert resolve_index_dir(str(tmp_path)) == (versions[-1], os.path.join(str(tmp_path), "versions", versions[-1]))
+
+
+def test_prune_never_removes_the_live_version(tmp_path):
+    versions = [publish(tmp_path) for _ in range(3)]
+    with open(tmp_path / CURRENT_NAME, "w") as f:
+        f.write(versions[0])
+    prune_versions(str(tmp_path), keep=1)
+    assert list_versions(str(tmp_path)) == [versions[0], versions[2]]
+
+
+def test_legacy_files_are_pruned_like_the_oldest_version(tmp_path):
+    (tmp_path / MANIFEST_NAME).write_text("{}")
+    publish(tmp_path, keep=2, legacy_files=LEGACY_FILES)
+    assert (tmp_path / MANIFEST_NAME).exists()  # a lagging worker may still serve them
+    publish(tmp_path, keep=2, legacy_files=LEGACY_FILES)
+    assert not (tmp_path / MANIFEST_NAME).exists()
+
+
+def test_build_lock_is_exclusive(tmp_path):
+    events = []
+
+    def hold(name):
+        with build_lock(str(tmp_path)):
+            events.append(f"{name}-in")
+            time.sleep(0.1)
+            events.append(f"{name}-out")
+
+    threads = [threading.Thread(target=hold, args=(name,)) for name in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert events[0][0] == events[1][0] and events[2][0] == events[3][0]
+
+
+def test_versioned_retriever_swaps_between_queries():
+    retriever = VersionedRetriever(active=(StaticRetriever(text="old"), "v1"))
+    assert [(d.page_content, d.metadata["index_version"]) for d in retriever.invoke("q")] == [("old", "v1")]
+    retriever.swap(StaticRetriever(text="new"), "v2")
+    assert retriever.version == "v2"
+    assert [(d.page_content, d.metadata["index_version"]) for d in retriever.invoke("q")] == [("new", "v2")]
+
+
+def test_watcher_loads_each_new_version_once(tmp_path):
+    loaded = []
+    first = publish(tmp_path)
+    watcher = IndexWatcher(str(tmp_path), first, lambda version, path: loaded.append(version))
+    assert not watcher.check()
+    second = publish(tmp_path)
+    assert watcher.check() and not watcher.check()
+    assert loaded == [second]
+
+
+def test_watcher_retries_a_failed_load(tmp_path):
+    attempts = []
+
+    def on_change(version, path):
+        attempts.append(version)
+        if len(attempts) == 1:
+            raise OSError("not readable yet")
+
+    watcher = IndexWatcher(str(tmp_path), publish(tmp_path), on_change)
+    publish(tmp_path)
+    assert not watcher.check()
+    assert watcher.check()
+    assert len(attempts) == 2
+
+
+def test_concurrent_builders_publish_once(tmp_path, data_dir, fake_embeddings):
+    index_dir = str(tmp_path / "index")
+    reports = []
+
+    def build():
+        reports.append(build_or_update_index(data_dir, index_dir, fake_embeddings, embedding_model="fake", workers=1)[1])
+
+    threads = [threading.Thread(target=build) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(list_versions(index_dir)) == 1
+    assert sorted(report["changed_docs"] for report in reports) == [0, 0, 1]
+    assert {report["index_version"] for report in reports} == {current_version(index_dir)}
@@ -0,0 +1,82 @@
+import math
+
+from langchain.schema import Document
+
+from lexical_index import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+CHUNKS = [
+    (0, "Casual leave CL can be taken for planned short events."),
+    (1, "Sick leave SL needs a medical certificate after two days."),
+    (2, "Leave without pay LWP applies when all leaves are used."),
+    (5, "Comp-off is given for working on a festival holiday."),  # positions need not be contiguous
+]
+
+
+def test_tokenize_drops_stopwords_and_splits_hyphens():
+    assert tokenize("What is the Comp-off rule?") == ["comp-off", "comp", "off", "rule"]
+
+
+def test_bm25_ranks_exact_terms_first():
+    index = BM25Index.from_chunks(CHUNKS)
+    assert [pos for pos, _ in index.search("LWP", 3)] == [2]
+    assert index.search("comp off", 3)[0][0] == 5
+    assert [pos for pos, _ in index.search("sick leave certificate", 2)][0] == 1
+    assert index.search("what is the", 3) == []  # only stopwords
+
+
+def test_bm25_scores_match_the_okapi_formula():
+    index = BM25Index.from_chunks([(0, "leave leave policy"), (1, "policy")], k1=1.5, b=0.75)
+    n_docs, df, tf, doc_len, avg_len = 2, 1, 2, 3, 2.0
+    idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+    expected = idf * tf * 2.5 / (tf + 1.5 * (1 - 0.75 + 0.75 * doc_len / avg_len))
+    ((pos, score),) = index.search("leave", 5)
+    assert pos == 0 and math.isclose(score, expected, rel_tol=1e-5)
+
+
+def test_bm25_search_returns_at_most_k():
+    index = BM25Index.from_chunks(CHUNKS)
+    hits = index.search("leave", 2)
+    assert len(hits) == 2 and hits[0][1] >= hits[1][1]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]], rrf_k=60)
+    assert fused[:2] == [1, 3]  # in both lists
+    assert set(fused) == {1, 2, 3, 4}
+    assert reciprocal_rank_fusion([[7, 8]]) == [7, 8]
+
+
+class StubVectorRetriever:
+    """Vector side of the hybrid retriever with a fixed ranking."""
+
+    partitions = {}
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+        self.embeddings = self
+        self.store = self
+
+    def embed_query(self, text):
+        return [0.0]
+
+    def select_partitions(self, policy_sets):
+        return None
+
+    def search_positions(self, vector, k, policy_sets=None):
+        return self.ranking[:k]
+
+    def get(self, positions):
+        return [Document(page_content=str(pos)) for pos in positions]
+
+
+def test_hybrid_retriever_fuses_vector_and_bm25_hits():
+    retriever = HybridRetriever(
+        vector_retriever=StubVectorRetriever([5, 1, 0]), lexical_index=BM25Index.from_chunks(CHUNKS), k=2
+    )
+    # Chunks both sides rank beat the vector side's top hit
+    docs = retriever.invoke("sick leave SL")
+    assert [doc.page_content for doc in docs] == ["1", "0"]
+
+    # The vector side misses the chunk with the exact term; BM25 brings it in
+    docs = retriever.invoke("LWP")
+    assert "2" in [doc.page_content for doc in docs]
@@ -0,0 +1,109 @@
+import time
+import uuid
+import threading
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from llm_dispatch import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, DispatchedChatModel, LLMQueueTimeout, TokenBucketScheduler,
+)
+from mock_llm import MockChatModel
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def start_waiters(scheduler, waiters, order):
+    """Queues `(name, priority)` waiters one after another on a busy scheduler."""
+    threads = []
+    for name, priority in waiters:
+        def run(name=name, priority=priority):
+            reserved = scheduler.acquire(1, priority)
+            order.append(name)
+            scheduler.release(reserved, 1)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: scheduler.stats()["waiting"] == len(threads))
+    return threads
+
+
+def test_interactive_calls_are_served_before_background_ones():
+    scheduler = TokenBucketScheduler(tokens_per_minute=0, max_concurrency=1)
+    held = scheduler.acquire(1)
+    order = []
+    threads = start_waiters(scheduler, [
+        ("summary-1", PRIORITY_BACKGROUND),
+        ("turn-1", PRIORITY_INTERACTIVE),
+        ("summary-2", PRIORITY_BACKGROUND),
+        ("turn-2", PRIORITY_INTERACTIVE),
+    ], order)
+    scheduler.release(held, 1)
+    for thread in threads:
+        thread.join(2)
+    # By priority, then first come, first served
+    assert order == ["turn-1", "turn-2", "summary-1", "summary-2"]
+
+
+def test_calls_wait_for_token_budget():
+    scheduler = TokenBucketScheduler(tokens_per_minute=600, max_concurrency=4)  # 10 tokens per second
+    scheduler.acquire(600)
+    started = time.monotonic()
+    scheduler.acquire(3)
+    assert time.monotonic() - started >= 0.2
+    with pytest.raises(LLMQueueTimeout):
+        scheduler.acquire(600, timeout=0.05)
+
+
+def mock(latency=0.2):
+    return MockChatModel(
+        model_name=f"dispatch-{uuid.uuid4().hex[:6]}", first_token_latency=latency, tokens_per_second=0, answer_tokens=4
+    )
+
+
+def invoke_concurrently(model, prompts):
+    results = [None] * len(prompts)
+
+    def run(i):
+        results[i] = model.invoke([HumanMessage(content=prompts[i])]).content
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(prompts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_identical_calls_in_flight_are_coalesced():
+    inner = mock()
+    prompt = f"how many casual leaves {uuid.uuid4().hex}"
+    results = invoke_concurrently(DispatchedChatModel(inner=inner, streaming=True), [prompt] * 4)
+    assert inner._started_calls == 1
+    assert len(set(results)) == 1 and results[0]
+
+
+def test_different_or_uncoalesced_calls_are_sent_separately():
+    inner = mock()
+    invoke_concurrently(DispatchedChatModel(inner=inner), [f"question {i} {uuid.uuid4().hex}" for i in range(3)])
+    assert inner._started_calls == 3
+
+    inner = mock()
+    prompt = f"same question {uuid.uuid4().hex}"
+    invoke_concurrently(DispatchedChatModel(inner=inner, coalesce=False), [prompt] * 3)
+    assert inner._started_calls == 3
+
+
+def test_finished_calls_are_not_shared():
+    inner = mock(latency=0.0)
+    model = DispatchedChatModel(inner=inner)
+    prompt = [HumanMessage(content=f"question {uuid.uuid4().hex}")]
+    model.invoke(prompt)
+    model.invoke(prompt)
+    assert inner._started_calls == 2
@@ -0,0 +1,46 @@
+from langchain.schema import Document
+
+from policy_facts import FactTable, extract_facts, format_fact_answer
+
+PAGE = Document(
+    page_content=(
+        "Lunch Break time: 45 minutes (1:00 PM to 1:45 PM)\n"
+        "Food Reimbursement conditions: Employee can claim food bill worth rupees 150 to 200/- for\n"
+        "working an additional 2.5 hours. The additional hours of work\n"
+        "should be pre-approved by your Technical Project Manager.\n"
+        "\n"
+        "Every employee gets 7 Casual Leave [CL] & 7 Sick Leave [SL] in a year.\n"
+    ),
+    metadata={"source": "data/policy.pdf", "page": 6, "policy_set": "default"},
+)
+
+
+def table():
+    return FactTable(extract_facts([PAGE]))
+
+
+def test_fact_answer_keeps_the_conditions_of_its_item():
+    fact = table().match("food reimbursement")
+    answer = format_fact_answer(fact)
+    assert "150 to 200" in answer
+    assert "pre-approved by your Technical Project Manager" in answer
+    assert "refer to page 6" in answer
+
+
+def test_questions_about_conditions_go_to_retrieval():
+    facts = table()
+    assert facts.match("food reimbursement conditions") is None
+    assert facts.match("who is eligible for casual leave") is None
+    assert facts.match("lunch break rules") is None
+
+
+def test_plain_lookups_are_answered():
+    facts = table()
+    assert facts.match("how long is the lunch break time")["value"].startswith("45 minutes")
+    assert facts.match("how many CL do I get")["value"] == "7"
+
+
+def test_lookups_are_limited_to_policy_sets():
+    facts = table()
+    assert facts.match("how many casual leaves", ["trainees"]) is None
+    assert facts.match("how many casual leaves", ["default"]) is not None
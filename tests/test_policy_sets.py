@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+from answer_cache import SemanticAnswerCache, corpus_fingerprint
+from chunk_store import (
+    CHUNK_STORE_NAME, PARTITIONS_DIR, ChunkStore, ChunkStoreRetriever, open_partitions, read_faiss_index,
+)
+from conftest import write_pdf
+from index_builder import build_or_update_index
+from index_versions import resolve_index_dir
+from lexical_index import BM25Index, HybridRetriever
+from policy_handler import describe_policy, policy_set_for
+
+TRAINEE_PAGES = [
+    "Trainee Handbook\nPolicy Version: 1.0\nEffective Date: 1st April 2025",
+    "Trainee Leave Policy\nTrainees get 1 Casual Leave per month during the training period.\n"
+    "Stipend is paid on the 5th of every month.",
+]
+
+
+@pytest.fixture
+def index(tmp_path, data_dir, fake_embeddings):
+    write_pdf(os.path.join(data_dir, "trainees", "handbook.pdf"), TRAINEE_PAGES)
+    index_dir = str(tmp_path / "index")
+    build_or_update_index(data_dir, index_dir, fake_embeddings, embedding_model="fake", workers=1)
+    _, path = resolve_index_dir(index_dir)
+    store = ChunkStore(os.path.join(path, CHUNK_STORE_NAME))
+    yield path, store
+    store.close()
+
+
+def vector_retriever(path, store, embeddings, partitions=None):
+    return ChunkStoreRetriever(
+        index=read_faiss_index(path), store=store, embeddings=embeddings, k=4,
+        partitions=open_partitions(path, store) if partitions is None else partitions,
+    )
+
+
+def test_policy_set_comes_from_the_subfolder():
+    assert policy_set_for(os.path.join("data", "policy.pdf"), "data") == "default"
+    assert policy_set_for(os.path.join("data", "trainees", "a.pdf"), "data") == "trainees"
+
+
+def test_cover_page_metadata():
+    assert describe_policy("Policy Version: 2.3\nEffective Date: 1st January 2025") == {
+        "policy_version": "2.3", "effective_date": "2025-01-01",
+    }
+
+
+def test_chunks_carry_metadata_and_partitions_are_written(index):
+    path, store = index
+    assert sorted(os.listdir(os.path.join(path, PARTITIONS_DIR))) == ["default.faiss", "trainees.faiss"]
+    docs = [doc for _, _, doc in store.iter_all()]
+    assert {doc.metadata["policy_set"] for doc in docs} == {"default", "trainees"}
+    trainee = next(doc for doc in docs if doc.metadata["policy_set"] == "trainees")
+    assert trainee.metadata["policy_version"] == "1.0"
+    assert trainee.metadata["effective_date"] == "2025-04-01"
+
+
+@pytest.mark.parametrize("masked", [False, True])
+def test_vector_search_is_limited_to_the_requested_sets(index, fake_embeddings, masked):
+    path, store = index
+    partitions = open_partitions(path, store)
+    if masked:  # no sub-indexes: ID-selector mask on the main index
+        partitions = {name: (None, positions) for name, (_, positions) in partitions.items()}
+    retriever = vector_retriever(path, store, fake_embeddings, partitions)
+    for wanted in (["trainees"], ["default"]):
+        docs = retriever.invoke("casual leave", policy_sets=wanted)
+        assert docs and {doc.metadata["policy_set"] for doc in docs} == set(wanted)
+
+
+def test_unknown_sets_fall_back_to_the_whole_index(index, fake_embeddings, caplog):
+    path, store = index
+    retriever = vector_retriever(path, store, fake_embeddings)
+    assert retriever.select_partitions(["nope"]) is None
+    assert retriever.select_partitions(["nope", "trainees"]) == ["trainees"]
+    assert len(retriever.invoke("casual leave", policy_sets=["nope"])) == 4
+    assert "unknown policy sets" in caplog.text
+
+
+def test_hybrid_search_fuses_partition_rankings(index, fake_embeddings):
+    path, store = index
+    vector = vector_retriever(path, store, fake_embeddings)
+    lexical_partitions = {
+        name: BM25Index.from_chunks(enumerate(text for _, text in store.iter_texts(name))) for name in vector.partitions
+    }
+    hybrid = HybridRetriever(vector_retriever=vector, lexical_partitions=lexical_partitions, k=4)
+
+    positions = hybrid.lexical_search("stipend trainees", 4, ["trainees"])
+    assert positions and {doc.metadata["policy_set"] for doc in store.get(positions)} == {"trainees"}
+    # Across sets both rankings contribute, whatever their BM25 scale
+    both = {doc.metadata["policy_set"] for doc in store.get(hybrid.lexical_search("casual leave", 4))}
+    assert both == {"default", "trainees"}
+    docs = hybrid.invoke("stipend", policy_sets=["default"])
+    assert {doc.metadata["policy_set"] for doc in docs} == {"default"}
+
+
+def test_answer_cache_is_scoped():
+    class Embeddings:
+        def embed_query(self, text):
+            return [1.0, 0.0]
+
+    cache = SemanticAnswerCache(Embeddings(), threshold=0.9)
+    cache.put("how many leaves?", "7", [], scope=("default",))
+    assert cache.lookup("how many leaves?", scope=("trainees",)) is None
+    assert cache.lookup("how many leaves?", scope=("default",))["result"] == "7"
+    assert cache.lookup("how many leaves?") is None
+
+
+def test_corpus_fingerprint_sees_pdfs_of_policy_sets(data_dir):
+    path = os.path.join(data_dir, "trainees", "handbook.pdf")
+    write_pdf(path, TRAINEE_PAGES)
+    before = corpus_fingerprint([data_dir])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))  # edited in place
+    assert corpus_fingerprint([data_dir]) != before
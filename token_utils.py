@@ -0,0 +1,11 @@
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (about 4 characters per token for English text).
+
+    Used for prompt budgeting, where a fast and stable estimate matters more
+    than an exact count and no tokenizer download is wanted.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1